@@ -1,13 +1,18 @@
 import tkinter as tk
 from tkinter import filedialog
 import sys
-import ast
 import logging, os, sys
 
 # Get the folder where your EXE (or script) lives
 exe_dir = os.path.dirname(sys.executable if getattr(sys, 'frozen', False) else __file__)
 log_path = os.path.join(exe_dir, 'app.log')
 
+# The log format is shared with the web app through the pokerlog package (pip install ./pokerlog)
+from pokerlog import binlog, tokenizer
+from pokerlog.tokenizer import tokenize_line
+from hand_index import HandIndex
+from replay_engine import STREETS, HandReplay
+
 logging.basicConfig(
     filename=log_path,
     level=logging.DEBUG,
@@ -20,7 +25,7 @@ root.withdraw()  # hide main window while file dialog is open
 
 file_path = filedialog.askopenfilename(
     title="Select game data file",
-    filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+    filetypes=[("Game files", "*.txt *.nfcb"), ("Text files", "*.txt"), ("Binary game logs", "*.nfcb"), ("All files", "*.*")]
 )
 if not file_path:
     logging.debug("No file selected. Exiting.")
@@ -30,15 +35,29 @@ if not file_path:
 root.deiconify()  # re-show main window
 # -----------------------------------------------------------------
 
-# holds the list of actions for the current hand
-current_actions = []
-# index of the next action to fire
-action_index    = 0
-
-# --- Load all lines once for initial config parse ----------------
+# the hand being replayed, with snapshots to seek in it
+replay = None
+# number of its actions shown so far
+position = 0
+# canvas item key -> value currently on screen, so only changes are redrawn
+rendered = {}
+# pending root.after() call polling the file while a live game is followed
+follow_job = None
+FOLLOW_INTERVAL_MS = 500
+
+# --- Index the file once at startup -------------------------------
+# A binary log (.nfcb, see pokerlog/binlog.py) is memory-mapped and
+# only the header and the hands that are shown get decoded. Text files are
+# indexed by byte offset and read back one hand at a time.
+game_log = None
+hand_index = None
 try:
-    with open(file_path) as f:
-        all_lines = f.readlines()
+    if file_path.lower().endswith(binlog.EXTENSION):
+        game_log = binlog.GameLog(file_path)
+        all_lines = game_log.header_lines()
+    else:
+        hand_index = HandIndex(file_path)
+        all_lines = hand_index.header_lines
 except Exception as e:
     logging.debug(f"Error loading file '{file_path}':", e)
     all_lines = []
@@ -46,175 +65,157 @@ except Exception as e:
 
 # --- Functions ----------------------------------------------------
 def show_input():
+    follow_var.set(False)
     hand_number = entry.get()
     label.config(text=f"Showing hand {hand_number}")
     process_hand_with_delay(int(hand_number))
 
 def process_hand_with_delay(hand_number):
-    global current_actions, action_index, community_index, pot
-
-    reset_display()
-    community_index = 0
-    pot             = 0
+    global replay
 
-    # use the chosen file_path here
     try:
-        with open(file_path) as f:
-            lines = f.readlines()
+        lines = load_hand_lines(hand_number)
     except FileNotFoundError:
         label.config(text=f"File not found:\n{file_path}")
         return
 
-    # Find start of hand
-    start_index = None
-    for i, line in enumerate(lines):
-        if line.strip() == f"hand:{hand_number}":
-            start_index = i
-            break
-
-    if start_index is None:
+    if lines is None:
         label.config(text=f"Hand {hand_number} not found.")
         return
 
-    # Parse stacks line for this hand
-    for i in range(start_index + 1, len(lines)):
-        line = lines[i].strip()
-        if line.startswith("Stacks:"):
-            try:
-                stack_list = ast.literal_eval(line.replace("Stacks:", "").strip())
-                for j, amount in enumerate(stack_list):
-                    player_pots[j] = amount
-                    color = "gray" if amount == 0 else "green"
-                    canvas.itemconfig(player_rectangles[j], fill=color)
-                    canvas.itemconfig(player_action_texts[j], text="" if amount == 0 else "XX-X : XX-X")
-                    canvas.itemconfig(player_pot_texts[j], text=f"${amount}" if amount else "")
-                    canvas.itemconfig(player_blind_texts[j], text="")
-                break
-            except Exception as e:
-                logging.debug("Error parsing stacks:", e)
-                break
-
-    # collect actions into our global list
-    current_actions = []
-    for i in range(start_index + 1, len(lines)):
-        line = lines[i].strip()
-        if line.startswith("hand:"):
-            break
-        current_actions.append(line)
-
-    # reset the pointer
-    action_index = 0
+    # Replayed once here; stepping and seeking then start from the nearest snapshot
+    replay = HandReplay(lines, player_pots, sb, bb)
+    update_hand_controls()
+    show_position(0)
+
+def update_hand_controls():
+    slider.config(to=len(replay))
+    for name, street_btn in street_buttons.items():
+        street_btn.config(state=tk.NORMAL if name in replay.streets else tk.DISABLED)
+
+def load_hand_lines(hand_number):
+    """The lines of a hand, from its hand:N line up to the next hand; None if there is no such hand"""
+    if game_log is not None:
+        index = game_log.find_hand(hand_number)
+        if index is None:
+            return None
+        lines = game_log.hand_lines(index)
+        if index == game_log.hand_count - 1:
+            lines += game_log.trailer_lines()  # The Winner: line
+        return lines
+
+    if hand_index is None:
+        return None
+    return hand_index.hand_lines(hand_number)
+
+def toggle_follow():
+    global follow_job
+    if follow_job is not None:
+        root.after_cancel(follow_job)
+        follow_job = None
+    if follow_var.get():
+        hand_index.update()
+        if hand_index.last_hand is not None:
+            open_live_hand(hand_index.hand_lines(hand_index.last_hand[0], complete_only=True))
+        follow_job = root.after(FOLLOW_INTERVAL_MS, follow)
+
+def open_live_hand(lines):
+    global replay
+    replay = HandReplay(lines, player_pots, sb, bb)
+    label.config(text=f"Following hand {tokenize_line(lines[0].strip()).amount} live")
+
+def follow():
+    """Show lines appended to the file since the last poll, while following a live game"""
+    global follow_job
+    follow_job = None
+    if not follow_var.get():
+        return
+    try:
+        new_lines = hand_index.update()
+    except OSError as e:
+        logging.debug(f"Error following '{file_path}': {e}")
+        new_lines = []
+
+    if new_lines is None:
+        # File replaced: start again from its last hand
+        if hand_index.last_hand is not None:
+            open_live_hand(hand_index.hand_lines(hand_index.last_hand[0], complete_only=True))
+    else:
+        pending = []
+        for line in new_lines:
+            token = tokenize_line(line)
+            if token.kind == tokenizer.HAND:
+                if replay is not None and pending:
+                    replay.extend(pending)
+                pending = []
+                open_live_hand([line])
+            elif replay is not None:
+                pending.append(line)
+        if pending:
+            replay.extend(pending)
+
+    if replay is not None and (new_lines is None or new_lines):
+        update_hand_controls()
+        show_position(len(replay))
+    follow_job = root.after(FOLLOW_INTERVAL_MS, follow)
+
+def show_position(new_position):
+    global position
+    if replay is None:
+        return
+    position = max(0, min(new_position, len(replay)))
+    state = replay.state_at(position)
+    render(state.view())
+    # Stacks carry over to a hand without a Stacks: line
+    player_pots[:] = state.stacks
+    slider.set(position)
+    street_label.config(text=f"{replay.street_at(position)} - action {position} of {len(replay)}")
 
 def next_action():
-    global action_index
-    if action_index < len(current_actions):
-        perform_action(current_actions[action_index])
-        action_index += 1
+    if replay is not None and position < len(replay):
+        show_position(position + 1)
     else:
         label.config(text="▶ No more actions")
 
-def reset_display():
-    for i in range(numPlayers):
-        canvas.itemconfig(player_rectangles[i], fill="green", width=1)
-        canvas.itemconfig(player_action_texts[i], text="XX-X : XX-X")
-        canvas.itemconfig(player_blind_texts[i], text="")
-        canvas.itemconfig(player_pot_texts[i], text=f"${player_pots[i]}")
-    for i in range(5):
-        canvas.itemconfig(community_card_texts[i], text="XX-X")
-    canvas.itemconfig(action_display, text="")
-    canvas.itemconfig(pot_display, text="POT: $0")
-    for pid in player_hands:
-        player_hands[pid] = "XX-X : XX-X"
-
-def perform_action(action):
-    global pot, community_index
-
-    if action.startswith("dealer:"):
-        idx = int(action.replace("dealer:", "").strip())
-        canvas.itemconfig(player_blind_texts[idx], text="D")
-
-    elif action.startswith("com:"):
-        cards = action.replace("com:", "").split(",")
-        for card in cards:
-            if community_index < 5:
-                canvas.itemconfig(community_card_texts[community_index], text=card)
-                community_index += 1
-
-    elif action.startswith("p") and ":" in action:
-        pid, move = action.split(":")
-        if pid in player_ids:
-            idx = player_ids.index(pid)
-
-            if move.startswith("c-") or move.startswith("r-"):
-                parts = move.split("-")
-                if len(parts) == 2 and parts[1].isdigit():
-                    amount = int(parts[1])
-                    player_pots[idx] -= amount
-                    pot += amount
-                    canvas.itemconfig(player_pot_texts[idx], text=f"${player_pots[idx]}")
-                    label = "CALLS" if parts[0] == "c" else "RAISES"
-                    canvas.itemconfig(action_display, text=f"{pid.upper()} {label} ${amount}")
-                    canvas.itemconfig(pot_display, text=f"POT: ${pot}")
-                else:
-                    canvas.itemconfig(action_display, text=f"{pid.upper()} {move.upper()}")
-
-            elif "-" in move and move.count("-") == 1 and len(move) <= 4:
-                if player_hands[pid] == "XX-X : XX-X":
-                    player_hands[pid] = f"{move} : XX-X"
-                else:
-                    first = player_hands[pid].split(" : ")[0]
-                    player_hands[pid] = f"{first} : {move}"
-                canvas.itemconfig(player_action_texts[idx], text=player_hands[pid])
-
-            elif move == "F":
-                canvas.itemconfig(player_rectangles[idx], fill="red")
-                canvas.itemconfig(action_display, text=f"{pid.upper()} folds")
-
-            elif move.startswith("a-"):
-                pot += int(move[2::])
-                player_pots[idx] = 0
-                canvas.itemconfig(player_rectangles[idx], fill="purple")
-                canvas.itemconfig(action_display, text=f"{pid.upper()} all in")
-                canvas.itemconfig(player_pot_texts[idx], text=f"${player_pots[idx]}")
-                canvas.itemconfig(pot_display, text=f"POT: ${pot}")
-
-            elif move in ["sb", "bb"]:
-                blind_value = sb if move == "sb" else bb
-                player_pots[idx] -= blind_value
-                pot += blind_value
-                canvas.itemconfig(player_pot_texts[idx], text=f"${player_pots[idx]}")
-                canvas.itemconfig(player_blind_texts[idx], text=move.upper())
-                canvas.itemconfig(action_display, text=f"{pid.upper()} posts {move.upper()}")
-                canvas.itemconfig(pot_display, text=f"POT: ${pot}")
-
-    elif action.startswith("W-p"):
-        idx = int(action[3]) - 1
-        parts = action.split(":")
-        player_pots[idx] += int(parts[1])
-        pot -= int(parts[1])
-        canvas.itemconfig(player_rectangles[idx], fill="gold")
-        canvas.itemconfig(action_display, text=f"P{idx + 1} wins!")
-        canvas.itemconfig(player_pot_texts[idx], text=f"${player_pots[idx]}")
-        canvas.itemconfig(pot_display, text=f"POT: {pot}")
-    elif action.startswith("Winner"):
-        idx = int(action[8]) - 1
-        winnings = int(action[10::])
-        
-        for x in range (numPlayers):
-            if x == idx:
-                canvas.itemconfig(player_rectangles[x], fill="gold")
-            else:
-                canvas.itemconfig(player_rectangles[x], fill = "red")
-        canvas.itemconfig(action_display, text=f"P{idx + 1} WINNER : GAME OVER")
-    elif action.startswith("Stacks") == False:
-        logging.debug("Unkown Action: " + action)
-        
+def previous_action():
+    if replay is not None and position > 0:
+        show_position(position - 1)
+    else:
+        label.config(text="◀ Start of the hand")
+
+def jump_to_street(name):
+    if replay is not None and name in replay.streets:
+        show_position(replay.streets[name])
+
+def on_slide(value):
+    if int(value) != position:
+        show_position(int(value))
+
+def render(view):
+    """Update only the canvas items whose value differs from what is on screen"""
+    for key, value in view.items():
+        if rendered.get(key) != value:
+            item, option = canvas_item(key)
+            canvas.itemconfig(item, **{option: value})
+            rendered[key] = value
+
+def canvas_item(key):
+    if key == 'action':
+        return action_display, 'text'
+    if key == 'pot':
+        return pot_display, 'text'
+    kind, i = key
+    if kind == 'fill':
+        return player_rectangles[i], 'fill'
+    if kind == 'card':
+        return community_card_texts[i], 'text'
+    return {'hand': player_action_texts, 'blind': player_blind_texts, 'stack': player_pot_texts}[kind][i], 'text'
 
 # -----------------------------------------------------------------
 
 # --- GUI SETUP ---------------------------------------------------
 root.title("NFC POKER GAME")
-root.geometry("600x600")
+root.geometry("600x750")
 
 label = tk.Label(root, text="Which Hand would you like to view:")
 label.pack(pady=10)
@@ -225,8 +226,33 @@ entry.pack(pady=10)
 button = tk.Button(root, text="Submit", command=show_input)
 button.pack(pady=10)
 
-next_btn = tk.Button(root, text="Next Action", command=next_action)
-next_btn.pack(pady=5)
+step_frame = tk.Frame(root)
+step_frame.pack(pady=5)
+prev_btn = tk.Button(step_frame, text="Previous Action", command=previous_action)
+prev_btn.pack(side=tk.LEFT, padx=5)
+next_btn = tk.Button(step_frame, text="Next Action", command=next_action)
+next_btn.pack(side=tk.LEFT, padx=5)
+
+street_frame = tk.Frame(root)
+street_frame.pack(pady=5)
+street_buttons = {}
+for street in STREETS:
+    street_buttons[street] = tk.Button(
+        street_frame, text=street, state=tk.DISABLED, command=lambda name=street: jump_to_street(name)
+    )
+    street_buttons[street].pack(side=tk.LEFT, padx=2)
+
+follow_var = tk.BooleanVar(value=False)
+follow_btn = tk.Checkbutton(
+    root, text="Follow live game", variable=follow_var, command=toggle_follow,
+    state=tk.NORMAL if hand_index is not None else tk.DISABLED
+)
+follow_btn.pack()
+
+slider = tk.Scale(root, from_=0, to=0, orient=tk.HORIZONTAL, length=400, showvalue=False, command=on_slide)
+slider.pack()
+street_label = tk.Label(root)
+street_label.pack()
 
 game_info_label = tk.Label(root)
 game_info_label.pack(pady=5)
@@ -236,30 +262,32 @@ canvas.pack()
 
 # --- Parse initial config from all_lines (instead of GameId.txt) ---
 numPlayers, pot, sb, bb = 6, 1000, 10, 20
-for line in all_lines:
-    line = line.strip()
-    if line == "Game Start":
+starting_pots = None
+for token in tokenizer.tokenize(all_lines):
+    if token.kind in (tokenizer.GAME_START, tokenizer.HAND):
         break
-    if line.startswith("players:"):
-        numPlayers = int(line.split(":")[1])
-    elif line.startswith("pot:"):
-        pot = int(line.split(":")[1])
-    elif line.startswith("sb:"):
-        sb = int(line.split(":")[1])
-    elif line.startswith("bb:"):
-        bb = int(line.split(":")[1])
+    if token.kind == tokenizer.PLAYERS:
+        numPlayers = token.amount
+    elif token.kind == tokenizer.POT:
+        if token.values:
+            starting_pots = list(token.values)
+            pot = starting_pots[0]
+        else:
+            pot = token.amount
+    elif token.kind == tokenizer.SMALL_BLIND:
+        sb = token.amount
+    elif token.kind == tokenizer.BIG_BLIND:
+        bb = token.amount
 
 game_info_label.config(
     text=f"Players: {numPlayers}   Starting Pot: ${pot}   SB: ${sb}   BB: ${bb}"
 )
 
-player_ids = [f"p{i+1}" for i in range(numPlayers)]
 player_rectangles = []
 player_action_texts = []
 player_pot_texts = []
 player_blind_texts = []
-player_pots = [pot] * numPlayers
-player_hands = {pid: "XX-X : XX-X" for pid in player_ids}
+player_pots = starting_pots[:numPlayers] if starting_pots else [pot] * numPlayers
 
 positions = [
     (0, 0, 75, 75, 37, 15, 30),
@@ -274,7 +302,7 @@ for i, pos in enumerate(positions):
     rect = canvas.create_rectangle(*pos[:4], fill="green")
     player_rectangles.append(rect)
     canvas.create_text(pos[4], pos[5], text=f"P{i+1}", font=("Arial", 16), fill="blue")
-    pot_text = canvas.create_text(pos[4], pos[6], text=f"${pot}", font=("Arial", 12), fill="blue")
+    pot_text = canvas.create_text(pos[4], pos[6], text=f"${player_pots[i]}", font=("Arial", 12), fill="blue")
     player_pot_texts.append(pot_text)
     action_text = canvas.create_text(
         pos[4], pos[6] + 15 if i < 3 else pos[6] - 15,
@@ -293,7 +321,6 @@ for x in [50, 125, 200, 275, 350]:
         canvas.create_text(x, 200, text="XX-X", font=("Arial", 20), fill="blue")
     )
 
-community_index = 0
 action_display = canvas.create_text(200, 250, text="", font=("Arial", 15), fill="blue")
 pot_display = canvas.create_text(200, 150, text=f"POT: ${pot}", font=("Arial", 15), fill="blue")
 
@@ -0,0 +1,81 @@
+"""
+Hand index for NFC-Game-Reader
+
+Text game files are indexed by byte offset in one pass when they are
+opened, so the reader can jump to any hand without reading the file again.
+
+Like replay_engine this module needs no GUI, so it can be tested without
+a display.
+"""
+import os
+
+from pokerlog import tokenizer
+from pokerlog.tokenizer import tokenize_line
+
+
+class HandIndex:
+    """
+    Byte range of every hand in a text game file, built in one pass on load
+
+    Only the header lines are kept in memory. A hand is read back with one
+    seek and one read of its own bytes, so jumping to any hand takes the
+    same time however long the file is.
+
+    While a live game is followed, update() indexes only the bytes appended
+    since the last call. Only complete lines are taken: the device writes
+    some lines in several pieces, so a line waits for its newline.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header_lines = []
+        self.ranges = {}        # hand number -> (start, end) byte offsets of finished hands; the first with that number
+        self.hand_numbers = []  # in file order
+        self.end = 0            # end of the last complete line
+        self.last_hand = None   # (number, start) of the last hand, which runs to the end of the file
+        self.update()
+
+    def update(self):
+        """Index the complete lines appended since the last call and return them; None if the file was replaced"""
+        if os.path.getsize(self.path) < self.end:
+            # The device started a new game in the same file
+            self.__init__(self.path)
+            return None
+        new_lines = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.end)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                line = raw.strip().decode('utf-8', 'replace')
+                if line.startswith('hand:'):
+                    token = tokenize_line(line)
+                    if token.kind == tokenizer.HAND:
+                        if self.last_hand is not None:
+                            self.ranges.setdefault(self.last_hand[0], (self.last_hand[1], self.end))
+                        self.last_hand = (token.amount, self.end)
+                        self.hand_numbers.append(token.amount)
+                elif self.last_hand is None and line:
+                    self.header_lines.append(line)
+                if line:
+                    new_lines.append(line)
+                self.end += len(raw)
+        return new_lines
+
+    def hand_lines(self, hand_number, complete_only=False):
+        """
+        The lines of a hand, from its hand:N line up to the next hand; None if there is no such hand
+
+        The last hand runs to the end of the file, Winner: line included, or
+        with complete_only to the end of the last line update() has taken.
+        """
+        if hand_number in self.ranges:
+            start, end = self.ranges[hand_number]
+        elif self.last_hand is not None and self.last_hand[0] == hand_number:
+            start, end = self.last_hand[1], self.end if complete_only else None
+        else:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            data = f.read() if end is None else f.read(end - start)
+        return data.decode('utf-8', 'replace').splitlines()
@@ -0,0 +1,224 @@
+"""
+Replay engine for NFC-Game-Reader
+
+A hand is replayed once when it is opened. Snapshots of the table state
+are kept along the way, so any point of the hand can be shown again
+without replaying it from the start. The reader can then step back as
+well as forward, jump to a street, and drag a slider through the hand.
+A hand that is still being played can be extended as its lines arrive.
+Small hands get a snapshot after every action; longer hands get one every
+CHECKPOINT_INTERVAL actions, so a seek replays at most that many lines.
+
+TableState.view() flattens a state into {canvas item key: value}. The GUI
+compares it with what is on screen and only updates the items that changed.
+
+Like the pokerlog package this module needs no GUI, so it can be tested
+without a display.
+"""
+import logging
+
+from pokerlog import tokenizer
+from pokerlog.tokenizer import tokenize_line
+
+HIDDEN_HAND = "XX-X : XX-X"
+HIDDEN_CARD = "XX-X"
+COMMUNITY_CARDS = 5
+
+# Hands with at most this many actions get a snapshot after every action
+SMALL_HAND = 64
+CHECKPOINT_INTERVAL = 8
+
+# Street names by the number of community cards showing
+STREET_NAMES = {3: "Flop", 4: "Turn", 5: "River"}
+STREETS = ["Preflop", "Flop", "Turn", "River", "Showdown"]
+
+
+class TableState:
+    """Everything the table canvas shows at one point of a hand"""
+
+    __slots__ = ('stacks', 'pot', 'fills', 'hands', 'blinds', 'stack_texts', 'community', 'action', 'pot_text')
+
+    def __init__(self, stacks):
+        self.stacks = list(stacks)
+        self.pot = 0
+        self.fills = ["green"] * len(stacks)
+        self.hands = [HIDDEN_HAND] * len(stacks)
+        self.blinds = [""] * len(stacks)
+        self.stack_texts = [f"${amount}" for amount in stacks]
+        self.community = []
+        self.action = ""
+        self.pot_text = "POT: $0"
+
+    def copy(self):
+        state = TableState.__new__(TableState)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            setattr(state, name, list(value) if isinstance(value, list) else value)
+        return state
+
+    def set_stacks(self, amounts):
+        """Seat the players with the chips from a Stacks: line; empty seats are greyed out"""
+        for i, amount in enumerate(amounts[:len(self.stacks)]):
+            self.stacks[i] = amount
+            self.fills[i] = "gray" if amount == 0 else "green"
+            self.hands[i] = "" if amount == 0 else HIDDEN_HAND
+            self.stack_texts[i] = f"${amount}" if amount else ""
+            self.blinds[i] = ""
+
+    def apply(self, token, sb, bb):
+        """Apply one tokenized line of the hand"""
+        kind = token.kind
+        idx = token.player - 1 if token.player is not None else None
+        if idx is not None and not 0 <= idx < len(self.stacks):
+            logging.debug("Unknown player: " + token.line)
+            return
+        pid = f"P{token.player}"
+
+        if kind == tokenizer.DEALER:
+            if 0 <= token.amount < len(self.blinds):
+                self.blinds[token.amount] = "D"
+
+        elif kind == tokenizer.COMMUNITY:
+            self.community.extend(token.cards[:COMMUNITY_CARDS - len(self.community)])
+
+        elif kind == tokenizer.CALL or kind == tokenizer.RAISE:
+            self._bet(idx, token.amount)
+            self.action = f"{pid} {'CALLS' if kind == tokenizer.CALL else 'RAISES'} ${token.amount}"
+
+        elif kind == tokenizer.HOLE_CARD:
+            if self.hands[idx] in (HIDDEN_HAND, ""):
+                self.hands[idx] = f"{token.cards[0]} : {HIDDEN_CARD}"
+            else:
+                self.hands[idx] = f"{self.hands[idx].split(' : ')[0]} : {token.cards[0]}"
+
+        elif kind == tokenizer.FOLD:
+            self.fills[idx] = "red"
+            self.action = f"{pid} folds"
+
+        elif kind == tokenizer.ALL_IN:
+            self.pot += token.amount
+            self.stacks[idx] = 0
+            self.fills[idx] = "purple"
+            self.stack_texts[idx] = "$0"
+            self.pot_text = f"POT: ${self.pot}"
+            self.action = f"{pid} all in"
+
+        elif kind == tokenizer.POST_SB or kind == tokenizer.POST_BB:
+            move = "SB" if kind == tokenizer.POST_SB else "BB"
+            self._bet(idx, sb if move == "SB" else bb)
+            self.blinds[idx] = move
+            self.action = f"{pid} posts {move}"
+
+        elif kind == tokenizer.WIN:
+            self.stacks[idx] += token.amount
+            self.pot -= token.amount
+            self.fills[idx] = "gold"
+            self.stack_texts[idx] = f"${self.stacks[idx]}"
+            self.pot_text = f"POT: ${self.pot}"
+            self.action = f"{pid} wins!"
+
+        elif kind == tokenizer.WINNER:
+            self.fills = ["gold" if i == idx else "red" for i in range(len(self.fills))]
+            self.action = f"{pid} WINNER : GAME OVER"
+
+        elif kind != tokenizer.STACKS:
+            logging.debug("Unknown action: " + token.line)
+
+    def _bet(self, idx, amount):
+        self.stacks[idx] -= amount
+        self.pot += amount
+        self.stack_texts[idx] = f"${self.stacks[idx]}"
+        self.pot_text = f"POT: ${self.pot}"
+
+    def view(self):
+        """{canvas item key: value} for every item on the table"""
+        view = {'action': self.action, 'pot': self.pot_text}
+        for i in range(len(self.stacks)):
+            view['fill', i] = self.fills[i]
+            view['hand', i] = self.hands[i]
+            view['blind', i] = self.blinds[i]
+            view['stack', i] = self.stack_texts[i]
+        for i in range(COMMUNITY_CARDS):
+            view['card', i] = self.community[i] if i < len(self.community) else HIDDEN_CARD
+        return view
+
+
+class HandReplay:
+    """
+    A hand with snapshots of its table state
+
+    Position 0 is the table before the first action, and position i is the
+    table after i actions. streets maps a street name to the position where
+    it starts: just after its community cards, or after the first win for
+    the showdown.
+    """
+
+    def __init__(self, lines, stacks, sb, bb):
+        self.sb, self.bb = sb, bb
+        self._hand_line = lines[0].strip()
+        self._stacks = list(stacks)
+        self.actions = [line.strip() for line in lines[1:] if line.strip()]
+        self._tokens = [tokenize_line(line) for line in self.actions]
+
+        start = TableState(stacks)
+        self._has_stacks = False
+        for token in self._tokens:
+            if token.kind == tokenizer.STACKS:
+                start.set_stacks(token.values)
+                self._has_stacks = True
+                break
+
+        self.interval = 1 if len(self.actions) <= SMALL_HAND else CHECKPOINT_INTERVAL
+        self._checkpoints = [start.copy()]
+        self.streets = {"Preflop": 0}
+        self._state = start
+        self._advance(self._tokens, 1)
+
+    def extend(self, lines):
+        """Add lines written to the hand after it was opened (a game being followed live)"""
+        actions = [line.strip() for line in lines if line.strip()]
+        tokens = [tokenize_line(line) for line in actions]
+        if not self._has_stacks and any(token.kind == tokenizer.STACKS for token in tokens):
+            # The seats are set up from the Stacks: line, so replay the hand with it from the start
+            self.__init__([self._hand_line] + self.actions + actions, self._stacks, self.sb, self.bb)
+            return
+        first = len(self.actions) + 1
+        self.actions += actions
+        self._tokens += tokens
+        self._advance(tokens, first)
+
+    def _advance(self, tokens, first):
+        """Apply tokens from position first on, taking snapshots and noting where streets start"""
+        state = self._state
+        for position, token in enumerate(tokens, first):
+            state.apply(token, self.sb, self.bb)
+            if token.kind == tokenizer.COMMUNITY and len(state.community) in STREET_NAMES:
+                self.streets.setdefault(STREET_NAMES[len(state.community)], position)
+            elif token.kind == tokenizer.WIN:
+                self.streets.setdefault("Showdown", position)
+            if position % self.interval == 0:
+                self._checkpoints.append(state.copy())
+
+    def __len__(self):
+        """Number of actions, the last position"""
+        return len(self.actions)
+
+    def state_at(self, position):
+        """Table state after position actions, from the nearest snapshot at or before it"""
+        position = max(0, min(position, len(self.actions)))
+        base = position - position % self.interval
+        state = self._checkpoints[base // self.interval]
+        if base == position:
+            return state
+        state = state.copy()
+        for token in self._tokens[base:position]:
+            state.apply(token, self.sb, self.bb)
+        return state
+
+    def street_at(self, position):
+        """Name of the street being played at position"""
+        current = "Preflop"
+        for name in STREETS:
+            if self.streets.get(name, position + 1) <= position:
+                current = name
+        return current
@@ -0,0 +1,179 @@
+"""
+Tests for the reader's headless modules: python -m unittest in this folder
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from pokerlog import tokenizer
+from pokerlog.tokenizer import tokenize_line
+
+import replay_engine
+from hand_index import HandIndex
+from replay_engine import HandReplay, TableState
+
+HEADER = ["players:3", "pot:1000", "sb:10", "bb:20", "Game Start"]
+HANDS = [
+    ["hand:1", "dealer:0", "Stacks:[1000,1000,1000]", "p2:A-H", "p3:10-D", "p1:5-C", "p2:K-S", "p3:2-H", "p1:9-C",
+     "p2:sb", "p3:bb", "p1:F", "p2:c-10", "p3:c-0", "com:2-D,Q-D,3-C", "p2:r-100", "p3:F", "W-p2:140"],
+    ["hand:2", "dealer:1", "Stacks:[990,1120,880]", "p3:4-H", "p1:8-D", "p2:J-C", "p3:4-S", "p1:8-S", "p2:J-D",
+     "p3:sb", "p1:bb", "p2:A-1120", "p3:A-870", "p1:F", "com:2-C,3-S,9-H", "com:K-D", "com:5-S", "W-p2:2010"],
+    ["hand:3", "dealer:2", "Stacks:[970,2010,0]", "p1:Q-H", "p2:7-C", "p1:Q-S", "p2:7-D", "p1:sb", "p2:bb",
+     "p1:A-960", "p2:c-950", "com:3-H,8-C,J-S", "com:2-S", "com:4-D", "W-p1:1940", "Winner:p1-2980"],
+]
+
+
+class TempFileMixin:
+    """Writes game files in a temporary folder for the test"""
+
+    def setUp(self):
+        super().setUp()
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        self.path = os.path.join(folder, "NFC_INF0.txt")
+
+    def write(self, lines, mode="w", newline="\n"):
+        with open(self.path, mode, encoding="utf-8", newline="") as f:
+            f.write("".join(line + newline for line in lines))
+
+
+class HandIndexTests(TempFileMixin, unittest.TestCase):
+    """Hands are read back by byte offset, one hand's bytes at a time"""
+
+    def test_every_hand(self):
+        self.write(HEADER + sum(HANDS, []))
+        index = HandIndex(self.path)
+        self.assertEqual(index.header_lines, HEADER)
+        self.assertEqual(index.hand_numbers, [1, 2, 3])
+        for hand in HANDS:
+            self.assertEqual(index.hand_lines(int(hand[0].split(":")[1])), hand)
+        self.assertIsNone(index.hand_lines(4))
+
+    def test_offsets(self):
+        self.write(HEADER + sum(HANDS, []), newline="\r\n")
+        index = HandIndex(self.path)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for number, (start, end) in index.ranges.items():
+            self.assertTrue(data[start:end].startswith(f"hand:{number}\r\n".encode()))
+            self.assertTrue(data[end:].startswith(b"hand:"))
+        self.assertEqual(index.last_hand, (3, data.index(b"hand:3")))
+        self.assertEqual(index.end, len(data))
+
+    def test_repeated_hand_number(self):
+        # The first hand with a number is the one shown
+        self.write(HEADER + HANDS[0] + HANDS[0][:1] + HANDS[1][1:] + HANDS[2])
+        index = HandIndex(self.path)
+        self.assertEqual(index.hand_numbers, [1, 1, 3])
+        self.assertEqual(index.hand_lines(1), HANDS[0])
+
+    def test_no_hands(self):
+        self.write(HEADER)
+        index = HandIndex(self.path)
+        self.assertEqual(index.header_lines, HEADER)
+        self.assertIsNone(index.last_hand)
+        self.assertIsNone(index.hand_lines(1))
+
+
+def _replayed(lines, stacks, position):
+    """The table after position actions of a hand, replayed from its start"""
+    tokens = [tokenize_line(line) for line in lines[1:]]
+    state = TableState(stacks)
+    for token in tokens:
+        if token.kind == tokenizer.STACKS:
+            state.set_stacks(token.values)
+            break
+    for token in tokens[:position]:
+        state.apply(token, 10, 20)
+    return state.view()
+
+
+class HandReplayTests(unittest.TestCase):
+    """Any point of a hand is shown as a replay from its start would show it"""
+
+    def _check_every_position(self, lines):
+        replay = HandReplay(lines, [1000] * 3, 10, 20)
+        self.assertEqual(len(replay), len(lines) - 1)
+        for position in range(len(replay) + 1):
+            with self.subTest(position=position):
+                self.assertEqual(replay.state_at(position).view(), _replayed(lines, [1000] * 3, position))
+        return replay
+
+    def test_small_hand(self):
+        replay = self._check_every_position(HANDS[0])
+        self.assertEqual(replay.interval, 1)
+
+    def test_long_hand(self):
+        # More actions than a small hand: snapshots every CHECKPOINT_INTERVAL actions
+        checks = ["p2:c-0", "p3:c-0"] * replay_engine.SMALL_HAND
+        replay = self._check_every_position(HANDS[0][:15] + checks + HANDS[0][15:])
+        self.assertEqual(replay.interval, replay_engine.CHECKPOINT_INTERVAL)
+
+    def test_seeking_leaves_the_snapshots_alone(self):
+        replay = HandReplay(HANDS[1], [1000] * 3, 10, 20)
+        for position in (len(replay), 3, len(replay), 0):
+            self.assertEqual(replay.state_at(position).view(), _replayed(HANDS[1], [1000] * 3, position))
+
+    def test_streets(self):
+        replay = HandReplay(HANDS[1], [1000] * 3, 10, 20)
+        self.assertEqual(replay.streets, {"Preflop": 0, "Flop": 14, "Turn": 15, "River": 16, "Showdown": 17})
+        self.assertEqual(replay.street_at(13), "Preflop")
+        self.assertEqual(replay.street_at(15), "Turn")
+        self.assertEqual(replay.street_at(len(replay)), "Showdown")
+
+    def test_table_view(self):
+        view = HandReplay(HANDS[2], [1000] * 3, 10, 20).state_at(len(HANDS[2]) - 1).view()
+        self.assertEqual(view["action"], "P1 WINNER : GAME OVER")
+        self.assertEqual([view["fill", seat] for seat in range(3)], ["gold", "red", "red"])
+        self.assertEqual([view["card", i] for i in range(5)], ["3-H", "8-C", "J-S", "2-S", "4-D"])
+        self.assertEqual(view["hand", 0], "Q-H : Q-S")
+        self.assertEqual(view["stack", 2], "")  # Busted seat
+
+
+
+class FollowTests(TempFileMixin, unittest.TestCase):
+    """A game being written is indexed and replayed from the appended lines only"""
+
+    def test_only_appended_complete_lines(self):
+        self.write(HEADER + HANDS[0][:5])
+        index = HandIndex(self.path)
+        self.assertEqual(index.hand_lines(1, complete_only=True), HANDS[0][:5])
+
+        # The device writes some lines in pieces: a line is only taken with its newline
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(HANDS[0][5:8]) + "\np1:")
+        self.assertEqual(index.update(), HANDS[0][5:8])
+        self.assertEqual(index.hand_lines(1, complete_only=True), HANDS[0][:8])
+        self.write(["9-C"] + HANDS[0][9:] + HANDS[1], "a")
+        self.assertEqual(index.update(), HANDS[0][8:] + HANDS[1])
+
+        self.assertEqual(index.update(), [])
+        self.assertEqual(index.hand_numbers, [1, 2])
+        self.assertEqual(index.hand_lines(1), HANDS[0])
+        self.assertEqual(index.hand_lines(2), HANDS[1])
+
+    def test_new_game_in_the_same_file(self):
+        self.write(HEADER + sum(HANDS, []))
+        index = HandIndex(self.path)
+        self.write(HEADER + HANDS[0][:4])
+        self.assertIsNone(index.update())
+        self.assertEqual(index.hand_numbers, [1])
+        self.assertEqual(index.hand_lines(1, complete_only=True), HANDS[0][:4])
+
+    def test_replay_extended_as_lines_arrive(self):
+        lines = HANDS[1]
+        whole = HandReplay(lines, [1000] * 3, 10, 20)
+        for split in (1, 2, 3, 12, len(lines) - 1):
+            with self.subTest(split=split):
+                replay = HandReplay(lines[:split], [1000] * 3, 10, 20)
+                for line in lines[split:]:
+                    replay.extend([line])
+                self.assertEqual(len(replay), len(whole))
+                self.assertEqual(replay.streets, whole.streets)
+                for position in range(len(replay) + 1):
+                    self.assertEqual(replay.state_at(position).view(), whole.state_at(position).view())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,24 +1,88 @@
 from django.contrib import admin
-from .models import Game
+from .jobs import enqueue_game
+from .models import Action, Game, GameBlob, GameImport, Hand, Job, ParsedGame, UserStats
 
 
 @admin.register(Game)
 class GameAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'user', 'player_number', 'profit', 'date', 'created_at')  # ⬅️ ADDED player_number
-    list_filter = ('user', 'player_number', 'date', 'created_at')  # ⬅️ ADDED player_number
+    list_display = ('id', 'name', 'user', 'player_number', 'profit', 'status', 'date', 'created_at')  # ⬅️ ADDED player_number
+    list_filter = ('status', 'user', 'player_number', 'date', 'created_at')  # ⬅️ ADDED player_number
     search_fields = ('name', 'user__username')
-    readonly_fields = ('date', 'created_at')
+    readonly_fields = ('date', 'created_at', 'content_hash', 'blob', 'status', 'status_message')
     ordering = ('-created_at',)
+    actions = ['reprocess']
     
     fieldsets = (
         ('Game Information', {
             'fields': ('user', 'name', 'player_number', 'profit')  # ⬅️ ADDED player_number
         }),
         ('Game Data', {
-            'fields': ('game_data',)
+            'fields': ('game_data', 'content_hash', 'blob', 'status', 'status_message')
         }),
         ('Timestamps', {
             'fields': ('date', 'created_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+    @admin.action(description="Process the selected games again")
+    def reprocess(self, request, queryset):
+        for game in queryset:
+            enqueue_game(game)
+        self.message_user(request, f"Queued {queryset.count()} games")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'game', 'status', 'attempts', 'max_attempts', 'run_after', 'locked_by', 'updated_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'game', 'game_import', 'attempts', 'locked_by', 'locked_at', 'last_error', 'created_at',
+                       'updated_at')
+
+
+@admin.register(GameImport)
+class GameImportAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'player_number', 'status', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('user__username',)
+    readonly_fields = ('files', 'report', 'status', 'status_message', 'created_at', 'updated_at')
+
+
+class ActionInline(admin.TabularInline):
+    model = Action
+    fields = ('sequence', 'street', 'seat', 'action_type', 'amount', 'cards')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Hand)
+class HandAdmin(admin.ModelAdmin):
+    list_display = ('game', 'hand_number', 'dealer', 'board')
+    search_fields = ('game__name', 'game__user__username')
+    readonly_fields = ('game', 'position', 'hand_number', 'dealer', 'stacks', 'board')
+    inlines = [ActionInline]
+
+
+@admin.register(ParsedGame)
+class ParsedGameAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'parser_version', 'created_at')
+    list_filter = ('parser_version',)
+    search_fields = ('content_hash',)
+    readonly_fields = ('content_hash', 'parser_version', 'summary', 'profits', 'created_at')
+    exclude = ('hands', 'hand_offsets', 'annotations', 'annotation_offsets')
+
+
+@admin.register(GameBlob)
+class GameBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'ref_count', 'created_at')
+    search_fields = ('sha256',)
+    readonly_fields = ('sha256', 'file', 'size', 'ref_count', 'created_at')
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'game_count', 'total_profit', 'best_profit', 'worst_profit', 'last_played')
+    search_fields = ('user__username',)
+    readonly_fields = ('total_profit', 'game_count', 'best_profit', 'worst_profit', 'last_played', 'all_game_count',
+                       'updated_at')
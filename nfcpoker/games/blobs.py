@@ -0,0 +1,50 @@
+"""
+Content-addressed storage for uploaded game files
+
+Every player at a table uploads the same SD card file, so files are stored
+once per SHA-256 as a GameBlob. Games point their game_data at the blob's
+file, and the blob keeps a reference count. The file is only deleted when
+the last game using it goes away.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .cache import delete_binary_log
+from .downloads import delete_gzip_copy, save_gzip_copy
+from .models import GameBlob, ParsedGame, file_sha256
+
+
+def acquire_blob(file):
+    """Return the blob holding file's content, storing it first if it is new, and take a reference"""
+    sha256 = file_sha256(file)
+    with transaction.atomic():
+        blob, created = GameBlob.objects.get_or_create(sha256=sha256, defaults={'size': file.size})
+        if created:
+            blob.file.save(f"{sha256}.txt", file, save=False)
+            blob.save(update_fields=['file'])
+            # Downloads send this to clients that accept gzip (see games.downloads)
+            save_gzip_copy(blob.file)
+        GameBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    blob.refresh_from_db(fields=['ref_count'])
+    return blob
+
+
+def release_blob(blob_id):
+    """Drop a reference to a blob, deleting the blob, its files and its parses with the last one"""
+    with transaction.atomic():
+        GameBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        blob = GameBlob.objects.select_for_update().filter(pk=blob_id, ref_count=0).first()
+        if blob is None or blob.games.exists():
+            return
+        sha256, file = blob.sha256, blob.file
+        blob.delete()
+        ParsedGame.objects.filter(content_hash=sha256).delete()
+        # Only remove the file once the deletion is committed
+        transaction.on_commit(lambda: delete_blob_files(file))
+
+
+def delete_blob_files(file):
+    """Delete a blob's stored file and the binary and gzip copies next to it"""
+    delete_binary_log(file)
+    delete_gzip_copy(file)
+    file.delete(save=False)
@@ -0,0 +1,257 @@
+"""
+Persisted parse results for game files
+
+Parsed games are stored in ParsedGame keyed by (content hash, PARSER_VERSION),
+so a file is only parsed again when its content or the parser changes.
+
+A parse is stored as a small summary (everything but the hands) plus the
+hands as comma separated JSON objects with the offset of each one, so a
+range of hands can be cut out of the database with SUBSTR without loading
+or decoding the rest of the game.
+
+Each hand's showdown and all-in equity (games.equity) take far longer to
+work out than the parse itself, so they are worked out once with the
+parse, ANNOTATION_BATCH hands per evaluator call, and stored the same way
+as the hands in annotations and annotation_offsets. get_hands() merges
+them back into the hands it returns.
+
+Stored game files also get a binary copy next to them (pokerlog.binlog). When
+a file has no cached parse, e.g. after PARSER_VERSION changed, the summary
+and hand ranges are decoded from the binary copy instead of parsing the
+whole file on the request.
+"""
+import json
+import os
+from itertools import accumulate
+
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Substr
+from pokerlog import binlog
+
+from .equity import annotate_hands
+from .models import Game, ParsedGame, file_sha256
+from .parser import PARSER_VERSION, ProfitCalculator, iter_game_data, iter_lines
+
+# The device supports up to 6 players
+PROFIT_SEATS = 6
+
+# Hands annotated per evaluator call while parsing
+ANNOTATION_BATCH = 50
+
+# Hand fields added by games.equity and stored in annotations
+ANNOTATION_FIELDS = ['showdown', 'equity', 'starting_hands']
+
+
+def get_parsed_game(game):
+    """
+    Return the ParsedGame for a game's file, parsing it (once per distinct content) on a miss
+
+    The hands and annotations texts are deferred, use get_hands_json() or get_hands() to read hands.
+    """
+    if not game.content_hash:
+        # Games saved before hashing existed: hash once and remember it
+        game.content_hash = file_sha256(game.game_data)
+        Game.objects.filter(pk=game.pk).update(content_hash=game.content_hash)
+
+    parsed = _cached_parse(game)
+    if parsed is not None:
+        return parsed
+
+    parsed = ParsedGame(
+        content_hash=game.content_hash, parser_version=PARSER_VERSION, **parse_game_file(game.game_data)
+    )
+    game.game_data.seek(0)
+
+    # Parses from older parser versions can never be served again
+    ParsedGame.objects.filter(content_hash=game.content_hash).exclude(parser_version=PARSER_VERSION).delete()
+    try:
+        with transaction.atomic():
+            parsed.save()
+    except IntegrityError:
+        # Another request cached the same file first
+        parsed = ParsedGame.objects.defer('hands', 'annotations').get(
+            content_hash=game.content_hash, parser_version=PARSER_VERSION
+        )
+    return parsed
+
+
+def store_parses(parses):
+    """Cache parse_game_file() results, {sha256: fields}, like get_parsed_game() does, dropping older parser versions"""
+    fresh = [sha256 for sha256, fields in parses.items() if not fields.get('cached')]
+    ParsedGame.objects.filter(content_hash__in=fresh).exclude(parser_version=PARSER_VERSION).delete()
+    ParsedGame.objects.bulk_create([
+        ParsedGame(
+            content_hash=sha256,
+            parser_version=PARSER_VERSION,
+            **{field: parses[sha256][field] for field in (
+                'summary', 'hands', 'hand_offsets', 'annotations', 'annotation_offsets', 'profits'
+            )},
+        ) for sha256 in fresh
+    ], ignore_conflicts=True)
+
+
+def parse_game_file(source):
+    """
+    Parse a game file (anything iter_game_data() reads) into ParsedGame field values
+
+    Profit/loss is worked out for every seat in the same pass, so later
+    uploads of this file by other players need no parsing at all, and so
+    are the hands' annotations.
+    """
+    calculator = ProfitCalculator(range(1, PROFIT_SEATS + 1))
+    annotations = []
+    summary, hands, hand_offsets = dumps_game_data(_observe(iter_game_data(source), calculator, annotations))
+    profits = calculator.profits()
+    return {
+        'summary': summary,
+        'hands': hands,
+        'hand_offsets': hand_offsets,
+        'annotations': ','.join(annotations),
+        'annotation_offsets': list(accumulate((len(text) + 1 for text in annotations), initial=0)),
+        'profits': [profits[seat] for seat in range(1, PROFIT_SEATS + 1)],
+    }
+
+
+def _observe(events, calculator, annotations):
+    """Feed events to calculator as they stream past, adding each hand's annotations JSON to annotations"""
+    batch = []
+    for kind, value in events:
+        calculator.feed(kind, value)
+        if kind == 'hand':
+            # A copy: annotating must not change the hand that is stored
+            batch.append({'hand_number': value['hand_number'], 'actions': value['actions']})
+            if len(batch) == ANNOTATION_BATCH:
+                annotations.extend(dumps_annotations(batch))
+                batch = []
+        yield kind, value
+    annotations.extend(dumps_annotations(batch))
+
+
+def dumps_annotations(hands):
+    """Annotate parsed hands (games.equity) and return the JSON of each one's ANNOTATION_FIELDS"""
+    return [json.dumps({field: hand[field] for field in ANNOTATION_FIELDS}) for hand in annotate_hands(hands)]
+
+
+def get_game_summary(game):
+    """Return the parsed game without its hands; hand_count says how many there are"""
+    parsed = _cached_parse(game)
+    if parsed is None and os.path.exists(path := binary_log_path(game.game_data)):
+        with binlog.GameLog(path) as log:
+            summary = json.loads(dumps_game_data(iter_game_data('\n'.join(log.header_lines() + log.trailer_lines())))[0])
+            summary['hand_count'] = log.hand_count
+        return summary
+    return json.loads((parsed or get_parsed_game(game)).summary)
+
+
+def get_hands(game, start, end):
+    """
+    Return (hand count, hands start to end - 1 as dicts), from the cached parse or the binary log
+
+    The hands have their annotations (ANNOTATION_FIELDS): stored ones from
+    the cached parse, worked out here for hands from the binary log.
+    """
+    parsed = _cached_parse(game)
+    if parsed is None and os.path.exists(path := binary_log_path(game.game_data)):
+        with binlog.GameLog(path) as log:
+            # Hands only depend on the header lines and the hand before them, whose
+            # result the first one's Stacks: line is checked against (see games.engine)
+            first = max(start - 1, 0)
+            lines = log.header_lines() + log.hands_lines(first, end)
+            hands = [value for kind, value in iter_game_data('\n'.join(lines)) if kind == 'hand'][start - first:]
+            annotate_hands(hands)
+            # Through JSON like the cached hands, so player keys are strings either way
+            return log.hand_count, json.loads(json.dumps(hands))
+    parsed = parsed or get_parsed_game(game)
+    hands = json.loads(get_hands_json(parsed, start, end))
+    annotations = json.loads(_json_range(parsed, 'annotations', parsed.annotation_offsets, start, end))
+    for hand, annotation in zip(hands, annotations):
+        hand.update(annotation)
+    return parsed.hand_count, hands
+
+
+def _cached_parse(game):
+    if not game.content_hash:
+        return None
+    return ParsedGame.objects.defer('hands', 'annotations').filter(
+        content_hash=game.content_hash, parser_version=PARSER_VERSION
+    ).first()
+
+
+def get_hands_json(parsed, start, end):
+    """Return hands start to end - 1 of a ParsedGame, in file order, as JSON array text"""
+    return _json_range(parsed, 'hands', parsed.hand_offsets, start, end)
+
+
+def _json_range(parsed, field, offsets, start, end):
+    """Return objects start to end - 1 of a ParsedGame's comma separated JSON field as JSON array text"""
+    count = max(len(offsets) - 1, 0)
+    start = max(0, min(start, count))
+    end = max(start, min(end, count))
+    if start == end:
+        return '[]'
+    # SUBSTR counts from 1, and json.dumps output is ASCII so characters and bytes agree
+    chunk = ParsedGame.objects.filter(pk=parsed.pk).annotate(
+        chunk=Substr(field, offsets[start] + 1, offsets[end] - offsets[start] - 1)
+    ).values_list('chunk', flat=True).get()
+    return f'[{chunk}]'
+
+
+def get_game_profit(game):
+    """Return the game's player's profit/loss from the cached parse"""
+    profits = get_parsed_game(game).profits
+    if 1 <= game.player_number <= len(profits):
+        return profits[game.player_number - 1]
+    return 0
+
+
+def dumps_game_data(events):
+    """
+    Serialize iter_game_data() events for ParsedGame
+
+    Returns (summary JSON, hands JSON, hand offsets). Hand i starts at
+    offsets[i] in the hands text and the last offset is one past its end.
+    Hands are serialized as they are parsed, so neither the file text nor
+    the list of hand dicts is ever held in memory.
+    """
+    summary = {}
+    hands = []
+    offsets = [0]
+    winner = None
+    final_stacks = {}
+    for kind, value in events:
+        if kind == 'header':
+            summary.update(value)
+        elif kind == 'hand':
+            hand = json.dumps(value)
+            hands.append(hand)
+            offsets.append(offsets[-1] + len(hand) + 1)
+        elif kind == 'winner':
+            winner = value
+            final_stacks[value['player']] = value['final_chips']
+    summary.update(hand_count=len(hands), winner=winner, final_stacks=final_stacks)
+    return json.dumps(summary), ','.join(hands), offsets
+
+
+def binary_log_path(field_file):
+    """Path of the binary copy of a stored game file (the file's own path plus .nfcb)"""
+    return field_file.storage.path(field_file.name) + binlog.EXTENSION
+
+
+def save_binary_log(field_file, data=None):
+    """Write the binary copy of a stored game file, encoding it unless data is already binlog.encode() output"""
+    if data is None:
+        with field_file.storage.open(field_file.name, 'rb') as f:
+            data = binlog.encode(iter_lines(f))
+    path = binary_log_path(field_file)
+    # Written aside and renamed, so a reader never maps a half-written file
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def delete_binary_log(field_file):
+    try:
+        os.remove(binary_log_path(field_file))
+    except (FileNotFoundError, NotImplementedError):
+        pass
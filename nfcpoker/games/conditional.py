@@ -0,0 +1,98 @@
+"""
+Conditional responses and fragment caching for the game pages
+
+A game's page only changes when its row does (Game.updated_at) or its file
+does (content_hash). view_game sends an ETag and Last-Modified worked out
+from those, and the games index sends them from the user's UserStats row,
+whose updated_at moves with every change to one of their games (see
+games.signals). A browser revalidating a page it already has gets a 304,
+and the page is not built at all: a game page costs one query for the game,
+the index one for the stats row.
+
+The ETag also covers what else the page is made from: the user, the query
+string (filters and cursor) and the CSRF cookie the page's forms carry.
+Pages with messages waiting are not conditional, since the messages are
+only shown once.
+
+The expensive blocks of the pages are template fragments cached under the
+same versions:
+- a game's details by game id
+- the index's stats and games table by user
+
+A changed game gets new fragment keys, so nothing has to be deleted, and
+the old fragments expire after FRAGMENT_TIMEOUT. The views only parse or
+query for a fragment that is not cached (see fragment_cached).
+"""
+import hashlib
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from .models import Game, UserStats
+from .parser import PARSER_VERSION
+
+# Seconds a rendered fragment is kept
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+
+def get_game(request, game_id):
+    """The user's game, or None; fetched once per request for the ETag, Last-Modified and the view"""
+    if not hasattr(request, '_games'):
+        request._games = {}
+    if game_id not in request._games:
+        request._games[game_id] = Game.objects.filter(id=game_id, user=request.user).first()
+    return request._games[game_id]
+
+
+def game_version(game):
+    """Changes whenever anything the game's page shows does"""
+    return f"{game.updated_at.timestamp()}-{game.content_hash}-{PARSER_VERSION}"
+
+
+def user_stats(request):
+    """The user's UserStats, fetched once per request (and built if they have none yet)"""
+    if not hasattr(request, '_user_stats'):
+        stats = UserStats.objects.filter(user=request.user).first()
+        request._user_stats = stats or UserStats.rebuild(request.user.pk)
+    return request._user_stats
+
+
+def games_version(request):
+    """Changes whenever any of the user's games does, or one is added or deleted"""
+    stats = user_stats(request)
+    return f"{stats.updated_at.timestamp()}-{stats.all_game_count}"
+
+
+def _etag(request, version):
+    if len(messages.get_messages(request)):
+        return None
+    parts = [request.user.pk, request.get_full_path(), request.META.get('CSRF_COOKIE', ''), version]
+    return hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:32]
+
+
+def game_etag(request, game_id):
+    game = get_game(request, game_id)
+    return _etag(request, game_version(game)) if game else None
+
+
+def game_last_modified(request, game_id):
+    game = get_game(request, game_id)
+    if game is None or len(messages.get_messages(request)):
+        return None
+    return game.updated_at
+
+
+def index_etag(request):
+    return _etag(request, games_version(request))
+
+
+def index_last_modified(request):
+    if len(messages.get_messages(request)):
+        return None
+    return user_stats(request).updated_at
+
+
+def fragment_cached(name, *vary_on):
+    """Whether the {% cache %} fragment with this name and these vary_on values is cached"""
+    return cache.get(make_template_fragment_key(name, vary_on)) is not None
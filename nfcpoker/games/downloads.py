@@ -0,0 +1,152 @@
+"""
+Downloads of stored game files
+
+Game files are streamed with FileResponse instead of being linked from
+MEDIA_URL, so only the game's owner can fetch them and the response can be
+made to fit the request:
+
+- Every stored file has a gzip copy next to it (the file's own path plus
+  .gz), written when its blob is stored. Text logs shrink to a fraction of
+  their size. Clients that accept gzip get the copy with Content-Encoding:
+  gzip, and nothing is compressed on the request.
+- A file's ETag is its content hash (the gzip copy's has -gzip added), so
+  If-None-Match is answered with a 304 without opening the file.
+- A single byte range (Range: bytes=N-M) of either variant is sent as a
+  206, so interrupted downloads of big archives resume. If-Range is
+  honoured, other ranges get the whole file.
+
+Files of live games are still being written. They have no hash or gzip
+copy, and are sent as they are.
+"""
+import gzip
+import os
+import re
+import shutil
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+GZIP_EXTENSION = '.gz'
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+def gzip_path(field_file):
+    """Path of the gzip copy of a stored game file"""
+    return field_file.storage.path(field_file.name) + GZIP_EXTENSION
+
+
+def save_gzip_copy(field_file):
+    """Write the gzip copy of a stored game file; returns its path"""
+    path = gzip_path(field_file)
+    # Written aside and renamed, so a download never sends a half-written copy
+    with field_file.storage.open(field_file.name, 'rb') as source, open(path + '.tmp', 'wb') as f:
+        # No name or time in the gzip header: the same content always gives the same bytes
+        with gzip.GzipFile(filename='', mode='wb', fileobj=f, compresslevel=9, mtime=0) as compressed:
+            shutil.copyfileobj(source, compressed, 64 * 1024)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def delete_gzip_copy(field_file):
+    try:
+        os.remove(gzip_path(field_file))
+    except (FileNotFoundError, NotImplementedError):
+        pass
+
+
+def accepts_gzip(request):
+    """Whether the request's Accept-Encoding allows gzip"""
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() in ('gzip', 'x-gzip', '*'):
+            quality = params.strip().lower()
+            try:
+                return not quality.startswith('q=') or float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def serve_game_file(request, game, filename):
+    """The response to a download of a game's file (see the module docstring)"""
+    field_file = game.game_data
+    path = field_file.storage.path(field_file.name)
+    etag = quote_etag(game.content_hash) if game.content_hash and game.status != game.LIVE else None
+    encoding = None
+    if etag and accepts_gzip(request) and os.path.exists(gzip_path(field_file)):
+        path, encoding = gzip_path(field_file), 'gzip'
+        etag = quote_etag(f'{game.content_hash}-gzip')
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return HttpResponse('The game file is missing', status=404, content_type='text/plain')
+        size = os.fstat(file.fileno()).st_size
+        byte_range = _requested_range(request, etag, size)
+        if byte_range == 'unsatisfiable':
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range:
+            start, end = byte_range
+            response = FileResponse(_FileRange(file, start, end), status=206, as_attachment=True,
+                                    filename=filename, content_type='text/plain; charset=utf-8')
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(file, as_attachment=True, filename=filename,
+                                    content_type='text/plain; charset=utf-8')
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    if etag:
+        response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def _requested_range(request, etag, size):
+    """(first byte, last byte) of a single satisfiable Range, 'unsatisfiable', or None for the whole file"""
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and (not etag or etag not in parse_etags(if_range)):
+        return None  # The client's copy is not this one: send it all again
+    match = _RANGE.fullmatch(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Several ranges or another unit; sending the whole file is allowed
+    first, last = match.groups()
+    if not first:
+        # bytes=-N: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+class _FileRange:
+    """The bytes start to end (inclusive) of an open file, for FileResponse to stream"""
+
+    def __init__(self, file, start, end):
+        file.seek(start)
+        self.file = file
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
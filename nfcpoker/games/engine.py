@@ -0,0 +1,148 @@
+"""
+Single-pass hand state engine
+
+HandState follows one hand as iter_game_data() parses it, from the tokens
+the parser has already made, so every hand is replayed once while the file
+is read. It tracks every seat's stack, the chips each seat has put in
+and who folded.
+
+When the hand is over, finish() splits the chips put in into the main pot
+and side pots, checks the W- lines against them, and works out each seat's
+net result. Chips are counted all the way. When they do not add up, a
+problem is noted with the hand and nothing is raised:
+
+- a Stacks: line that differs from the previous hand's result
+- a seat putting in more chips than it has
+- winnings that do not add up to the pot, or a seat winning more than the
+  pots it was in
+- a Winner: line that differs from the winner's chips (checked by the parser)
+
+Amounts are what the sketch logs. c-, r- and A- are the chips the move adds
+to the seat's bets in the hand. A blind is the blind or the seat's whole
+stack, whichever is less. When all but one seat folded and no W- line
+follows (the sketch ends the game there), the last seat in takes the pot.
+"""
+from pokerlog import tokenizer
+
+_BET_KINDS = frozenset({tokenizer.CALL, tokenizer.RAISE, tokenizer.ALL_IN})
+
+
+class HandState:
+    """The chips of one hand; lists are by seat, seat N at index N - 1"""
+
+    __slots__ = ('start', 'stacks', 'put_in', 'won', 'folded', 'seen', 'problems', 'small_blind', 'big_blind')
+
+    def __init__(self, stacks, small_blind, big_blind):
+        self.start = list(stacks)
+        self.stacks = list(stacks)
+        self.put_in = [0] * len(stacks)
+        self.won = [0] * len(stacks)
+        self.folded = set()
+        self.seen = {}  # Seats with a line in the hand, in order of their first one
+        self.problems = []
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+
+    def set_stacks(self, stacks):
+        """Take the chips from the hand's Stacks: line, checking them against the previous hand's result"""
+        if self.start and list(stacks) != self.start:
+            self.problems.append(f"Stacks {list(stacks)} differ from {self.start} after the previous hand")
+        self._grow(len(stacks))
+        self.start = list(stacks) + self.start[len(stacks):]
+        self.stacks = [chips - put_in for chips, put_in in zip(self.start, self.put_in)]
+
+    def _grow(self, seats):
+        for values in (self.start, self.stacks, self.put_in, self.won):
+            values.extend([0] * (seats - len(values)))
+
+    def apply(self, token):
+        """Apply one tokenized line of the hand"""
+        seat = token.player
+        if seat is None:
+            return
+        if seat not in self.seen:
+            if seat < 1:
+                return
+            if seat > len(self.stacks):
+                self._grow(seat)
+            self.seen[seat] = None
+        kind = token.kind
+
+        if kind == tokenizer.HOLE_CARD:
+            pass  # Most lines are hole cards, and they only say the seat was dealt in
+        elif kind in _BET_KINDS:
+            self._put(seat, token.amount)
+        elif kind == tokenizer.POST_SB:
+            self._put(seat, min(self.small_blind, max(self.stacks[seat - 1], 0)))
+        elif kind == tokenizer.POST_BB:
+            self._put(seat, min(self.big_blind, max(self.stacks[seat - 1], 0)))
+        elif kind == tokenizer.FOLD:
+            self.folded.add(seat)
+        elif kind == tokenizer.WIN:
+            self.won[seat - 1] += token.amount
+
+    def _put(self, seat, amount):
+        index = seat - 1
+        if amount > self.stacks[index]:
+            self.problems.append(f"P{seat} put in {amount} with {self.stacks[index]} left")
+        self.stacks[index] -= amount
+        self.put_in[index] += amount
+
+    def pots(self):
+        """The main pot then the side pots, as {'amount', 'players'} with the seats that can win each"""
+        live = [seat for seat in self.seen if seat not in self.folded]
+        levels = sorted({self.put_in[seat - 1] for seat in live})
+        if len(levels) == 1 and levels[0]:
+            # Nobody all in for less: one pot (by far the most common case)
+            return [{'amount': sum(self.put_in), 'players': sorted(live)}]
+        pots = []
+        previous = 0
+        for level in levels:
+            amount = sum(min(put_in, level) - min(put_in, previous) for put_in in self.put_in)
+            if amount:
+                pots.append({'amount': amount, 'players': sorted(seat for seat in live if self.put_in[seat - 1] >= level)})
+            previous = level
+        # Chips folded seats put in above the last seat in
+        leftover = sum(self.put_in) - sum(pot['amount'] for pot in pots)
+        if leftover and pots:
+            pots[-1]['amount'] += leftover
+        elif leftover:
+            pots.append({'amount': leftover, 'players': []})
+        return pots
+
+    def finish(self):
+        """
+        Settle the hand; returns (hand fields, stacks after the hand)
+
+        The fields are 'bets' (chips each seat put in), 'pots', 'net' (each
+        seat's result) and 'problems'.
+        """
+        pots = self.pots()
+        put_in, won = self.put_in, self.won
+        total = sum(put_in)
+        won_total = sum(won)
+        if not won_total:
+            live = [seat for seat in self.seen if seat not in self.folded]
+            if len(live) == 1:
+                won[live[0] - 1] = total
+            elif total:
+                self.problems.append(f"The pot of {total} was not won by anyone")
+        elif won_total != total:
+            self.problems.append(f"Winnings of {won_total} do not add up to the pot of {total}")
+
+        net = {seat: -put_in[seat - 1] for seat in self.seen}
+        for seat, amount in enumerate(won, 1):
+            if not amount:
+                continue
+            net[seat] = amount - put_in[seat - 1]
+            eligible = sum(pot['amount'] for pot in pots if seat in pot['players'])
+            if amount > eligible:
+                self.problems.append(f"P{seat} won {amount} but was only in pots worth {eligible}")
+
+        fields = {
+            'bets': {seat: put_in[seat - 1] for seat in self.seen},
+            'pots': pots,
+            'net': net,
+            'problems': self.problems,
+        }
+        return fields, [chips + amount for chips, amount in zip(self.stacks, won)]
@@ -0,0 +1,169 @@
+"""
+Showdown ranks and all-in equity for parsed hands
+
+The device logs every player's hole cards, so each hand can be replayed
+with the cards face up. annotate_hand() adds:
+
+- 'showdown': the made hand of every player who reached the river without
+  folding, ranked (1 = best).
+- 'equity': for each street, the share of the pot each player still in the
+  hand would win if everybody were all-in from there. From the flop on
+  every remaining board is enumerated exactly; preflop uses a vectorized
+  Monte Carlo sample of boards for the actual hole cards, seeded from the
+  hand so it is repeatable.
+- 'starting_hands': each player's starting hand class (AKs, 72o, ...) and
+  its equity against as many random hands as there were opponents, from the
+  preflop table (empty when the table has not been built).
+"""
+from itertools import combinations
+
+import numpy as np
+from pokerlog import tokenizer
+from pokerlog.tokenizer import tokenize_line
+
+from . import preflop
+from .evaluator import card_index, card_name, category_name, evaluate
+
+STREETS = [('preflop', 0), ('flop', 3), ('turn', 4), ('river', 5)]
+MONTE_CARLO_TRIALS = 2000
+
+
+def annotate_hand(hand):
+    """Add 'showdown', 'equity' and 'starting_hands' to a parsed hand dict, in place"""
+    return annotate_hands([hand])[0]
+
+
+def annotate_hands(hands):
+    """
+    annotate_hand() for a list of hands
+
+    Every board of every street of every hand is scored in a single
+    evaluate() call.
+    """
+    jobs = []  # (hand, street, board, hole cards, seats, run out count)
+    rows = []
+    for hand in hands:
+        hand['showdown'] = []
+        hand['equity'] = []
+        hand['starting_hands'] = []
+        cards = _hand_cards(hand)
+        if cards is None:
+            continue
+        hole, board, folded_at, used = cards
+        seed = [hand.get('hand_number') or 0] + used
+        hand['starting_hands'] = _starting_hands(hole)
+
+        for street, size in STREETS:
+            if len(board) < size:
+                break
+            # Players who had not folded by the end of this street
+            seats = [seat for seat in hole if folded_at.get(seat, 6) > size]
+            if len(seats) < 2:
+                break
+            boards = _boards([hole[seat] for seat in seats], board[:size], seed)
+            rows.append(_rows([hole[seat] for seat in seats], boards))
+            jobs.append((hand, street, board[:size], hole, seats, len(boards)))
+
+    values = evaluate(np.concatenate(rows)) if rows else None
+    offset = 0
+    for hand, street, board, hole, seats, count in jobs:
+        size = len(seats) * count
+        shares = _shares(values[offset:offset + size].reshape(len(seats), count))
+        offset += size
+        hand['equity'].append({
+            'street': street,
+            'board': [card_name(card) for card in board],
+            'players': {seat: round(100 * share, 1) for seat, share in zip(seats, shares)},
+        })
+        if street == 'river':
+            # The river "run out" is the real board: rank the hands shown down
+            river = values[offset - size:offset].reshape(len(seats), count)[:, 0].tolist()
+            order = sorted(set(river), reverse=True)
+            hand['showdown'] = [{
+                'player': seat,
+                'cards': [card_name(card) for card in hole[seat]],
+                'hand': category_name(value),
+                'rank': order.index(value) + 1,
+            } for seat, value in sorted(zip(seats, river), key=lambda item: -item[1])]
+    return hands
+
+
+def _starting_hands(hole):
+    """Each player's starting hand class and its equity against the number of opponents dealt in"""
+    if preflop.get_table() is None:
+        return []
+    starting = []
+    for seat, cards in sorted(hole.items()):
+        equity = preflop.field_equity(cards, len(hole) - 1)
+        starting.append({
+            'player': seat,
+            'hand': preflop.class_name(preflop.hand_class(*cards)),
+            'equity': None if equity is None else round(100 * equity, 1),
+        })
+    return starting
+
+
+def _hand_cards(hand):
+    """Return (hole cards by seat, board, board size when each seat folded, all cards) as card indexes"""
+    hole = {}
+    board = []
+    folded_at = {}
+    try:
+        for line in hand['actions']:
+            token = tokenize_line(line)
+            if token.kind == tokenizer.HOLE_CARD:
+                hole.setdefault(token.player, []).extend(card_index(card) for card in token.cards)
+            elif token.kind == tokenizer.COMMUNITY:
+                board.extend(card_index(card) for card in token.cards)
+            elif token.kind == tokenizer.FOLD:
+                folded_at.setdefault(token.player, len(board))
+    except (KeyError, ValueError):
+        return None  # Misread card, nothing can be evaluated
+
+    hole = {seat: cards for seat, cards in hole.items() if len(cards) == 2}
+    used = [card for cards in hole.values() for card in cards] + board
+    if len(set(used)) != len(used) or len(board) > 5:
+        return None  # A card seen twice is a misread as well
+    return hole, board, folded_at, used
+
+
+def equity(holes, board, seed=0, trials=MONTE_CARLO_TRIALS):
+    """
+    Return each player's share of the pot over the possible run outs
+
+    holes is a list of [card, card] per player and board the 0-5 community
+    cards so far, all as card indexes. Ties split the pot.
+    """
+    boards = _boards(holes, board, seed, trials)
+    return _shares(evaluate(_rows(holes, boards)).reshape(len(holes), len(boards)))
+
+
+def _boards(holes, board, seed, trials=MONTE_CARLO_TRIALS):
+    """Every possible complete board (from the flop on) or a random sample of them (preflop)"""
+    dead = set(board) | {card for cards in holes for card in cards}
+    deck = np.array([card for card in range(52) if card not in dead])
+    missing = 5 - len(board)
+
+    if missing == 0:
+        runouts = np.zeros((1, 0), dtype=np.int64)
+    elif len(board) >= 3:
+        runouts = np.array(list(combinations(deck, missing)))
+    else:
+        # A random missing-card subset of the deck per trial
+        rng = np.random.default_rng(seed)
+        runouts = deck[np.argpartition(rng.random((trials, len(deck))), missing, axis=1)[:, :missing]]
+    return np.hstack([np.broadcast_to(np.array(board, dtype=np.int64), (len(runouts), len(board))), runouts])
+
+
+def _rows(holes, boards):
+    """One 7-card row per player per board, player by player"""
+    return np.concatenate([
+        np.hstack([np.broadcast_to(np.array(cards, dtype=np.int64), (len(boards), 2)), boards])
+        for cards in holes
+    ])
+
+
+def _shares(values):
+    """Pot share of each player (row) averaged over the boards (columns), ties split"""
+    winners = values == values.max(axis=0)
+    return (winners / winners.sum(axis=0)).mean(axis=1).tolist()
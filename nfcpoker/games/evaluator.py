@@ -0,0 +1,153 @@
+"""
+Vectorized poker hand evaluator
+
+Cards are ints 0-51 (rank * 4 + suit, rank 0 = '2' ... 12 = 'A') and are
+parsed from the log's RANK-SUIT notation (A-H, 10-D) with card_index().
+evaluate() scores an (N, 5..7) array of hands at once: rank and suit
+counts are packed four bits per rank (or suit) into one integer per hand,
+turned into 13-bit masks of the ranks seen at least 1-4 times, and the
+category and kickers are read from precomputed tables indexed by those
+masks. Higher values are better hands and equal values are ties.
+
+Values are category << 20 | kickers, four bits per kicker rank.
+"""
+import numpy as np
+from pokerlog.tokenizer import RANKS, SUITS
+
+CATEGORIES = [
+    'High Card', 'Pair', 'Two Pair', 'Three of a Kind', 'Straight',
+    'Flush', 'Full House', 'Four of a Kind', 'Straight Flush',
+]
+HIGH_CARD, PAIR, TWO_PAIR, TRIPS, STRAIGHT, FLUSH, FULL_HOUSE, QUADS, STRAIGHT_FLUSH = range(len(CATEGORIES))
+CATEGORY_SHIFT = 20
+
+_RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+_SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+
+
+def card_index(card):
+    """'10-D' -> 34"""
+    rank, _, suit = card.strip().partition('-')
+    return _RANK_INDEX[rank] * 4 + _SUIT_INDEX[suit]
+
+
+def card_name(index):
+    """34 -> '10-D'"""
+    return f"{RANKS[index // 4]}-{SUITS[index % 4]}"
+
+
+def category_name(value):
+    return CATEGORIES[int(value) >> CATEGORY_SHIFT]
+
+
+def _build_tables():
+    masks = np.arange(1 << 13)
+    bits = (masks[:, None] >> np.arange(13)) & 1  # (8192, 13), bit r set if rank r is present
+
+    # Highest rank present, -1 for none
+    high = np.where(masks > 0, np.floor(np.log2(np.maximum(masks, 1))).astype(np.int64), -1)
+
+    # Masks of the 1..5 highest ranks present
+    top = np.zeros((6, 1 << 13), dtype=np.int64)
+    remaining = masks.copy()
+    for n in range(1, 6):
+        bit = np.where(remaining > 0, 1 << np.maximum(high[remaining], 0), 0)
+        top[n] = top[n - 1] | bit
+        remaining = remaining & ~bit
+
+    # The present ranks as nibbles, highest first (for masks of up to 5 ranks)
+    pack = np.zeros(1 << 13, dtype=np.int64)
+    for rank in range(13):
+        below = bits[:, :rank].sum(axis=1)  # Ranks present under this one decide its nibble
+        pack += np.where(bits[:, rank] == 1, rank << (4 * below), 0)
+
+    # Top rank of the best straight, -1 for none; A-2-3-4-5 counts as 5 high
+    straight = np.full(1 << 13, -1, dtype=np.int64)
+    wheel = (1 << 12) | 0b1111
+    straight[(masks & wheel) == wheel] = 3
+    for top_rank in range(4, 13):
+        run = 0b11111 << (top_rank - 4)
+        straight[(masks & run) == run] = top_rank
+
+    return high, top, pack, straight
+
+
+HIGH, TOP, PACK, STRAIGHT_HIGH = _build_tables()
+
+
+# The low bit of each nibble of a 16-bit word -> a 4-bit mask
+_NIBBLE_BITS = sum(((np.arange(1 << 16) >> (4 * i)) & 1) << i for i in range(4))
+_NIBBLE_LOW = 0x1111111111111  # Low bit of each of 13 nibbles
+
+
+def _rank_mask(flags):
+    """Compress per-rank nibble flags (bit 4 * rank) to a 13-bit rank mask"""
+    return (
+        _NIBBLE_BITS[flags & 0xFFFF]
+        | _NIBBLE_BITS[(flags >> 16) & 0xFFFF] << 4
+        | _NIBBLE_BITS[(flags >> 32) & 0xFFFF] << 8
+        | ((flags >> 48) & 1) << 12
+    )
+
+
+def evaluate(cards):
+    """Score each row of an (N, 5..7) int array of card indexes; returns an (N,) int64 array"""
+    cards = np.asarray(cards, dtype=np.int64)
+    ranks = cards >> 2
+    suits = cards & 3
+
+    # Count of each rank in a nibble per rank, then bitmasks of ranks seen at least 1..4 times
+    counts = (1 << (ranks << 2)).sum(axis=1)
+    b0 = counts & _NIBBLE_LOW
+    b1 = (counts >> 1) & _NIBBLE_LOW
+    b2 = (counts >> 2) & _NIBBLE_LOW
+    m1 = _rank_mask(b0 | b1 | b2)
+    m2 = _rank_mask(b1 | b2)
+    m3 = _rank_mask(b2 | (b1 & b0))
+    m4 = _rank_mask(b2)
+
+    # Count of each suit in a nibble per suit; 5+ (0b101 and up) is a flush
+    suit_counts = (1 << (suits << 2)).sum(axis=1)
+    flush_flags = (suit_counts >> 2) & (suit_counts | (suit_counts >> 1)) & 0x1111
+    has_flush = flush_flags != 0
+    flush_mask = np.zeros(len(cards), dtype=np.int64)
+    flushes = np.flatnonzero(has_flush)
+    if len(flushes):
+        flags = flush_flags[flushes]
+        flush_suit = (flags >= 0x10).astype(np.int64) + (flags >= 0x100) + (flags >= 0x1000)
+        in_suit = suits[flushes] == flush_suit[:, None]
+        flush_mask[flushes] = np.where(in_suit, 1 << ranks[flushes], 0).sum(axis=1)
+
+    quads = HIGH[m4]
+    trips = HIGH[m3]
+    pair = HIGH[m2]
+    straight_flush = STRAIGHT_HIGH[flush_mask]
+    straight = STRAIGHT_HIGH[m1]
+    quads_bit = 1 << np.maximum(quads, 0)
+    trips_bit = np.where(trips >= 0, 1 << np.maximum(trips, 0), 0)
+    pair_bit = 1 << np.maximum(pair, 0)
+    # Full house: the best trips plus the best other pair (a second trips counts as the pair)
+    full_pair = HIGH[m2 & ~trips_bit]
+    top_two_pairs = TOP[2][m2]
+
+    conditions = [
+        straight_flush >= 0,
+        quads >= 0,
+        (trips >= 0) & (full_pair >= 0),
+        has_flush,
+        straight >= 0,
+        trips >= 0,
+        (m2 & ~pair_bit) != 0,
+        pair >= 0,
+    ]
+    choices = [
+        (STRAIGHT_FLUSH << CATEGORY_SHIFT) | straight_flush,
+        (QUADS << CATEGORY_SHIFT) | (quads << 4) | HIGH[m1 & ~quads_bit],
+        (FULL_HOUSE << CATEGORY_SHIFT) | (trips << 4) | full_pair,
+        (FLUSH << CATEGORY_SHIFT) | PACK[TOP[5][flush_mask]],
+        (STRAIGHT << CATEGORY_SHIFT) | straight,
+        (TRIPS << CATEGORY_SHIFT) | (trips << 8) | PACK[TOP[2][m1 & ~trips_bit]],
+        (TWO_PAIR << CATEGORY_SHIFT) | (PACK[top_two_pairs] << 4) | HIGH[m1 & ~top_two_pairs],
+        (PAIR << CATEGORY_SHIFT) | (pair << 12) | PACK[TOP[3][m1 & ~pair_bit]],
+    ]
+    return np.select(conditions, choices, default=PACK[TOP[5][m1]])
@@ -0,0 +1,213 @@
+"""
+Spectator feed for live games
+
+Spectators of a live game get its log lines as server-sent events, as the
+recorder in games.live writes them. The feed only streams when the site is
+served by an ASGI server (uvicorn/daphne nfcpoker.asgi:application).
+
+Every game being watched has one GameFeed per event loop. The GameFeed tails
+the game's live log and keeps its latest lines in memory (at least
+WINDOW_LINES of them). Spectators do not get their own copy of the lines.
+Each one keeps a cursor into the shared window and waits for the feed's
+next change. However many spectators there are, the file is tailed by one
+task and the database is not touched.
+
+A slow spectator holds up nobody else. It falls behind, and its next event
+carries every line it missed (up to MAX_EVENT_LINES). The event id is the
+number of lines sent so far. An EventSource sends it back as Last-Event-ID
+when it reconnects, and the feed catches up from there. Lines that have
+already left the window are read back from the log, so a long game costs a
+bounded amount of memory however far back a spectator starts. The feed
+keeps the log open until its last spectator leaves, so they can be read
+back after the game is over and the log deleted too.
+
+The recorder deletes the live log when the game ends (see
+LiveRecorder.finish). The feed then sends the rest of the lines and an
+'end' event, and stops.
+"""
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Seconds between looks at the end of a live log, shared by all its spectators
+POLL_INTERVAL = 0.2
+# Seconds without lines before a spectator is sent a comment to keep the connection open
+KEEPALIVE_INTERVAL = 15
+# Most lines sent in one event to a spectator catching up
+MAX_EVENT_LINES = 500
+# Recent lines kept in memory; the window is cut back to this when it holds twice as many
+WINDOW_LINES = 5000
+# Milliseconds an EventSource waits before reconnecting
+RETRY_MS = 2000
+# Seconds a feed with no spectators is kept, so reconnecting ones find its lines in memory
+IDLE_TIMEOUT = 30
+
+# (event loop, game id) -> GameFeed
+_feeds = {}
+
+
+class GameFeed:
+    """The lines of one live game's log, shared by everyone watching it"""
+
+    def __init__(self, game_id, path):
+        self.game_id = game_id
+        self.path = path
+        self.lines = []  # The window of recent lines
+        self.first = 0   # Number of the window's first line (lines before it were dropped)
+        self.ended = False    # The game is over
+        self.stopped = False  # No longer tailing the log: the game is over or nobody watched
+        self.spectators = 0
+        self._changed = asyncio.get_running_loop().create_future()
+        self._task = None
+        self._fd = None
+
+    def start(self):
+        """Open the log and start tailing it; returns False when there is no live log"""
+        try:
+            self._fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        self._task = asyncio.create_task(self._tail(self._fd))
+        return True
+
+    async def _tail(self, fd):
+        pending = b''
+        offset = 0
+        idle = 0
+        try:
+            while idle < IDLE_TIMEOUT:
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    offset += len(chunk)
+                    *lines, pending = (pending + chunk).split(b'\n')
+                    self._publish([line.decode('utf-8', 'replace').strip() for line in lines if line.strip()])
+                    continue
+
+                info = os.fstat(fd)
+                if info.st_nlink == 0:
+                    # The game is over; its last lines were read before the log was removed
+                    self.ended = True
+                    break
+                if info.st_size < offset:
+                    # The recorder cut off a partial line when it resumed, or a resent hand's stale lines
+                    pending = pending[:max(0, len(pending) - (offset - info.st_size))]
+                    offset = info.st_size
+                    os.lseek(fd, offset, os.SEEK_SET)
+                await asyncio.sleep(POLL_INTERVAL)
+                idle = 0 if self.spectators else idle + POLL_INTERVAL
+        except Exception:
+            logger.exception('Feed for game #%s stopped', self.game_id)
+        finally:
+            self.stopped = True
+            self._notify()
+            key = (asyncio.get_running_loop(), self.game_id)
+            if _feeds.get(key) is self:
+                del _feeds[key]
+            self._close_if_unused()
+
+    def _close_if_unused(self):
+        """Close the log once it is no longer tailed and nobody is left to read lines back from it"""
+        if self.stopped and not self.spectators and self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def count(self):
+        """Lines read from the log so far"""
+        return self.first + len(self.lines)
+
+    def _publish(self, lines):
+        if lines:
+            self.lines += lines
+            if len(self.lines) >= 2 * WINDOW_LINES:
+                dropped = len(self.lines) - WINDOW_LINES
+                del self.lines[:dropped]
+                self.first += dropped
+            self._notify()
+
+    def _notify(self):
+        self._changed.set_result(None)
+        self._changed = asyncio.get_running_loop().create_future()
+
+    async def events(self, after=0):
+        """Server-sent events with the lines after the first `after`, until the game ends"""
+        self.spectators += 1
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            sent = max(0, min(after, self.count))
+            while True:
+                if sent < self.first:
+                    if self._fd is None:
+                        return  # The feed stopped before this spectator started; the EventSource reconnects
+                    # Lines no longer in the window: read them back from the log
+                    older = (await asyncio.to_thread(_read_fd_lines, self._fd))[sent:self.first]
+                    for start in range(0, len(older), MAX_EVENT_LINES):
+                        batch = older[start:start + MAX_EVENT_LINES]
+                        sent += len(batch)
+                        yield _event(batch, sent)
+                elif sent < self.count:
+                    start = sent - self.first
+                    batch = self.lines[start:start + MAX_EVENT_LINES]
+                    sent += len(batch)
+                    yield _event(batch, sent)
+                elif self.ended:
+                    yield f'event: end\nid: {sent}\ndata: {sent}\n\n'
+                    return
+                elif self.stopped:
+                    return  # The EventSource reconnects and catches up from a new feed
+                else:
+                    try:
+                        # Shielded: the future is shared with every other spectator
+                        await asyncio.wait_for(asyncio.shield(self._changed), KEEPALIVE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        yield ': keepalive\n\n'
+        finally:
+            self.spectators -= 1
+            self._close_if_unused()
+
+
+def _event(lines, last_id):
+    data = ''.join(f'data: {line}\n' for line in lines)
+    return f'id: {last_id}\n{data}\n'
+
+
+def get_feed(game_id, path):
+    """The running feed of a game for this event loop, started if needed; None when the game is not live"""
+    key = (asyncio.get_running_loop(), game_id)
+    feed = _feeds.get(key)
+    if feed is None or feed.stopped:
+        feed = GameFeed(game_id, path)
+        if not feed.start():
+            return None
+        _feeds[key] = feed
+    return feed
+
+
+def read_lines(path, after=0):
+    """The complete lines of a live log after the first `after`, or None when there is no live log"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return _complete_lines(data)[after:]
+
+
+def _read_fd_lines(fd):
+    """The complete lines of an open log, read without moving its offset (the tail task reads from it)"""
+    return _complete_lines(os.pread(fd, os.fstat(fd).st_size, 0))
+
+
+def _complete_lines(data):
+    lines = [line.strip() for line in data[:data.rfind(b'\n') + 1].decode('utf-8', 'replace').splitlines()]
+    return [line for line in lines if line]
+
+
+def snapshot_event(lines, after):
+    """The lines after `after` as one event, for a server that cannot stream (EventSource polls instead)"""
+    text = f'retry: {RETRY_MS}\n\n'
+    if lines:
+        text += _event(lines, after + len(lines))
+    return text
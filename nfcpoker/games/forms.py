@@ -1,4 +1,7 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.utils import timezone
 from .models import Game
 
 
@@ -34,4 +37,57 @@ class GameForm(forms.ModelForm):
         # Make name field not required
         self.fields['name'].required = False
         # Make game_data required
-        self.fields['game_data'].required = True
\ No newline at end of file
+        self.fields['game_data'].required = True
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """A FileField that cleans to a list of every selected file"""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        clean_file = super().clean
+        if isinstance(data, (list, tuple)):
+            return [clean_file(file, initial) for file in data]
+        return [clean_file(data, initial)]
+
+
+class GameImportForm(forms.Form):
+    """Many game files at once, or a zip of a Records folder (see games.imports)"""
+    player_number = forms.IntegerField(
+        min_value=1, max_value=6, label='Your Player Number',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Enter player number'})
+    )
+    files = MultipleFileField(
+        label='Game Files (.txt) or Records Folder (.zip)',
+        widget=MultipleFileInput(attrs={'class': 'form-control', 'accept': '.txt,.zip'})
+    )
+
+
+class GameFilterForm(forms.Form):
+    """Optional filters for the games list, all served from the (user, created_at) index"""
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    min_profit = forms.IntegerField(required=False, widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Min $'}))
+    max_profit = forms.IntegerField(required=False, widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Max $'}))
+
+    def filter(self, games):
+        """Apply the valid filters to a Game queryset"""
+        if not self.is_valid():
+            return games
+        data = self.cleaned_data
+        if data['date_from']:
+            games = games.filter(created_at__gte=timezone.make_aware(datetime.combine(data['date_from'], time.min)))
+        if data['date_to']:
+            day_after = datetime.combine(data['date_to'], time.min) + timedelta(days=1)
+            games = games.filter(created_at__lt=timezone.make_aware(day_after))
+        if data['min_profit'] is not None:
+            games = games.filter(profit__gte=data['min_profit'])
+        if data['max_profit'] is not None:
+            games = games.filter(profit__lte=data['max_profit'])
+        return games
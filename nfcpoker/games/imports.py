@@ -0,0 +1,244 @@
+"""
+Bulk import of game files
+
+A whole SD card Records folder (NFC_INF0.txt, NFC_INF1.txt, ...) can be
+imported at once, as many .txt files or a zip of them. Distinct files are
+parsed in parallel in a process pool, where their hands are also turned
+into Hand and Action rows (games.history) and their binary logs
+(pokerlog.binlog) are encoded, so the main process only writes.
+The blobs, parses and games are inserted with bulk_create in one
+transaction. bulk_create skips Game.save() and its signals, so blob
+reference counts and UserStats are updated here directly. Files of new
+blobs are written inside that transaction and deleted again if it rolls
+back.
+
+import_games() returns one report row per file: 'imported', 'duplicate'
+(the user already has this file as this player), 'skipped' (not a game
+file) or 'failed' with the reason.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+
+import django
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from pokerlog import binlog
+
+from .blobs import delete_blob_files
+from .cache import binary_log_path, parse_game_file, save_binary_log, store_parses
+from .downloads import gzip_path, save_gzip_copy
+from .history import hand_records, record_hands
+from .models import Game, GameBlob, ParsedGame, UserStats
+from .parser import PARSER_VERSION, iter_lines
+
+IMPORTED, DUPLICATE, SKIPPED, FAILED = 'imported', 'duplicate', 'skipped', 'failed'
+
+# Upper bound on the uncompressed size of one import, zips included
+MAX_IMPORT_BYTES = 200 * 1024 * 1024
+
+
+def import_games(user, player_number, uploads, workers=None):
+    """
+    Import game files for a user, who was player_number in all of them
+
+    uploads is a list of (name, file object or bytes); .zip uploads are
+    expanded. Returns the report rows in file name order.
+    """
+    report = []
+    files = []  # (name, content, sha256)
+    for name, content in sorted(_expand(uploads, report), key=lambda item: _natural_key(item[0])):
+        files.append((name, content, hashlib.sha256(content).hexdigest()))
+
+    # Files this user already imported as this player, and repeats within the upload
+    imported = set(Game.objects.filter(
+        user=user, player_number=player_number, content_hash__in={sha256 for _, _, sha256 in files}
+    ).values_list('content_hash', flat=True))
+    first_names = {}
+    new_files = []
+    for name, content, sha256 in files:
+        if sha256 in imported:
+            report.append(_row(name, DUPLICATE, error='Already imported'))
+        elif sha256 in first_names:
+            report.append(_row(name, DUPLICATE, error=f'Same file as {first_names[sha256]}'))
+        else:
+            first_names[sha256] = name
+            new_files.append((name, content, sha256))
+
+    parses, errors = _parse_all(new_files, workers)
+    games = []
+    names = []
+    written = []  # Files of the blobs this import created
+    try:
+        with transaction.atomic():
+            blobs = _store_blobs(new_files, parses, written)
+            store_parses(parses)
+            for name, _, sha256 in new_files:
+                if sha256 in errors:
+                    continue
+                profits = parses[sha256]['profits']
+                names.append(name)
+                games.append(Game(
+                    user=user,
+                    player_number=player_number,
+                    name=PurePosixPath(name).stem,
+                    profit=profits[player_number - 1] if 1 <= player_number <= len(profits) else 0,
+                    game_data=blobs[sha256].file.name,
+                    content_hash=sha256,
+                    blob=blobs[sha256],
+                    parser_version=PARSER_VERSION,
+                ))
+            Game.objects.bulk_create(games)
+
+            # Totals for the games list, normally kept by the post_save signal
+            UserStats.rebuild(user.id)
+            for game in games:
+                record_hands(game, parses[game.content_hash].get('records'))
+    except Exception:
+        # Rolled back: no blob row points at these files any more
+        for file in written:
+            delete_blob_files(file)
+        raise
+
+    for name, _, sha256 in new_files:
+        if sha256 in errors:
+            report.append(_row(name, FAILED, error=errors[sha256]))
+
+    for name, game in zip(names, games):
+        report.append(_row(
+            name, IMPORTED, game_id=game.id, profit=game.profit, hands=parses[game.content_hash]['hand_count']
+        ))
+    report.sort(key=lambda row: _natural_key(row['file']))
+    return report
+
+
+def _row(name, status, game_id=None, profit=None, hands=None, error=''):
+    return {'file': name, 'status': status, 'game_id': game_id, 'profit': profit, 'hands': hands, 'error': error}
+
+
+def _natural_key(name):
+    """NFC_INF2 sorts before NFC_INF10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def _expand(uploads, report):
+    """Yield (name, bytes) for every .txt upload and every .txt inside a .zip upload"""
+    total = 0
+    for name, content in uploads:
+        data = content if isinstance(content, bytes) else content.read()
+        if name.lower().endswith('.zip') or zipfile.is_zipfile(io.BytesIO(data)):
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile as e:
+                report.append(_row(name, FAILED, error=f'Bad zip file: {e}'))
+                continue
+            for info in archive.infolist():
+                path = PurePosixPath(info.filename)
+                if info.is_dir() or '__MACOSX' in path.parts or path.name.startswith('.'):
+                    continue
+                entry = f"{name}/{info.filename}"
+                if path.suffix.lower() != '.txt':
+                    report.append(_row(entry, SKIPPED, error='Not a .txt file'))
+                    continue
+                total += info.file_size
+                if total > MAX_IMPORT_BYTES:
+                    raise ValueError(f'Import is larger than {MAX_IMPORT_BYTES // (1024 * 1024)} MB')
+                yield entry, archive.read(info)
+        elif name.lower().endswith('.txt'):
+            total += len(data)
+            if total > MAX_IMPORT_BYTES:
+                raise ValueError(f'Import is larger than {MAX_IMPORT_BYTES // (1024 * 1024)} MB')
+            yield name, data
+        else:
+            report.append(_row(name, SKIPPED, error='Not a .txt or .zip file'))
+
+
+def _parse_all(files, workers):
+    """Parse each distinct new file once; returns ({sha256: ParsedGame fields}, {sha256: error})"""
+    parses = {}
+    errors = {}
+    cached = ParsedGame.objects.defer('summary', 'hands').filter(
+        content_hash__in={sha256 for _, _, sha256 in files}, parser_version=PARSER_VERSION
+    )
+    for parsed in cached:
+        if parsed.hand_count:
+            parses[parsed.content_hash] = {'profits': parsed.profits, 'hand_count': parsed.hand_count, 'cached': True}
+        else:
+            errors[parsed.content_hash] = 'No hands found'
+
+    todo = {sha256: content for _, content, sha256 in files if sha256 not in parses and sha256 not in errors}
+    workers = min(workers or os.cpu_count() or 1, len(todo))
+    if workers > 1:
+        # Workers started with spawn or forkserver need their own django.setup()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            results = list(pool.map(_parse, todo.values(), chunksize=max(1, len(todo) // (workers * 4))))
+    else:
+        results = [_parse(content) for content in todo.values()]
+
+    for sha256, (fields, error) in zip(todo, results):
+        if error:
+            errors[sha256] = error
+        else:
+            fields['hand_count'] = max(len(fields['hand_offsets']) - 1, 0)
+            parses[sha256] = fields
+    return parses, errors
+
+
+def _parse(content):
+    """
+    Process pool task: (ParsedGame fields, None) or (None, error message)
+
+    The game's hand_records() and binary log are worked out here as well,
+    as 'records' and 'binlog', so the main process only has to write them.
+    """
+    try:
+        fields = parse_game_file(io.BytesIO(content))
+        if len(fields['hand_offsets']) < 2:
+            return None, 'No hands found'
+        fields['records'] = hand_records(json.loads(fields['summary']), json.loads(f"[{fields['hands']}]"))
+        fields['binlog'] = binlog.encode(iter_lines(io.BytesIO(content)))
+    except Exception as e:
+        return None, f'Error parsing game data: {e}'
+    return fields, None
+
+
+def _store_blobs(files, parses, written):
+    """
+    Store each parsed file's content unless a blob has it already and take a reference; returns {sha256: GameBlob}
+
+    The files of the blobs created are added to written.
+    """
+    contents = {sha256: content for _, content, sha256 in files if sha256 in parses}
+    existing = set(GameBlob.objects.filter(sha256__in=contents).values_list('sha256', flat=True))
+
+    new_blobs = []
+    for sha256, content in contents.items():
+        if sha256 not in existing:
+            blob = GameBlob(sha256=sha256, size=len(content), ref_count=0)
+            blob.file.save(f"{sha256}.txt", ContentFile(content), save=False)
+            written.append(blob.file)
+            new_blobs.append(blob)
+    # A blob stored by a concurrent upload in the meantime wins, and our copy of its file goes
+    GameBlob.objects.bulk_create(new_blobs, ignore_conflicts=True)
+    blobs = GameBlob.objects.in_bulk(list(contents), field_name='sha256')
+    for blob in new_blobs:
+        if blobs[blob.sha256].file.name != blob.file.name:
+            written.remove(blob.file)
+            blob.file.delete(save=False)
+
+    for sha256, blob in blobs.items():
+        if not os.path.exists(binary_log_path(blob.file)):
+            # Encoded by the parse worker, unless the parse was cached
+            save_binary_log(blob.file, parses[sha256].get('binlog'))
+        if not os.path.exists(gzip_path(blob.file)):
+            save_gzip_copy(blob.file)
+
+    # Files are distinct within an import, so each blob gains one game
+    GameBlob.objects.filter(sha256__in=contents).update(ref_count=F('ref_count') + 1)
+    return blobs
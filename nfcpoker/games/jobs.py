@@ -0,0 +1,191 @@
+"""
+Database-backed background jobs
+
+Work too slow for a request (parsing an upload, working out its profit,
+recording its hands) is queued as a Job row and run by `manage.py run_jobs`.
+No broker is needed. Workers poll the table and claim a job with a
+conditional UPDATE, so two workers never run the same job.
+
+A failed job is retried with exponential backoff until it has been tried
+max_attempts times. A job whose worker died is treated as failed once it
+has been running for longer than JOB_TIMEOUT. A game's status and
+status_message follow its job, so the games list can show progress, and
+so do a GameImport's for the import page.
+
+Files uploaded on the import page are stored under IMPORT_UPLOAD_DIR until
+their job has imported them (games.imports), so the request only writes
+them and the parsing runs in the worker.
+"""
+import os
+import traceback
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import binary_log_path, get_game_profit, save_binary_log
+from .history import record_hands
+from .imports import import_games
+from .models import Game, GameImport, Job
+from .parser import PARSER_VERSION
+
+PROCESS_GAME = 'process_game'
+IMPORT_GAMES = 'import_games'
+
+# Where files uploaded on the import page wait for their job
+IMPORT_UPLOAD_DIR = 'game_files/imports'
+
+# Delay before the first retry, doubled for every further attempt
+RETRY_DELAY = timedelta(seconds=10)
+JOB_TIMEOUT = timedelta(minutes=10)
+
+# Job kind -> function taking the Job
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, game=None, max_attempts=3, game_import=None):
+    return Job.objects.create(
+        kind=kind, game=game, game_import=game_import, max_attempts=max_attempts, run_after=timezone.now()
+    )
+
+
+def enqueue_game(game):
+    """Mark a saved game as pending and queue its processing"""
+    if game.status != Game.PENDING or game.status_message:
+        game.status, game.status_message = Game.PENDING, ''
+        # Saved, not updated, so games.signals takes a processed game out of UserStats until it is done again
+        game.save(update_fields=['status', 'status_message', 'updated_at'])
+    return enqueue(PROCESS_GAME, game)
+
+
+def enqueue_import(user, player_number, files):
+    """Store files uploaded for games.imports and queue their import; returns the GameImport"""
+    stored = []
+    try:
+        for file in files:
+            name = default_storage.save(f"{IMPORT_UPLOAD_DIR}/{default_storage.get_valid_name(file.name)}", file)
+            stored.append([file.name, name])
+        with transaction.atomic():
+            game_import = GameImport.objects.create(user=user, player_number=player_number, files=stored)
+            enqueue(IMPORT_GAMES, game_import=game_import)
+    except Exception:
+        _delete_uploads(stored)
+        raise
+    return game_import
+
+
+def claim_job(worker):
+    """Take the oldest due job for this worker; returns None when there is none"""
+    now = timezone.now()
+    for job in Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - JOB_TIMEOUT):
+        _failed(job, f'Timed out on worker {job.locked_by}')
+
+    candidates = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        # Only one worker's update can still see the job queued
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.select_related('game', 'game_import').get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job and record how it went; returns True on success"""
+    try:
+        HANDLERS[job.kind](job)
+    except Exception:
+        _failed(job, traceback.format_exc(limit=5))
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_by='', last_error='', updated_at=timezone.now())
+    return True
+
+
+def run_pending(worker):
+    """Run every due job, one after the other; returns how many ran"""
+    count = 0
+    while (job := claim_job(worker)) is not None:
+        run_job(job)
+        count += 1
+    return count
+
+
+def _failed(job, error):
+    now = timezone.now()
+    retry = job.attempts < job.max_attempts
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.QUEUED if retry else Job.FAILED,
+        run_after=now + RETRY_DELAY * 2 ** max(job.attempts - 1, 0) if retry else job.run_after,
+        locked_by='',
+        last_error=error,
+        updated_at=now,
+    )
+    reason = error.strip().splitlines()[-1]
+    message = f'Attempt {job.attempts} of {job.max_attempts} failed, retrying: {reason}'
+    if job.game_id:
+        # Fetched again, the handler may have changed job.game before failing. Saved, not updated,
+        # so games.signals moves the games index's version.
+        game = Game.objects.get(pk=job.game_id)
+        if retry:
+            game.status_message = message
+        else:
+            game.status, game.status_message = Game.FAILED, reason
+        game.save(update_fields=['status', 'status_message', 'updated_at'])
+    if job.game_import_id:
+        if retry:
+            GameImport.objects.filter(pk=job.game_import_id).update(status_message=message, updated_at=now)
+        else:
+            files = job.game_import.files
+            GameImport.objects.filter(pk=job.game_import_id).update(
+                status=GameImport.FAILED, status_message=reason, files=[], updated_at=now
+            )
+            _delete_uploads(files)
+
+
+def _delete_uploads(files):
+    for _, name in files:
+        default_storage.delete(name)
+
+
+@handler(PROCESS_GAME)
+def process_game(job):
+    """Parse an uploaded game, set its profit, record its hands and write its binary log"""
+    game = job.game
+    with transaction.atomic():
+        # Profit comes from the file's cached parse, so identical uploads are parsed once
+        game.profit = get_game_profit(game)
+        game.parser_version = PARSER_VERSION
+        game.status, game.status_message = Game.READY, ''
+        game.save(update_fields=['profit', 'parser_version', 'status', 'status_message', 'updated_at'])
+
+        # Hands and actions as rows, for queries across games
+        record_hands(game)
+
+    # Binary copy for random access to hands (shared by every game with this file)
+    if not os.path.exists(binary_log_path(game.game_data)):
+        save_binary_log(game.game_data)
+
+
+@handler(IMPORT_GAMES)
+def import_uploads(job):
+    """Import the files uploaded for a GameImport, keep the report and delete the uploads"""
+    game_import = job.game_import
+    uploads = []
+    for name, stored in game_import.files:
+        with default_storage.open(stored, 'rb') as f:
+            uploads.append((name, f.read()))
+    report = import_games(game_import.user, game_import.player_number, uploads)
+    GameImport.objects.filter(pk=game_import.pk).update(
+        status=GameImport.DONE, status_message='', report=report, files=[], updated_at=timezone.now()
+    )
+    _delete_uploads(game_import.files)
@@ -0,0 +1,362 @@
+"""
+Live ingestion of games from the device
+
+The sketch writes every line of a game to the SD card with println. The
+same lines can be read from the device's serial port while the game is
+played, instead of waiting for the card to be uploaded afterwards.
+
+LiveRecorder turns a stream of lines into a Game with status 'live'. Every
+line it accepts is appended to a live log under game_files/live/ (which
+the spectator feed follows). Finished hands are batch inserted as Hand and
+Action rows. When the game's Winner: line arrives, the live log becomes
+the game's stored file and the game is queued for processing like an
+upload.
+
+Devices reconnect and resend, so lines are deduplicated by hand number. A
+hand:N seen before is dropped with everything up to the next new hand,
+and a resent current hand is matched against the lines already stored.
+Where the resend differs, the stored lines from there on are cut from the
+hand and the log, and the device's lines replace them.
+After a restart the recorder resumes the user's live game from its log.
+
+The line sources are async generators: serial_lines() for a serial port
+(needs pyserial) and file_lines() for a pty, FIFO or growing file standing
+in for one. ingest() runs a source into a recorder, flushing at least
+every FLUSH_INTERVAL seconds.
+"""
+import asyncio
+import logging
+import os
+import stat
+
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from pokerlog import tokenizer
+from pokerlog.tokenizer import tokenize_line
+
+from .history import append_hands, hand_records
+from .jobs import enqueue_game
+from .models import Game, Hand
+from .parser import iter_game_data
+
+logger = logging.getLogger(__name__)
+
+LIVE_DIR = 'game_files/live'
+
+# Most seconds between a line arriving and it being written out, and most lines per batch
+FLUSH_INTERVAL = 0.5
+MAX_BATCH = 500
+
+# Seconds to wait before reopening a lost connection, doubled up to the maximum
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+# Seconds between looking for more lines at the end of a regular file
+POLL_INTERVAL = 0.2
+
+HEADER_KINDS = {tokenizer.PLAYERS, tokenizer.POT, tokenizer.SMALL_BLIND, tokenizer.BIG_BLIND, tokenizer.GAME_START}
+
+
+class LiveRecorder:
+    """
+    Records the games in a stream of log lines for one user and seat
+
+    Not thread safe: feed() and flush() do database work, so async callers
+    run them with sync_to_async (see ingest()).
+    """
+
+    def __init__(self, user, player_number):
+        self.user = user
+        self.player_number = player_number
+        self.game = None
+        self._reset()
+
+    def _reset(self):
+        self.header_lines = []
+        self.hand_lines = None   # Lines of the hand being played, hand:N first
+        self.hand_number = None
+        self.hands_done = 0      # Finished hands, recorded or waiting in _finished
+        self._finished = []      # (position, lines) of finished hands not inserted yet
+        self._skipping = False   # Dropping a resent older hand
+        self._resent = 0         # Lines of a resent current hand still to match
+        self._log = None
+
+    def resume(self):
+        """Pick up the user's live game where its log ends, after a restart; returns the game or None"""
+        game = Game.objects.filter(user=self.user, player_number=self.player_number, status=Game.LIVE).order_by('-id').first()
+        if game is None or not default_storage.exists(game.game_data.name):
+            return None
+        self.game = game
+        path = default_storage.path(game.game_data.name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        # A line cut off by a crash is dropped; the device's resend will bring it back
+        data = data[:data.rfind(b'\n') + 1]
+        with open(path, 'r+b') as f:
+            f.truncate(len(data))
+        finished = False
+        for line in data.decode('utf-8', 'replace').splitlines():
+            if line.strip():
+                finished = self._accept(line.strip(), write=False) or finished
+        recorded = Hand.objects.filter(game=game).count()
+        self._finished = [(position, lines) for position, lines in self._finished if position >= recorded]
+        self._log = open(path, 'a', encoding='utf-8')
+        if finished:
+            self.finish()
+        return game
+
+    def feed(self, lines):
+        """Take a batch of lines from the device, then write out what they finished"""
+        for line in lines:
+            line = line.strip()
+            if line and self._accept(line):
+                self.finish()
+        self.flush()
+
+    def _accept(self, line, write=True):
+        """Apply one line; returns True when it ended the game"""
+        token = tokenize_line(line)
+        kind = token.kind
+
+        if kind in HEADER_KINDS:
+            if self.hand_lines is not None:
+                # A new game's header: the device was reset mid-game
+                logger.warning('Game #%s ended without a winner', self.game.id)
+                self.finish()
+            self._skipping = False
+            self._start_game(write)
+            self.header_lines.append(line)
+        elif kind == tokenizer.HAND:
+            if self.hand_number is not None and token.amount < self.hand_number:
+                self._skipping = True
+                return False
+            self._skipping = False
+            if token.amount == self.hand_number:
+                # The device resent the current hand; its lines are stored already
+                self._resent = len(self.hand_lines) - 1
+                return False
+            self._start_game(write)
+            self._finish_hand()
+            self.hand_lines, self.hand_number = [line], token.amount
+        elif self._skipping or self.game is None:
+            return False
+        elif self._resent:
+            position = len(self.hand_lines) - self._resent
+            self._resent -= 1
+            if self.hand_lines[position] == line:
+                return False
+            # The resend differs from what was stored: keep what the device says now, from this line on
+            logger.warning('Game #%s hand %s: resent line %r differs from %r', self.game.id, self.hand_number,
+                           line, self.hand_lines[position])
+            self._resent = 0
+            if write:
+                self._cut_log(sum(len(stale.encode()) + 1 for stale in self.hand_lines[position:]))
+            del self.hand_lines[position:]
+            self.hand_lines.append(line)
+        elif self.hand_lines is None:
+            self.header_lines.append(line)
+        else:
+            self.hand_lines.append(line)
+
+        if write:
+            self._log.write(line + '\n')
+        return kind == tokenizer.WINNER
+
+    def _start_game(self, write):
+        if self.game is not None or not write:
+            return
+        name = default_storage.save(f"{LIVE_DIR}/{timezone.now():%Y%m%d-%H%M%S}-{self.user.id}.txt", ContentFile(b''))
+        self.game = Game.objects.create(
+            user=self.user,
+            player_number=self.player_number,
+            name=f"Live {timezone.localtime():%Y-%m-%d %H:%M}",
+            game_data=name,
+            status=Game.LIVE,
+        )
+        self._log = open(default_storage.path(name), 'a', encoding='utf-8')
+        logger.info('Recording game #%s live to %s', self.game.id, name)
+
+    def _cut_log(self, size):
+        """Remove the last size bytes of the live log"""
+        self._log.flush()
+        fd = self._log.fileno()
+        os.truncate(fd, os.fstat(fd).st_size - size)
+
+    def _finish_hand(self):
+        if self.hand_lines is not None:
+            self._finished.append((self.hands_done, self.hand_lines))
+            self.hands_done += 1
+        self.hand_lines = self.hand_number = None
+        self._resent = 0
+
+    def flush(self):
+        """Write out the log and insert the finished hands' rows"""
+        if self._log is not None:
+            self._log.flush()
+        if not self._finished:
+            return
+        records = []
+        for position, lines in self._finished:
+            events = list(iter_game_data('\n'.join(self.header_lines + lines)))
+            summary = next((value for kind, value in events if kind == 'header'), None)
+            hands = [value for kind, value in events if kind == 'hand']
+            if summary is not None:
+                records += hand_records(summary, hands, position)
+        append_hands(self.game, records)
+        self._finished = []
+
+    def finish(self):
+        """End the game: its log becomes its stored file and it is processed like an upload"""
+        if self.game is None:
+            return
+        self._finish_hand()
+        self.flush()
+        self._log.close()
+        game, live_name = self.game, self.game.game_data.name
+        with default_storage.open(live_name, 'rb') as f:
+            content = f.read()
+        with transaction.atomic():
+            # Stored once per content like an upload (see Game.save)
+            game.game_data = ContentFile(content, name=os.path.basename(live_name))
+            game.status = Game.PENDING
+            game.save()
+            enqueue_game(game)
+        default_storage.delete(live_name)
+        logger.info('Game #%s finished after %s hands', game.id, self.hands_done)
+        self.game = None
+        self._reset()
+
+    def close(self):
+        """Stop recording, leaving an unfinished game live so it can be resumed"""
+        self.flush()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+async def serial_lines(port, baudrate):
+    """Lines read from a serial port; raises OSError when the connection is lost"""
+    try:
+        import serial
+    except ImportError:
+        raise RuntimeError('Reading a serial port needs pyserial: pip install pyserial')
+
+    # pyserial blocks, so reads run in a thread and time out every second to stay cancellable
+    connection = await asyncio.to_thread(serial.Serial, port, baudrate, timeout=1)
+    try:
+        pending = b''
+        while True:
+            chunk = await asyncio.to_thread(lambda: connection.read(connection.in_waiting or 1))
+            pending += chunk
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                yield line.decode('utf-8', 'replace')
+    finally:
+        connection.close()
+
+
+async def file_lines(path, follow=True):
+    """
+    Lines read from a pty, FIFO or regular file standing in for a serial port
+
+    A regular file is followed as it grows, or read to its end without
+    follow. A pty or FIFO ends with an OSError when its writer goes away.
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    regular = stat.S_ISREG(os.fstat(fd).st_mode)
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    if not regular:
+        loop.add_reader(fd, readable.set)
+    try:
+        pending = b''
+        offset = 0
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                chunk = None
+            if chunk:
+                offset += len(chunk)
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    yield line.decode('utf-8', 'replace')
+            elif regular:
+                if os.fstat(fd).st_size < offset:
+                    # Replaced by a new game: start over
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    pending, offset = b'', 0
+                elif not follow:
+                    break
+                else:
+                    await asyncio.sleep(POLL_INTERVAL)
+            elif chunk == b'':
+                raise ConnectionError(f'{path} was closed by its writer')
+            else:
+                readable.clear()
+                await readable.wait()
+    finally:
+        if not regular:
+            loop.remove_reader(fd)
+        os.close(fd)
+
+
+async def reconnecting(open_lines, name):
+    """Lines from open_lines(), reopening it with backoff whenever the connection is lost"""
+    delay = RECONNECT_DELAY
+    while True:
+        try:
+            async for line in open_lines():
+                delay = RECONNECT_DELAY
+                yield line
+            return
+        except OSError as e:
+            logger.warning('Lost %s (%s), reconnecting in %ss', name, e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+async def ingest(lines, recorder, flush_interval=FLUSH_INTERVAL):
+    """
+    Feed lines to a recorder in batches until the source ends
+
+    A batch is written out at most flush_interval seconds after its first
+    line arrived, so the database and live log lag the device by about that.
+    """
+    queue = asyncio.Queue(maxsize=MAX_BATCH * 4)
+
+    async def read():
+        try:
+            async for line in lines:
+                await queue.put(line)
+        finally:
+            await queue.put(None)
+
+    reader = asyncio.create_task(read())
+    feed = sync_to_async(recorder.feed)
+    loop = asyncio.get_running_loop()
+    try:
+        done = False
+        while not done:
+            line = await queue.get()
+            if line is None:
+                break
+            batch = [line]
+            deadline = loop.time() + flush_interval
+            while len(batch) < MAX_BATCH:
+                try:
+                    line = await asyncio.wait_for(queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                if line is None:
+                    done = True
+                    break
+                batch.append(line)
+            await feed(batch)
+        await reader
+    finally:
+        reader.cancel()
+        await sync_to_async(recorder.close)()
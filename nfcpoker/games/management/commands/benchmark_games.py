@@ -0,0 +1,166 @@
+import importlib.util
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+from pokerlog import binlog
+from pokerlog.tokenizer import tokenize_line
+
+from games.history import record_hands
+from games.models import Game, ParsedGame
+from games.parser import calculate_player_profit, iter_game_data, iter_lines, parse_game_data
+from games.stats import player_stats
+from games.synthetic import generate_game_log
+
+# The desktop reader's replay engine, which runs without a display
+REPLAY_ENGINE = settings.BASE_DIR.parent / 'NFC-Poker-Device' / 'replay_engine.py'
+# Most hands opened by the replay cases, spread over the game; hands/s is per hand opened
+REPLAY_SAMPLE = 1000
+
+
+class Command(BaseCommand):
+    help = "Benchmark parsing, profit calculation, game page rendering and hand replay on synthetic game logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,1000,100000',
+                            help="Comma separated hand counts to benchmark (default: 10,1000,100000)")
+        parser.add_argument('--players', type=int, default=6)
+        parser.add_argument('--all-in-freq', type=float, default=0.05)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case; the best is reported")
+        parser.add_argument('--skip-render', action='store_true', help="Skip the full page render cases")
+        parser.add_argument('--skip-replay', action='store_true', help="Skip the desktop reader's hand replay cases")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        # Page renders go through the real view, so run against a throwaway test database
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                client = Client()
+                client.force_login(User.objects.create_user('benchmark'))
+                self.stdout.write(f"{'hands':>7}  {'case':<18} {'best s':>9} {'hands/s':>12} {'MB/s':>8} {'peak MiB':>9}")
+                for size in sizes:
+                    for row in self.run_size(size, client, options):
+                        self.stdout.write("{:>7}  {:<18} {:>9.4f} {:>12,.0f} {:>8.1f} {:>9.2f}".format(*row))
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def run_size(self, size, client, options):
+        log = generate_game_log(players=options['players'], hands=size, all_in_freq=options['all_in_freq'],
+                                seed=options['seed']).encode()
+        megabytes = len(log) / 1e6
+
+        parsed = parse_game_data(io.BytesIO(log))
+        cases = [
+            ('tokenize', None, lambda: deque(map(tokenize_line, iter_lines(io.BytesIO(log))), maxlen=0)),
+            ('parse', None, lambda: parse_game_data(io.BytesIO(log))),
+            ('profit (stream)', None, lambda: calculate_player_profit(iter_game_data(io.BytesIO(log)), 1)),
+        ]
+        if not options['skip_render']:
+            user = User.objects.get(username='benchmark')
+            game = Game.objects.create(user=user, name=f"Benchmark {size}",
+                                       player_number=1, game_data=ContentFile(log, name='benchmark.txt'))
+            record_hands(game)
+            url = reverse('games.view', args=[game.id])
+            hands_url = reverse('games.hands', args=[game.id])
+            cases += [
+                ('render (cold)', _cold, lambda: client.get(url)),
+                ('render (cached)', None, lambda: client.get(url)),
+                ('hands (last 50)', None, lambda: client.get(hands_url, {'start': max(size - 49, 0), 'end': size + 1})),
+                ('player stats', None, lambda: player_stats(user)),
+            ]
+        if not options['skip_replay']:
+            cases += _replay_cases(size, log, parsed)
+
+        # Cases over fewer hands than the game's give their count as a fourth item
+        for name, setup, run, *hands in cases:
+            count = hands[0] if hands else size
+            best = float('inf')
+            for _ in range(options['repeat']):
+                if setup:
+                    setup()
+                started = time.perf_counter()
+                run()
+                best = min(best, time.perf_counter() - started)
+
+            # Peak memory gets its own run, tracemalloc slows everything down
+            if setup:
+                setup()
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            yield size, name, best, count / best, megabytes * count / size / best, peak / 2 ** 20
+
+
+def _cold():
+    """Forget every parse and every cached page fragment, so the next render starts from the file"""
+    ParsedGame.objects.all().delete()
+    cache.clear()
+
+
+def _replay_cases(size, log, parsed):
+    """
+    The desktop reader opening hands of the game, with replay_engine
+
+    build: HandReplay of hands already read; seek: find each hand in the
+    game's binary log, read it and build its replay, the way the reader
+    jumps to a hand of a .nfcb file; state_at: the table at every position
+    of an open hand, from the last back to the first (stepping back and
+    dragging the slider). Hands are a sample of up to REPLAY_SAMPLE spread
+    over the game and opened in random order.
+    """
+    if not REPLAY_ENGINE.exists():
+        return []
+    spec = importlib.util.spec_from_file_location('replay_engine', REPLAY_ENGINE)
+    replay_engine = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(replay_engine)
+
+    path = os.path.join(settings.MEDIA_ROOT, f'benchmark-{size}{binlog.EXTENSION}')
+    with open(path, 'wb') as f:
+        f.write(binlog.encode(iter_lines(io.BytesIO(log))))
+    with binlog.GameLog(path) as game_log:
+        indexes = sorted({index * game_log.hand_count // REPLAY_SAMPLE for index in range(REPLAY_SAMPLE)}
+                         if game_log.hand_count > REPLAY_SAMPLE else range(game_log.hand_count))
+        random.Random(0).shuffle(indexes)
+        numbers = [game_log.hand_number(index) for index in indexes]
+        hands = [game_log.hand_lines(index) for index in indexes]
+
+    def replay(lines):
+        return replay_engine.HandReplay(lines, parsed['starting_pots'], parsed['small_blind'], parsed['big_blind'])
+
+    def seek():
+        with binlog.GameLog(path) as game_log:
+            for number in numbers:
+                replay(game_log.hand_lines(game_log.find_hand(number)))
+
+    replays = [replay(lines) for lines in hands]
+    return [
+        ('replay (build)', None, lambda: deque(map(replay, hands), maxlen=0), len(hands)),
+        ('replay (seek)', None, seek, len(hands)),
+        ('replay (state_at)', None, lambda: [hand.state_at(position) for hand in replays
+                                             for position in range(len(hand), -1, -1)], len(hands)),
+    ]
+
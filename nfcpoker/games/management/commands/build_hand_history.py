@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from games.history import record_hands
+from games.models import Game
+
+
+class Command(BaseCommand):
+    help = "Fill the Hand and Action tables for games uploaded before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild every game, not only games without hands")
+
+    def handle(self, *args, **options):
+        games = Game.objects.exclude(game_data='').order_by('id')
+        if not options['all']:
+            games = games.filter(hands__isnull=True)
+        built = 0
+        for game in games.iterator():
+            try:
+                record_hands(game)
+            except Exception as e:
+                self.stderr.write(f"Game #{game.id}: {e}")
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"Recorded hands for {built} games"))
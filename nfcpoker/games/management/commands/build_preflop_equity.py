@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from games import preflop
+
+
+class Command(BaseCommand):
+    help = "Precompute the preflop equity table that is memory-mapped at startup"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--field-trials', type=int, default=preflop.FIELD_TRIALS,
+                            help="Boards dealt per starting hand against random hands")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=str(settings.PREFLOP_EQUITY_FILE))
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        field = preflop.build(options['field_trials'], options['seed'])
+        preflop.write(options['output'], field, options['field_trials'])
+        preflop.load(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']} in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from games.cache import binary_log_path, save_binary_log
+from games.downloads import gzip_path, save_gzip_copy
+from games.models import Game
+
+
+class Command(BaseCommand):
+    help = "Write the binary log (.nfcb) and the gzip copy (.gz) next to every stored game file missing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rewrite binary logs and gzip copies that already exist")
+
+    def handle(self, *args, **options):
+        field = Game._meta.get_field('game_data')
+        # Blob files and files uploaded before deduplication alike; shared files are converted once
+        names = Game.objects.exclude(game_data='').values_list('game_data', flat=True).distinct().order_by('game_data')
+        converted = skipped = compressed = 0
+        text_bytes = binary_bytes = 0
+        for name in names.iterator():
+            file = field.attr_class(None, field, name)
+            if not file.storage.exists(name):
+                self.stderr.write(f"Missing file {name}, skipped")
+                continue
+            if options['force'] or not os.path.exists(gzip_path(file)):
+                save_gzip_copy(file)
+                compressed += 1
+            if not options['force'] and os.path.exists(binary_log_path(file)):
+                skipped += 1
+                continue
+            try:
+                path = save_binary_log(file)
+            except (UnicodeDecodeError, ValueError) as e:
+                self.stderr.write(f"{name}: {e}")
+                continue
+            converted += 1
+            text_bytes += file.storage.size(name)
+            binary_bytes += os.path.getsize(path)
+
+        ratio = f", {binary_bytes / text_bytes:.0%} of the text size" if text_bytes else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {converted} game files{ratio}; {skipped} already had a binary log; "
+            f"wrote {compressed} gzip copies"
+        ))
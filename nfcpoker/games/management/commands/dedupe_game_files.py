@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from games.blobs import acquire_blob
+from games.cache import delete_binary_log
+from games.downloads import delete_gzip_copy
+from games.models import Game
+
+
+class Command(BaseCommand):
+    help = "Move game files uploaded before deduplication into the shared blob store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be done")
+
+    def handle(self, *args, **options):
+        games = Game.objects.filter(blob__isnull=True).exclude(game_data='').order_by('id')
+        moved = 0
+        old_names = set()
+        for game in games.iterator():
+            if not game.game_data.storage.exists(game.game_data.name):
+                self.stderr.write(f"Game #{game.id}: missing file {game.game_data.name}, skipped")
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"Game #{game.id}: would move {game.game_data.name}")
+                continue
+
+            old_names.add(game.game_data.name)
+            with transaction.atomic():
+                with game.game_data.open('rb'):
+                    blob = acquire_blob(game.game_data)
+                Game.objects.filter(pk=game.pk).update(blob=blob, content_hash=blob.sha256, game_data=blob.file.name)
+            moved += 1
+
+        # The per-upload copies are now unused unless a game still points at one
+        removed = 0
+        for name in old_names:
+            if not Game.objects.filter(game_data=name).exists():
+                field = Game._meta.get_field('game_data')
+                delete_binary_log(field.attr_class(None, field, name))
+                delete_gzip_copy(field.attr_class(None, field, name))
+                field.storage.delete(name)
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} games into the blob store, removed {removed} duplicate files"))
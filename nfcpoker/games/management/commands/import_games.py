@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from games.imports import FAILED, IMPORTED, import_games
+
+
+class Command(BaseCommand):
+    help = "Import a Records folder, zips or game files for a user, parsing in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Game .txt files, .zip files or folders of them")
+        parser.add_argument('--user', required=True, help="Username the games belong to")
+        parser.add_argument('--player', type=int, required=True, help="The user's player number in these games")
+        parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: one per CPU)")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+
+        uploads = []
+        for path in map(Path, options['paths']):
+            if path.is_dir():
+                files = sorted(p for p in path.iterdir() if p.suffix.lower() in ('.txt', '.zip'))
+            elif path.exists():
+                files = [path]
+            else:
+                raise CommandError(f"{path} does not exist")
+            uploads.extend((file.name, file.read_bytes()) for file in files)
+
+        report = import_games(user, options['player'], uploads, workers=options['workers'])
+        for row in report:
+            if row['status'] == IMPORTED:
+                detail = f"game #{row['game_id']}, {row['hands']} hands, profit {row['profit']}"
+            else:
+                detail = row['error']
+            line = f"{row['status']:>9}  {row['file']}: {detail}"
+            self.stdout.write(self.style.ERROR(line) if row['status'] == FAILED else line)
+
+        imported = sum(row['status'] == IMPORTED for row in report)
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} of {len(report)} files"))
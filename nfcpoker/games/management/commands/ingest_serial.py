@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from games.live import FLUSH_INTERVAL, LiveRecorder, file_lines, ingest, reconnecting, serial_lines
+
+
+class Command(BaseCommand):
+    help = "Record games live from the device's serial port (or a pty/file standing in for it)"
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--port', help="Serial port of the device, e.g. /dev/ttyACM0 or COM3 (needs pyserial)")
+        source.add_argument('--file', help="pty, FIFO or log file to read the device's lines from instead")
+        parser.add_argument('--baud', type=int, default=9600, help="Serial port speed")
+        parser.add_argument('--user', required=True, help="Username the games belong to")
+        parser.add_argument('--player', type=int, required=True, help="The user's player number in these games")
+        parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL,
+                            help="Most seconds a line waits before it is written out")
+        parser.add_argument('--exit-at-eof', action='store_true', help="Stop at the end of --file instead of following it")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+        logging.getLogger('games.live').addHandler(logging.StreamHandler(self.stderr))
+        logging.getLogger('games.live').setLevel(logging.INFO)
+
+        recorder = LiveRecorder(user, options['player'])
+        game = recorder.resume()
+        if game is not None:
+            self.stdout.write(f"Resuming live game #{game.id} after hand {recorder.hand_number or 0}")
+
+        if options['port']:
+            lines = reconnecting(partial(serial_lines, options['port'], options['baud']), options['port'])
+        elif options['exit_at_eof']:
+            lines = file_lines(options['file'], follow=False)
+        else:
+            lines = reconnecting(partial(file_lines, options['file']), options['file'])
+
+        try:
+            asyncio.run(ingest(lines, recorder, options['flush_interval']))
+        except KeyboardInterrupt:
+            pass
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        live = f", game #{recorder.game.id} is still live" if recorder.game is not None else ''
+        self.stdout.write(self.style.SUCCESS(f"Stopped recording{live}"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from games.parser import PARSER_VERSION
+from games.profits import BATCH_SIZE, recompute_profits, stale_games
+
+
+class Command(BaseCommand):
+    help = "Recompute the profit of games worked out by an older parser version, parsing in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='everything',
+                            help="Recompute every processed game, not only those from older parser versions")
+        parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: one per CPU)")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Games per bulk update query")
+
+    def handle(self, *args, **options):
+        count = stale_games(options['everything']).count()
+        if not count:
+            self.stdout.write(self.style.SUCCESS(f"Every game's profit is from parser version {PARSER_VERSION}"))
+            return
+        self.stdout.write(f"Recomputing {count} games with parser version {PARSER_VERSION}")
+
+        report = recompute_profits(
+            everything=options['everything'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            progress=lambda done, total: self.stdout.write(f"  {done}/{total} files"),
+        )
+        for name, error in sorted(report['failed'].items()):
+            self.stderr.write(self.style.ERROR(f"{name}: {error}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {report['games']} games ({report['changed']} with a new profit), "
+            f"parsed {report['parsed']} files, {len(report['failed'])} failed"
+        ))
@@ -0,0 +1,37 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from games.jobs import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (processing uploaded games) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due instead of waiting")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds between polls when the queue is empty")
+        parser.add_argument('--name', default=f"{socket.gethostname()}:{os.getpid()}", help="Worker name on claimed jobs")
+
+    def handle(self, *args, **options):
+        worker = options['name']
+        self.stdout.write(f"Worker {worker} waiting for jobs")
+        try:
+            while True:
+                close_old_connections()
+                job = claim_job(worker)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                start = time.perf_counter()
+                ok = run_job(job)
+                status = self.style.SUCCESS('done') if ok else self.style.ERROR('failed')
+                self.stdout.write(f"{job.kind} #{job.id} {status} in {time.perf_counter() - start:.2f}s")
+        except KeyboardInterrupt:
+            self.stdout.write(f"Worker {worker} stopped")
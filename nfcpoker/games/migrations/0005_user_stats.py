@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_user_stats(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    UserStats = apps.get_model('games', 'UserStats')
+    totals = Game.objects.values('user_id').annotate(
+        total_profit=models.Sum('profit'),
+        game_count=models.Count('id'),
+        best_profit=models.Max('profit'),
+        worst_profit=models.Min('profit'),
+        last_played=models.Max('date'),
+    ).order_by()
+    UserStats.objects.bulk_create(UserStats(**row) for row in totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('games', '0004_game_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='game_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_profit', models.BigIntegerField(default=0)),
+                ('game_count', models.PositiveIntegerField(default=0)),
+                ('best_profit', models.IntegerField(blank=True, null=True)),
+                ('worst_profit', models.IntegerField(blank=True, null=True)),
+                ('last_played', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+            },
+        ),
+        migrations.RunPython(backfill_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+def clear_parsed_games(apps, schema_editor):
+    # Cached parses are rebuilt in the new layout the next time a game is opened
+    apps.get_model('games', 'ParsedGame').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_game_user_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_parsed_games, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='parsedgame',
+            name='data',
+        ),
+        migrations.AddField(
+            model_name='parsedgame',
+            name='summary',
+            field=models.TextField(default=''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='parsedgame',
+            name='hands',
+            field=models.TextField(default=''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='parsedgame',
+            name='hand_offsets',
+            field=models.JSONField(default=list),
+        ),
+    ]
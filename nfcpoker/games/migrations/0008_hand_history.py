@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_parsed_game_hand_offsets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('hand_number', models.IntegerField()),
+                ('dealer', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('stacks', models.JSONField(default=list)),
+                ('board', models.CharField(blank=True, default='', max_length=32)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hands', to='games.game')),
+            ],
+            options={
+                'ordering': ['game', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Action',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveSmallIntegerField()),
+                ('street', models.CharField(choices=[('preflop', 'Preflop'), ('flop', 'Flop'), ('turn', 'Turn'), ('river', 'River')], max_length=8)),
+                ('seat', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('action_type', models.CharField(choices=[('card', 'Hole card'), ('post_sb', 'Small blind'), ('post_bb', 'Big blind'), ('call', 'Call'), ('raise', 'Raise'), ('all_in', 'All-in'), ('fold', 'Fold'), ('com', 'Community cards'), ('win', 'Won')], max_length=8)),
+                ('amount', models.IntegerField(blank=True, null=True)),
+                ('cards', models.CharField(blank=True, default='', max_length=32)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actions', to='games.game')),
+                ('hand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actions', to='games.hand')),
+            ],
+            options={
+                'ordering': ['hand', 'sequence'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hand',
+            constraint=models.UniqueConstraint(fields=('game', 'position'), name='unique_hand_position'),
+        ),
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['game', 'action_type', 'seat'], name='action_game_type_seat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['action_type', 'street'], name='action_type_street_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='action',
+            constraint=models.UniqueConstraint(fields=('hand', 'sequence'), name='unique_action_sequence'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_hands(apps, schema_editor):
+    Hand = apps.get_model('games', 'Hand')
+    Action = apps.get_model('games', 'Action')
+
+    def count(action_type):
+        return models.Subquery(
+            Action.objects.filter(hand=models.OuterRef('pk'), action_type=action_type)
+            .values('hand').annotate(n=models.Count('seat', distinct=True)).values('n')
+        )
+
+    big_blind = Action.objects.filter(hand=models.OuterRef('pk'), action_type='post_bb').values('amount')[:1]
+    Hand.objects.update(
+        big_blind=Coalesce(models.Subquery(big_blind), 0),
+        players=Coalesce(count('card'), 0),
+    )
+    Hand.objects.update(players_at_end=models.F('players') - Coalesce(count('fold'), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_hand_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hand',
+            name='big_blind',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hand',
+            name='players',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hand',
+            name='players_at_end',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_hands, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ActionLog',
+            fields=[
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='action_log', serialize=False, to='games.game')),
+                ('hands', models.BinaryField()),
+                ('actions', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
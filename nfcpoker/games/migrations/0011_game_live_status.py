@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0010_game_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed'), ('live', 'Live')], default='ready', max_length=8),
+        ),
+    ]
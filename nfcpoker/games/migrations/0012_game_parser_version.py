@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0011_game_live_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='parser_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
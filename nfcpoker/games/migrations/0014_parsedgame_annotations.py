@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0013_game_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parsedgame',
+            name='annotation_offsets',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='parsedgame',
+            name='annotations',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
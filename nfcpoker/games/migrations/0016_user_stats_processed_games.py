@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+def rebuild_user_stats(apps, schema_editor):
+    # UserStats now only count processed games (see games.signals)
+    Game = apps.get_model('games', 'Game')
+    UserStats = apps.get_model('games', 'UserStats')
+    totals = Game.objects.filter(status='ready').values('user_id').annotate(
+        total_profit=models.Sum('profit'),
+        game_count=models.Count('id'),
+        best_profit=models.Max('profit'),
+        worst_profit=models.Min('profit'),
+        last_played=models.Max('date'),
+    ).order_by()
+    UserStats.objects.all().delete()
+    UserStats.objects.bulk_create(UserStats(**row) for row in totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0015_game_imports'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+def count_all_games(apps, schema_editor):
+    # Every game of the user's, for the games index (see games.conditional); users with games get stats
+    Game = apps.get_model('games', 'Game')
+    UserStats = apps.get_model('games', 'UserStats')
+    for row in Game.objects.values('user_id').annotate(all_game_count=models.Count('id')).order_by():
+        UserStats.objects.update_or_create(user_id=row['user_id'], defaults={'all_game_count': row['all_game_count']})
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0016_user_stats_processed_games'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='all_game_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_all_games, migrations.RunPython.noop),
+    ]
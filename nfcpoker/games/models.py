@@ -1,20 +1,283 @@
-from django.db import models
+import hashlib
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+from pokerlog import tokenizer
+
+
+def file_sha256(file):
+    """Hash a Django File (FieldFile/UploadedFile) chunk by chunk"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def blob_upload_to(instance, filename):
+    return f"game_files/blobs/{instance.sha256[:2]}/{instance.sha256}.txt"
+
+
+class GameBlob(models.Model):
+    """One stored copy of a game file, shared by every Game uploaded with the same content"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
 
 
 class Game(models.Model):
+    # Uploads are processed in the background by games.jobs
+    PENDING, READY, FAILED, LIVE = 'pending', 'ready', 'failed', 'live'
+    STATUSES = [(PENDING, 'Processing'), (READY, 'Ready'), (FAILED, 'Failed'), (LIVE, 'Live')]
+
     id = models.AutoField(primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='games')
     name = models.CharField(max_length=255, blank=True, null=True)  # ⬅️ NOW OPTIONAL
     player_number = models.IntegerField()  # ⬅️ NEW REQUIRED FIELD
     date = models.DateTimeField(auto_now_add=True)
     profit = models.IntegerField(default=0)
+    # PARSER_VERSION that worked out profit; games by older parsers are brought up to date by recompute_profits
+    parser_version = models.PositiveIntegerField(null=True, blank=True, editable=False)
     game_data = models.FileField(upload_to='game_files/')  # ⬅️ NOW REQUIRED (removed blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+    blob = models.ForeignKey(GameBlob, on_delete=models.PROTECT, related_name='games', null=True, blank=True,
+                             editable=False)
+    status = models.CharField(max_length=8, choices=STATUSES, default=READY)
+    status_message = models.TextField(blank=True, default='')  # Why processing failed
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set by every save; queryset updates that change what the game's page shows set it too (see games.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Keyset pagination and date filtering of a user's games (see games.pagination)
+            models.Index(fields=['user', '-created_at', '-id'], name='game_user_created_idx'),
+        ]
     
     def __str__(self):
         game_name = self.name if self.name else f"Game #{self.id}"  # ⬅️ UPDATED
-        return f"{game_name} - Player {self.player_number} - {self.user.username}"  # ⬅️ UPDATED
\ No newline at end of file
+        return f"{game_name} - Player {self.player_number} - {self.user.username}"  # ⬅️ UPDATED
+
+    def save(self, *args, **kwargs):
+        from .blobs import acquire_blob, release_blob
+
+        # A freshly uploaded (uncommitted) file is stored once per distinct content
+        if self.game_data and not self.game_data._committed:
+            old_blob_id = self.blob_id
+            with transaction.atomic():
+                blob = acquire_blob(self.game_data)
+                self.blob = blob
+                self.content_hash = blob.sha256
+                self.game_data = blob.file.name
+                super().save(*args, **kwargs)
+                if old_blob_id:
+                    release_blob(old_blob_id)
+        else:
+            super().save(*args, **kwargs)
+
+
+class ParsedGame(models.Model):
+    """Cached output of parse_game_data, shared by every game with the same file content"""
+    content_hash = models.CharField(max_length=64)
+    parser_version = models.PositiveIntegerField()
+    summary = models.TextField()  # parse_game_data() output without the hands, as JSON
+    hands = models.TextField()  # The hands as comma separated JSON objects
+    hand_offsets = models.JSONField(default=list)  # Where each hand starts in hands
+    # Each hand's showdown and equity (games.equity) as comma separated JSON objects, like hands
+    annotations = models.TextField(blank=True, default='')
+    annotation_offsets = models.JSONField(default=list)  # Where each hand's annotations start in annotations
+    profits = models.JSONField(default=list)  # Profit/loss of seat N at index N - 1
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'parser_version'], name='unique_parse_per_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} (parser v{self.parser_version})"
+
+    @property
+    def hand_count(self):
+        return max(len(self.hand_offsets) - 1, 0)
+
+
+class Hand(models.Model):
+    """One hand of a game, normalized from its file by games.history"""
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='hands')
+    position = models.PositiveIntegerField()  # Index of the hand in the file
+    hand_number = models.IntegerField()
+    dealer = models.PositiveSmallIntegerField(null=True, blank=True)  # Seat, 1-based like players
+    stacks = models.JSONField(default=list)  # Chips of seat N at index N - 1 when the hand started
+    board = models.CharField(max_length=32, blank=True, default='')  # Community cards, comma separated
+    big_blind = models.PositiveIntegerField(default=0)
+    players = models.PositiveSmallIntegerField(default=0)  # Seats dealt in
+    players_at_end = models.PositiveSmallIntegerField(default=0)  # Seats that never folded; 2+ is a showdown
+
+    class Meta:
+        ordering = ['game', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'position'], name='unique_hand_position'),
+        ]
+
+    def __str__(self):
+        return f"Hand #{self.hand_number} of game #{self.game_id}"
+
+
+class Action(models.Model):
+    """One line of a hand: a hole card, blind, bet, fold, board card or pot won"""
+    HOLE_CARD = tokenizer.HOLE_CARD
+    POST_SB = tokenizer.POST_SB
+    POST_BB = tokenizer.POST_BB
+    CALL = tokenizer.CALL  # An amount of 0 is a check
+    RAISE = tokenizer.RAISE
+    ALL_IN = tokenizer.ALL_IN
+    FOLD = tokenizer.FOLD
+    COMMUNITY = tokenizer.COMMUNITY
+    WIN = tokenizer.WIN
+    ACTION_TYPES = [
+        (HOLE_CARD, 'Hole card'),
+        (POST_SB, 'Small blind'),
+        (POST_BB, 'Big blind'),
+        (CALL, 'Call'),
+        (RAISE, 'Raise'),
+        (ALL_IN, 'All-in'),
+        (FOLD, 'Fold'),
+        (COMMUNITY, 'Community cards'),
+        (WIN, 'Won'),
+    ]
+
+    PREFLOP, FLOP, TURN, RIVER = 'preflop', 'flop', 'turn', 'river'
+    STREETS = [(PREFLOP, 'Preflop'), (FLOP, 'Flop'), (TURN, 'Turn'), (RIVER, 'River')]
+
+    hand = models.ForeignKey(Hand, on_delete=models.CASCADE, related_name='actions')
+    # Repeated from the hand so per-game and per-player filters need no join
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='actions')
+    sequence = models.PositiveSmallIntegerField()  # Order within the hand
+    street = models.CharField(max_length=8, choices=STREETS)
+    seat = models.PositiveSmallIntegerField(null=True, blank=True)  # 1-based; empty for community cards
+    action_type = models.CharField(max_length=8, choices=ACTION_TYPES)
+    amount = models.IntegerField(null=True, blank=True)  # Chips put in (blinds included) or won
+    cards = models.CharField(max_length=32, blank=True, default='')
+
+    class Meta:
+        ordering = ['hand', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['hand', 'sequence'], name='unique_action_sequence'),
+        ]
+        indexes = [
+            # "Hands where seat N went all-in / folded the river ..." within a game
+            models.Index(fields=['game', 'action_type', 'seat'], name='action_game_type_seat_idx'),
+            models.Index(fields=['action_type', 'street'], name='action_type_street_idx'),
+        ]
+
+    def __str__(self):
+        player = f" by P{self.seat}" if self.seat else ''
+        return f"{self.get_action_type_display()}{player} ({self.street})"
+
+
+class ActionLog(models.Model):
+    """A game's Hand and Action rows packed into NumPy arrays for games.stats"""
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name='action_log')
+    hands = models.BinaryField()  # int32 rows of players, players_at_end, big_blind
+    actions = models.BinaryField()  # int32 rows of hand index, seat, street, action type, amount
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Action log of game #{self.game_id}"
+
+
+class GameImport(models.Model):
+    """Game files uploaded on the import page, imported in the background by games.jobs"""
+    PENDING, DONE, FAILED = 'pending', 'done', 'failed'
+    STATUSES = [(PENDING, 'Importing'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='game_imports')
+    player_number = models.IntegerField()
+    files = models.JSONField(default=list)  # [upload name, storage name] of each file until it is imported
+    report = models.JSONField(default=list)  # games.imports.import_games() rows
+    status = models.CharField(max_length=8, choices=STATUSES, default=PENDING)
+    status_message = models.TextField(blank=True, default='')  # Why the import failed
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import #{self.id} by {self.user.username} ({self.status})"
+
+
+class Job(models.Model):
+    """A unit of background work, run by the run_jobs command (see games.jobs)"""
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=32)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    game_import = models.ForeignKey(GameImport, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    status = models.CharField(max_length=8, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField()  # Not picked up before this, retries back off
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            # Workers poll for the oldest due job in a status
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class UserStats(models.Model):
+    """
+    Per-user totals of their processed (READY) games for the games index, kept up to date by games.signals
+
+    Every change to one of the user's games moves updated_at, which versions the games index
+    (games.conditional), so revalidating the index only reads this row.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='game_stats')
+    total_profit = models.BigIntegerField(default=0)
+    game_count = models.PositiveIntegerField(default=0)
+    best_profit = models.IntegerField(null=True, blank=True)
+    worst_profit = models.IntegerField(null=True, blank=True)
+    last_played = models.DateTimeField(null=True, blank=True)
+    all_game_count = models.PositiveIntegerField(default=0)  # Processed or not, for the index's empty states
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'user stats'
+
+    def __str__(self):
+        return f"{self.user.username}: {self.game_count} games, ${self.total_profit}"
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recompute a user's stats from their games with one aggregate query"""
+        ready = models.Q(status=Game.READY)
+        totals = Game.objects.filter(user_id=user_id).aggregate(
+            total_profit=models.Sum('profit', filter=ready, default=0),
+            game_count=models.Count('id', filter=ready),
+            best_profit=models.Max('profit', filter=ready),
+            worst_profit=models.Min('profit', filter=ready),
+            last_played=models.Max('date', filter=ready),
+            all_game_count=models.Count('id'),
+        )
+        return cls.objects.update_or_create(user_id=user_id, defaults=totals)[0]
+
+    @classmethod
+    def bump(cls, user_id, **changes):
+        """Apply changes (F() expressions) to a user's stats and move updated_at; False when the user has none"""
+        return bool(cls.objects.filter(user_id=user_id).update(updated_at=timezone.now(), **changes))
@@ -0,0 +1,43 @@
+"""
+Keyset (cursor) pagination for a user's games
+
+Pages are taken in Game's (-created_at, -id) order by seeking past the last
+row of the previous page, which the (user, created_at, id) index answers
+directly. Page N therefore costs the same as page 1, however many games a
+user has.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 25
+
+
+def encode_cursor(game):
+    raw = f"{game.created_at.isoformat()}|{game.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, game_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(game_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginate_games(games, cursor=None, page_size=PAGE_SIZE):
+    """Return (page of games, cursor for the next page or None)"""
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, game_id = position
+        games = games.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=game_id))
+
+    page = list(games.order_by('-created_at', '-id')[:page_size + 1])
+    if len(page) > page_size:
+        page = page[:page_size]
+        return page, encode_cursor(page[-1])
+    return page, None
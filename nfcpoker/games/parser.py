@@ -0,0 +1,272 @@
+"""
+Parsing of the Arduino-generated game log files
+
+iter_game_data() parses incrementally: it reads the file chunk by chunk and
+yields ('header', info) once, then ('hand', hand) for every hand and finally
+('winner', winner) if the game was played to the end. parse_game_data()
+collects those events into the single dict the templates use.
+"""
+import codecs
+
+from pokerlog import tokenizer
+from pokerlog.tokenizer import tokenize_line
+
+from .engine import HandState
+
+# Bump whenever parse_game_data's output changes so cached parses are rebuilt
+# (3: hands are settled by games.engine, all-ins count in bets;
+# 4: each hand's showdown and equity are worked out with the parse)
+PARSER_VERSION = 4
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_lines(source):
+    """
+    Yield the stripped, non-empty lines of a game file
+
+    source can be the decoded text, a Django File (FieldFile, UploadedFile)
+    or any file object opened in text or binary mode. Files are read
+    CHUNK_SIZE bytes at a time, so only one chunk is ever held in memory.
+    """
+    if isinstance(source, str):
+        chunks = [source]
+    elif hasattr(source, 'chunks'):
+        chunks = source.chunks(CHUNK_SIZE)
+    else:
+        chunks = iter(lambda: source.read(CHUNK_SIZE), source.read(0))
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()  # May be the first half of a line split across chunks
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+
+    pending = (pending + decoder.decode(b'', final=True)).strip()
+    if pending:
+        yield pending
+
+
+def iter_game_data(source):
+    """
+    Incrementally parse the game data from the Arduino-generated text file
+
+    NEW FORMAT:
+    pot:[pot1,pot2,pot3,...]  - Array of starting chips per player
+
+    OLD FORMAT (still supported):
+    pot:1000  - Single value, same starting chips for all players
+    """
+    header = {
+        'players': 0,
+        'starting_pots': [],  # NEW: Array of starting chips per player
+        'starting_pot': 0,     # OLD: Kept for backwards compatibility
+        'small_blind': 0,
+        'big_blind': 0,
+    }
+    header_sent = False
+    current_hand = None
+    state = None
+    stacks = None  # Every seat's chips after the last hand, from games.engine
+
+    for line in iter_lines(source):
+        token = tokenize_line(line)
+        kind = token.kind
+
+        if kind == tokenizer.PLAYERS:
+            header['players'] = token.amount
+
+        elif kind == tokenizer.POT:
+            if token.values:
+                # NEW FORMAT: pot:[1000,1000,1000]
+                header['starting_pots'] = list(token.values)
+                # Set starting_pot to first player's value for backwards compatibility
+                header['starting_pot'] = 0
+            else:
+                # OLD FORMAT: pot:1000
+                header['starting_pot'] = token.amount
+                # Will populate starting_pots array once we know number of players
+
+        elif kind == tokenizer.SMALL_BLIND:
+            header['small_blind'] = token.amount
+
+        elif kind == tokenizer.BIG_BLIND:
+            header['big_blind'] = token.amount
+
+        elif kind == tokenizer.HAND:
+            if current_hand:
+                stacks = _settle(current_hand, state)
+                yield 'hand', current_hand
+            elif not header_sent:
+                header_sent = True
+                yield 'header', _finish_header(header)
+                stacks = header['starting_pots']
+            current_hand = {
+                'hand_number': token.amount,
+                'dealer': None,
+                'stacks': [],
+                'actions': [],
+                'winners': [],
+            }
+            state = HandState(stacks, header['small_blind'], header['big_blind'])
+
+        elif kind == tokenizer.WINNER:
+            # Final winner - "Winner:p1-2500"
+            if current_hand:
+                stacks = _settle(current_hand, state)
+                if 1 <= token.player <= len(stacks) and stacks[token.player - 1] != token.amount:
+                    current_hand['problems'].append(
+                        f"Winner P{token.player} has {token.amount}, not {stacks[token.player - 1]}"
+                    )
+                yield 'hand', current_hand
+                current_hand = None
+            elif not header_sent:
+                header_sent = True
+                yield 'header', _finish_header(header)
+            yield 'winner', {
+                'player': token.player,
+                'final_chips': token.amount
+            }
+
+        elif not current_hand:
+            continue
+
+        elif kind == tokenizer.DEALER:
+            current_hand['dealer'] = token.amount
+
+        elif kind == tokenizer.STACKS:
+            current_hand['stacks'] = list(token.values)
+            state.set_stacks(token.values)
+
+        elif kind == tokenizer.WIN:
+            current_hand['winners'].append({'player': token.player, 'amount': token.amount})
+            state.apply(token)
+
+        else:
+            # Betting actions like p3:sb, p3:bb, p3:c-100, p3:r-50, p3:A-820, p3:F, plus hole cards and com lines
+            state.apply(token)
+            current_hand['actions'].append(line)
+
+    if current_hand:
+        _settle(current_hand, state)
+        yield 'hand', current_hand
+    elif not header_sent:
+        yield 'header', _finish_header(header)
+
+
+def _settle(hand, state):
+    """Add the engine's bets, pots, net results and problems to a finished hand; returns the stacks after it"""
+    fields, stacks = state.finish()
+    hand.update(fields)
+    return stacks
+
+
+def _finish_header(header):
+    # Backwards compatibility: If using old format, populate starting_pots array
+    if not header['starting_pots'] and header['starting_pot'] > 0 and header['players'] > 0:
+        header['starting_pots'] = [header['starting_pot']] * header['players']
+    return header
+
+
+def parse_game_data(content):
+    """
+    Parse the game data from the Arduino-generated text file into one dict
+
+    content can be anything iter_game_data() accepts.
+    """
+    data = {}
+    for kind, value in iter_game_data(content):
+        if kind == 'header':
+            data.update(value)
+            data.update(hands=[], winner=None, final_stacks={})
+        elif kind == 'hand':
+            data['hands'].append(value)
+        elif kind == 'winner':
+            data['winner'] = value
+            data['final_stacks'][value['player']] = value['final_chips']
+    return data
+
+
+def iter_game_events(game_details):
+    """Replay a parse_game_data() dict as the events iter_game_data() yields"""
+    yield 'header', game_details
+    for hand in game_details.get('hands', []):
+        yield 'hand', hand
+    if game_details.get('winner'):
+        yield 'winner', game_details['winner']
+
+
+def calculate_player_profit(game_details, player_number):
+    """
+    Calculate profit/loss for a specific player
+
+    game_details is either a parse_game_data() dict or the event stream from
+    iter_game_data(), which is consumed one hand at a time.
+    """
+    return calculate_profits(game_details, [player_number])[player_number]
+
+
+def calculate_profits(game_details, player_numbers=None):
+    """
+    Calculate profit/loss for several players in one pass
+
+    Returns {player_number: profit}. Without player_numbers every seat in the
+    game's players: header is included.
+    """
+    events = iter_game_events(game_details) if isinstance(game_details, dict) else game_details
+    calculator = ProfitCalculator(player_numbers)
+    for kind, value in events:
+        calculator.feed(kind, value)
+    return calculator.profits()
+
+
+class ProfitCalculator:
+    """
+    Incremental profit/loss calculation over iter_game_data() events
+
+    Every hand carries its Stacks: line and the net results games.engine
+    worked out for it, so a seat's chips after a hand are its stack plus its
+    net result. Nothing but the running chip counts is kept, so it can ride
+    along with any other consumer of the event stream.
+
+    Uses per-player starting chips from the starting_pots array
+    """
+
+    def __init__(self, player_numbers=None):
+        self.player_numbers = player_numbers
+        self.starting_chips = {}
+        self.chips = {}
+
+    def feed(self, kind, value):
+        if kind == 'header':
+            if self.player_numbers is None:
+                self.player_numbers = range(1, value.get('players', 0) + 1)
+            starting_pots = value.get('starting_pots', [])
+            for player_number in self.player_numbers:
+                # Get starting chips for this specific player
+                if starting_pots and len(starting_pots) >= player_number:
+                    # NEW FORMAT: Use player-specific starting chips
+                    self.starting_chips[player_number] = starting_pots[player_number - 1]
+                else:
+                    # OLD FORMAT: Fall back to single starting_pot value
+                    self.starting_chips[player_number] = value.get('starting_pot', 0)
+            self.chips = dict(self.starting_chips)
+
+        elif kind == 'hand':
+            stacks = value.get('stacks')
+            # Net results went through JSON when the hand comes from the parse cache
+            net = {int(seat): result for seat, result in value.get('net', {}).items()}
+            for player_number in self.chips:
+                if stacks and len(stacks) >= player_number:
+                    self.chips[player_number] = stacks[player_number - 1]
+                self.chips[player_number] += net.get(player_number, 0)
+
+    def profits(self):
+        return {player_number: self.chips[player_number] - starting
+                for player_number, starting in self.starting_chips.items()}
@@ -0,0 +1,153 @@
+"""
+Precomputed preflop equities
+
+The 1326 starting hands fall into 169 classes: 13 pairs, 78 suited and 78
+offsuit rank combinations. The equity of each class against 1 to 5 random
+hands, for every table size the device supports, is built once by the
+build_preflop_equity command (a vectorized Monte Carlo run through the
+evaluator) and written to PREFLOP_EQUITY_FILE.
+
+These are class-level numbers, for questions about classes like a
+starting hand's strength. Against known cards the holdings of a class
+differ with the suits they share (AsAh has 83.6% against KsQs and 82.3%
+against KdQd), so the equity of the cards actually dealt is sampled from
+them instead (games.equity).
+
+Equities are stored as uint16 fractions of 65535 after a small header. The
+file is memory-mapped when the app starts, so every process shares the same
+pages and lookups are plain array indexing.
+"""
+import logging
+import mmap
+import struct
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+
+from .evaluator import evaluate
+
+logger = logging.getLogger(__name__)
+
+CLASSES = 169
+MAX_OPPONENTS = 5  # The device supports up to 6 players
+FIELD_TRIALS = 50000
+
+MAGIC = b'NFCPREQ2'
+HEADER = struct.Struct('<8sHHI')  # magic, classes, max opponents, trials
+SCALE = 65535
+CLASS_RANKS = '23456789TJQKA'  # One letter per rank in class names
+
+PreflopTable = namedtuple('PreflopTable', ['trials', 'field'])
+
+_table = None
+
+
+def hand_class(first, second):
+    """
+    Class index of two card indexes
+
+    Classes form a 13x13 grid by rank: pairs on the diagonal, suited hands
+    at [high][low] and offsuit hands at [low][high].
+    """
+    high, low = max(first >> 2, second >> 2), min(first >> 2, second >> 2)
+    if (first & 3) == (second & 3) or high == low:
+        return high * 13 + low
+    return low * 13 + high
+
+
+def class_name(index):
+    """0 -> '22', 168 -> 'AA', 167 -> 'AKs', 155 -> 'AKo', 107 -> 'T5s'"""
+    row, column = divmod(index, 13)
+    if row == column:
+        return CLASS_RANKS[row] * 2
+    if row > column:
+        return f"{CLASS_RANKS[row]}{CLASS_RANKS[column]}s"
+    return f"{CLASS_RANKS[column]}{CLASS_RANKS[row]}o"
+
+
+def class_combos(index):
+    """Every (card, card) holding of a class"""
+    row, column = divmod(index, 13)
+    high, low = max(row, column), min(row, column)
+    if high == low:
+        return [(high * 4 + a, high * 4 + b) for a in range(4) for b in range(a + 1, 4)]
+    if row > column:
+        return [(high * 4 + suit, low * 4 + suit) for suit in range(4)]
+    return [(high * 4 + a, low * 4 + b) for a in range(4) for b in range(4) if a != b]
+
+
+def load(path=None):
+    """Memory-map the table file; returns None when it has not been built or is from an older format"""
+    global _table
+    path = path or settings.PREFLOP_EQUITY_FILE
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        _table = None  # ValueError: empty file
+        return None
+
+    magic, classes, opponents, trials = HEADER.unpack_from(buffer)
+    if magic[:-1] == MAGIC[:-1] and magic != MAGIC:
+        # Built by an older version: run without it until build_preflop_equity is run again
+        logger.warning('%s is an older preflop equity table format, rebuild it with build_preflop_equity', path)
+        _table = None
+        return None
+    if magic != MAGIC or classes != CLASSES or opponents != MAX_OPPONENTS:
+        raise ValueError(f"{path} is not a preflop equity table")
+    field = np.frombuffer(buffer, dtype='<u2', count=CLASSES * MAX_OPPONENTS, offset=HEADER.size)
+    _table = PreflopTable(trials, field.reshape(CLASSES, MAX_OPPONENTS))
+    return _table
+
+
+def get_table():
+    return _table
+
+
+def field_equity(cards, opponents):
+    """Equity (0-1) of two hole cards against 1-5 random hands, None without a table"""
+    if _table is None or not 1 <= opponents <= MAX_OPPONENTS:
+        return None
+    return int(_table.field[hand_class(*cards), opponents - 1]) / SCALE
+
+
+def build(trials=FIELD_TRIALS, seed=0):
+    """Compute the field equity array as floats"""
+    rng = np.random.default_rng(seed)
+    return np.array([_field_row(class_combos(index)[0], trials, rng) for index in range(CLASSES)])
+
+
+def write(path, field, trials):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, CLASSES, MAX_OPPONENTS, trials))
+        f.write(np.rint(np.clip(field, 0, 1) * SCALE).astype('<u2').tobytes())
+
+
+def _deal(dead, count, rng):
+    """count random cards per row that are not in that row's dead cards, in random order"""
+    keys = rng.random((len(dead), 52), dtype=np.float32)
+    np.put_along_axis(keys, dead, 2, axis=1)
+    cards = np.argpartition(keys, count, axis=1)[:, :count]
+    # argpartition leaves the picked cards in no particular order, shuffle them by key
+    order = np.argsort(np.take_along_axis(keys, cards, axis=1), axis=1)
+    return np.take_along_axis(cards, order, axis=1)
+
+
+def _field_row(cards, trials, rng):
+    """Equity of one holding against 1..MAX_OPPONENTS random hands"""
+    hole = np.broadcast_to(np.array(cards), (trials, 2))
+    dealt = _deal(hole, 5 + 2 * MAX_OPPONENTS, rng)
+    board = dealt[:, :5]
+    hero = evaluate(np.hstack([hole, board]))
+    opponents = np.stack([
+        evaluate(np.hstack([dealt[:, 5 + 2 * i:7 + 2 * i], board])) for i in range(MAX_OPPONENTS)
+    ])
+
+    row = []
+    for count in range(1, MAX_OPPONENTS + 1):
+        best = opponents[:count].max(axis=0)
+        ties = (opponents[:count] == hero).sum(axis=0)
+        row.append(np.where(hero > best, 1.0, np.where(hero == best, 1 / (ties + 1), 0.0)).mean())
+    return row
+
@@ -0,0 +1,136 @@
+"""
+Recomputing stored profits after a parser change
+
+A game's profit is worked out once, when it is processed, and
+Game.parser_version records the PARSER_VERSION that did it. After a parser
+fix bumps PARSER_VERSION, recompute_profits() brings the stale games up to
+date (`manage.py recompute_profits`). Games already worked out by the
+current parser are skipped, so an interrupted run picks up where it
+stopped.
+
+Each distinct file is parsed once however many games share it, and not at
+all when it already has a parse by the current version. The others are
+parsed FILES_PER_ROUND at a time in a process pool, like imports. New
+parses are cached as ParsedGame, so the game pages do not parse the files
+again. The games of a round are written with chunked bulk_update in one
+transaction. bulk_update skips the post_save signal, so the owners'
+UserStats are rebuilt here.
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import parse_game_file, store_parses
+from .models import Game, ParsedGame, UserStats
+from .parser import PARSER_VERSION
+
+# Games per bulk_update query
+BATCH_SIZE = 500
+# Distinct files parsed before their games are written back
+FILES_PER_ROUND = 200
+
+
+def stale_games(everything=False):
+    """Processed games whose profit is not from the current parser (every processed game with everything)"""
+    games = Game.objects.filter(status=Game.READY).exclude(game_data='')
+    if not everything:
+        # exclude() keeps the NULLs of games processed before versions were recorded
+        games = games.exclude(parser_version=PARSER_VERSION)
+    return games
+
+
+def recompute_profits(everything=False, workers=None, batch_size=BATCH_SIZE, progress=None):
+    """
+    Recompute the profit of every stale game
+
+    Returns {'games': games brought up to date, 'changed': games whose
+    profit changed, 'parsed': files parsed, 'failed': {file name: error}}.
+    progress(done, total) is called after every round of files.
+    """
+    games = {}  # File name -> its stale games
+    for game in stale_games(everything).only('id', 'user_id', 'player_number', 'profit', 'game_data', 'content_hash'):
+        games.setdefault(game.game_data.name, []).append(game)
+
+    report = {'games': 0, 'changed': 0, 'parsed': 0, 'failed': {}}
+    names = sorted(games)
+    workers = min(workers or os.cpu_count() or 1, len(names))
+    # Workers started with spawn or forkserver need their own django.setup()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=django.setup) if workers > 1 else None
+    try:
+        for start in range(0, len(names), FILES_PER_ROUND):
+            round_names = names[start:start + FILES_PER_ROUND]
+            _recompute_round({name: games[name] for name in round_names}, pool, workers, batch_size, report)
+            if progress:
+                progress(start + len(round_names), len(names))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return report
+
+
+def _recompute_round(games, pool, workers, batch_size, report):
+    """Recompute the games of one round of files, {file name: games}"""
+    hashes = {name: file_games[0].content_hash for name, file_games in games.items()}
+    profits = dict(ParsedGame.objects.filter(
+        content_hash__in={sha256 for sha256 in hashes.values() if sha256}, parser_version=PARSER_VERSION
+    ).values_list('content_hash', 'profits'))
+
+    todo = [name for name, sha256 in hashes.items() if sha256 not in profits]
+    field = Game._meta.get_field('game_data')
+    paths = [field.storage.path(name) for name in todo]
+    if pool is not None:
+        results = list(pool.map(_parse, paths, chunksize=max(1, len(paths) // (workers * 4))))
+    else:
+        results = [_parse(path) for path in paths]
+
+    parses = {}
+    for name, (sha256, fields, error) in zip(todo, results):
+        if error:
+            report['failed'][name] = error
+            continue
+        hashes[name] = sha256
+        parses[sha256] = fields
+        profits[sha256] = fields['profits']
+    report['parsed'] += len(parses)
+
+    changed = []
+    current = []
+    now = timezone.now()
+    for name, file_games in games.items():
+        if name in report['failed']:
+            continue
+        seats = profits[hashes[name]]
+        for game in file_games:
+            profit = seats[game.player_number - 1] if 1 <= game.player_number <= len(seats) else 0
+            game.parser_version = PARSER_VERSION
+            game.content_hash = hashes[name]  # Legacy files are hashed on the way
+            if profit != game.profit:
+                game.profit = profit
+                game.updated_at = now  # bulk_update does not set auto_now fields
+                changed.append(game)
+            else:
+                current.append(game)
+
+    with transaction.atomic():
+        store_parses(parses)
+        Game.objects.bulk_update(changed, ['profit', 'parser_version', 'content_hash', 'updated_at'],
+                                 batch_size=batch_size)
+        Game.objects.bulk_update(current, ['parser_version', 'content_hash'], batch_size=batch_size)
+        for user_id in {game.user_id for game in changed}:
+            UserStats.rebuild(user_id)
+    report['games'] += len(changed) + len(current)
+    report['changed'] += len(changed)
+
+
+def _parse(path):
+    """Process pool task: (sha256, ParsedGame fields, None) or (None, None, error message)"""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        return hashlib.sha256(content).hexdigest(), parse_game_file(content.decode('utf-8')), None
+    except Exception as e:
+        return None, None, f'{type(e).__name__}: {e}'
@@ -0,0 +1,115 @@
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .blobs import release_blob
+from .cache import delete_binary_log
+from .downloads import delete_gzip_copy
+from .models import Game, UserStats
+
+
+@receiver(post_delete, sender=Game)
+def release_game_file(sender, instance, **kwargs):
+    """Give back a deleted game's reference to its stored file"""
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.game_data and not Game.objects.filter(game_data=instance.game_data.name).exists():
+        # Uploaded before files were deduplicated: the game owns its file
+        try:
+            delete_binary_log(instance.game_data)
+            delete_gzip_copy(instance.game_data)
+            instance.game_data.delete(save=False)
+        except Exception:
+            pass  # Ignore file deletion errors
+
+
+@receiver(post_init, sender=Game)
+def remember_counted_values(sender, instance, **kwargs):
+    # What UserStats currently counts for this game, to apply only the difference on save.
+    # Only processed games are counted; None when a field was deferred and it is not known.
+    values = instance.__dict__
+    if instance.pk is None:
+        instance._stats_counted = False
+    elif {'status', 'user_id', 'profit', 'date'} <= values.keys():
+        instance._stats_counted = values['status'] == Game.READY
+    else:
+        instance._stats_counted = None
+    instance._stats_user_id = values.get('user_id')
+    instance._stats_profit = values.get('profit')
+
+
+@receiver(post_save, sender=Game)
+def update_user_stats_on_save(sender, instance, created, **kwargs):
+    """Fold a saved game into its user's stats without touching their other games"""
+    profit = instance.profit
+    counted = instance.status == Game.READY
+    # Every save moves the stats' updated_at, since the games index shows every game
+    added = {'all_game_count': F('all_game_count') + 1} if created else {}
+    if instance._stats_counted is None:
+        UserStats.rebuild(instance.user_id)
+    elif counted and not instance._stats_counted:
+        # Processed: it joins the totals
+        _apply(
+            instance.user_id,
+            total_profit=F('total_profit') + profit,
+            game_count=F('game_count') + 1,
+            best_profit=Greatest(Coalesce('best_profit', Value(profit)), Value(profit)),
+            worst_profit=Least(Coalesce('worst_profit', Value(profit)), Value(profit)),
+            last_played=Greatest(Coalesce('last_played', Value(instance.date)), Value(instance.date)),
+            **added,
+        )
+    elif instance._stats_counted and not counted:
+        # Queued for processing again: out until it is done
+        _take_out(instance._stats_user_id, instance._stats_profit, instance.date)
+    elif instance._stats_user_id != instance.user_id:
+        # Moved to another user (admin): both totals change
+        UserStats.rebuild(instance._stats_user_id)
+        UserStats.rebuild(instance.user_id)
+    elif counted and instance._stats_profit != profit:
+        stats = UserStats.objects.filter(user_id=instance.user_id).first()
+        if stats is None or instance._stats_profit in (stats.best_profit, stats.worst_profit):
+            # The old value may have been the best or worst session
+            UserStats.rebuild(instance.user_id)
+        else:
+            _apply(
+                instance.user_id,
+                total_profit=F('total_profit') + profit - instance._stats_profit,
+                best_profit=Greatest('best_profit', Value(profit)),
+                worst_profit=Least('worst_profit', Value(profit)),
+            )
+    else:
+        # Nothing counted changed (e.g. renamed, or a new pending game)
+        _apply(instance.user_id, **added)
+    instance._stats_counted = counted
+    instance._stats_user_id = instance.user_id
+    instance._stats_profit = profit
+
+
+def _apply(user_id, **changes):
+    """Bump a user's stats with changes, building them from their games when they have none yet"""
+    if not UserStats.bump(user_id, **changes):
+        UserStats.rebuild(user_id)
+
+
+@receiver(post_delete, sender=Game)
+def update_user_stats_on_delete(sender, instance, **kwargs):
+    """Take a deleted game out of its user's stats"""
+    removed = {'all_game_count': F('all_game_count') - 1}
+    if instance._stats_counted is None:
+        UserStats.rebuild(instance.user_id)
+    elif instance._stats_counted:
+        _take_out(instance._stats_user_id, instance._stats_profit, instance.date, **removed)
+    else:
+        UserStats.bump(instance._stats_user_id, **removed)
+
+
+def _take_out(user_id, profit, date, **changes):
+    """Remove a game that was counted with this profit and date from its user's stats, applying changes too"""
+    stats = UserStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        return
+    if profit in (stats.best_profit, stats.worst_profit) or date == stats.last_played:
+        UserStats.rebuild(user_id)
+    else:
+        UserStats.bump(user_id, total_profit=F('total_profit') - profit, game_count=F('game_count') - 1, **changes)
@@ -0,0 +1,166 @@
+"""
+Cross-game player statistics
+
+Each game's Hand and Action rows are also kept packed as NumPy arrays in an
+ActionLog, so a user's whole history loads with one row per game instead of
+one per action. Every metric is then computed with vectorized operations
+over all their games at once; groupings (by seat, by table size) are single
+bincount passes.
+"""
+import numpy as np
+from django.db import connections, router
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Action, ActionLog, Game, Hand
+
+# Integer codes for the columns loaded as arrays
+STREETS = [Action.PREFLOP, Action.FLOP, Action.TURN, Action.RIVER]
+PREFLOP = STREETS.index(Action.PREFLOP)
+ACTION_TYPES = [Action.POST_SB, Action.POST_BB, Action.CALL, Action.RAISE, Action.ALL_IN, Action.FOLD, Action.WIN]
+POST_SB, POST_BB, CALL, RAISE, ALL_IN, FOLD, WIN = range(len(ACTION_TYPES))
+
+# The device supports up to 6 players
+MAX_SEATS = 6
+
+
+def load_history(user):
+    """
+    Return (hands, actions) arrays for all of a user's games
+
+    hands has a row of seat, players, players_at_end, big_blind per hand,
+    with the user's seat in that game. actions has a row of hand index,
+    street, action_type, amount for each of the user's own actions, with
+    street and action_type as codes.
+    """
+    games = Game.objects.filter(user=user).values_list('id', 'player_number', 'status')
+    logs = {log.game_id: log for log in ActionLog.objects.filter(game__user=user)}
+    hand_parts = []
+    action_parts = []
+    offset = 0
+    for game_id, seat, status in games:
+        # Only a processed game's rows are final; the rows of a game still being played or processed
+        # are packed for this request alone
+        log = logs.get(game_id) or pack_action_log(game_id, save=status == Game.READY)
+        hands = np.frombuffer(log.hands, dtype=np.int32).reshape(-1, 3)
+        actions = np.frombuffer(log.actions, dtype=np.int32).reshape(-1, 5)
+        mine = actions[actions[:, 1] == seat]
+        hand_parts.append(np.column_stack([np.full(len(hands), seat, dtype=np.int32), hands]))
+        action_parts.append(np.column_stack([mine[:, 0] + offset, mine[:, 2:]]))
+        offset += len(hands)
+
+    if not hand_parts:
+        return np.zeros((0, 4), dtype=np.int64), np.zeros((0, 4), dtype=np.int64)
+    return np.concatenate(hand_parts).astype(np.int64), np.concatenate(action_parts).astype(np.int64)
+
+
+def pack_action_log(game_id, save=True):
+    """Pack a game's Hand and Action rows into its ActionLog, saving it unless save is False"""
+    hands = _fetch_array(
+        Hand.objects.filter(game_id=game_id).order_by('position'), ['players', 'players_at_end', 'big_blind']
+    )
+    actions = _fetch_array(
+        Action.objects.filter(game_id=game_id, action_type__in=ACTION_TYPES).annotate(
+            position=F('hand__position'),
+            street_code=_codes('street', STREETS),
+            type_code=_codes('action_type', ACTION_TYPES),
+            chips=Coalesce('amount', 0),
+        ).order_by(),
+        ['position', 'seat', 'street_code', 'type_code', 'chips'],
+    )
+    log = ActionLog(
+        game_id=game_id, hands=hands.astype(np.int32).tobytes(), actions=actions.astype(np.int32).tobytes()
+    )
+    if save:
+        log.save()
+    return log
+
+
+def _codes(field, values):
+    whens = [When(**{field: value}, then=Value(code)) for code, value in enumerate(values)]
+    return Case(*whens, default=Value(-1), output_field=IntegerField())
+
+
+def _fetch_array(queryset, columns):
+    # Rows go from the cursor into NumPy without building model instances
+    alias = router.db_for_read(queryset.model)
+    sql, params = queryset.values_list(*columns).query.get_compiler(alias).as_sql()
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1, len(columns))
+
+
+def player_stats(user):
+    """
+    Return the user's VPIP, PFR, aggression factor, showdown frequency and bb/100
+
+    The result has an 'overall' row plus 'by_seat' and 'by_table_size'
+    lists of rows (see _rows() for the keys).
+    """
+    hands, actions = load_history(user)
+    seats, players, players_at_end, big_blinds = hands.T
+    index, streets, kinds, amounts = actions.T
+    count = len(hands)
+
+    def per_hand(mask, weights=None):
+        return np.bincount(index[mask], weights=None if weights is None else weights[mask], minlength=count)
+
+    preflop = streets == PREFLOP
+    aggressive = (kinds == RAISE) | (kinds == ALL_IN)
+    calls = (kinds == CALL) & (amounts > 0)  # c-0 is a check
+    invested = (kinds >= POST_SB) & (kinds <= ALL_IN)  # Blinds, calls, raises and all-ins put chips in
+
+    played = per_hand(np.ones(len(index), dtype=bool)) > 0  # Busted players are not dealt in
+    folded = per_hand(kinds == FOLD) > 0
+    won = per_hand(kinds == WIN, amounts)
+    net = won - per_hand(invested, amounts)
+    showdown = played & ~folded & (players_at_end >= 2)
+
+    columns = {
+        'vpip': per_hand(preflop & (calls | aggressive)) > 0,
+        'pfr': per_hand(preflop & aggressive) > 0,
+        'postflop_aggressive': per_hand(~preflop & aggressive),
+        'postflop_calls': per_hand(~preflop & calls),
+        'showdown': showdown,
+        'showdown_won': showdown & (won > 0),
+        'net': net,
+        'net_bb': np.divide(net, big_blinds, out=np.zeros(count), where=big_blinds > 0),
+    }
+
+    return {
+        'hands': int(played.sum()),
+        'overall': _rows(np.zeros(count, dtype=np.int64), played, columns, 1)[0],
+        'by_seat': _rows(seats, played, columns, MAX_SEATS + 1)[1:],
+        'by_table_size': _rows(players, played, columns, MAX_SEATS + 1)[2:],
+    }
+
+
+def _rows(keys, played, columns, size):
+    """Sum every column per key in one bincount each and turn the sums into rates"""
+    keys = keys[played]
+    sums = {name: np.bincount(keys, weights=values[played], minlength=size) for name, values in columns.items()}
+    hands = np.bincount(keys, minlength=size)
+
+    rows = []
+    for key in range(size):
+        n = hands[key]
+        calls = sums['postflop_calls'][key]
+        showdowns = sums['showdown'][key]
+        rows.append({
+            'key': key,
+            'hands': int(n),
+            'vpip': _percent(sums['vpip'][key], n),
+            'pfr': _percent(sums['pfr'][key], n),
+            # (bets + raises) / calls after the flop; None when there were no calls
+            'aggression': round(float(sums['postflop_aggressive'][key] / calls), 2) if calls else None,
+            'showdown': _percent(showdowns, n),
+            'won_at_showdown': _percent(sums['showdown_won'][key], showdowns),
+            'bb_per_100': (round(float(100 * sums['net_bb'][key] / n), 2) or 0.0) if n else None,
+            'net': int(sums['net'][key]),
+        })
+    return rows
+
+
+def _percent(part, whole):
+    return round(float(100 * part / whole), 1) if whole else None
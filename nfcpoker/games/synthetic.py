@@ -0,0 +1,259 @@
+"""
+Seeded generator of synthetic NFC Poker game logs
+
+The logs use the same line grammar the Arduino sketch writes to the SD card
+(players:/pot:/sb:/bb:/Game Start, then hand:/dealer:/Stacks:, hole cards,
+blinds, c-/r-/A-/F actions, com: boards, W-p winnings and a final Winner:
+line), and chips are conserved from hand to hand, so they can stand in for
+real session files of any size in benchmarks.
+
+To keep a game going for as many hands as requested nobody busts during
+normal play: a player who moves all-in always wins or chops every pot they
+are eligible for. With finish=True a last hand is played where every seat
+is all-in and one player takes every chip, which ends the game with a
+Winner: line.
+"""
+import random
+
+RANKS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
+SUITS = ['H', 'C', 'D', 'S']
+DECK = [f"{rank}-{suit}" for suit in SUITS for rank in RANKS]
+
+MAX_RAISES_PER_STREET = 3
+
+
+def generate_game_log(players=6, hands=100, all_in_freq=0.05, starting_chips=1000, big_blind=20,
+                      seed=0, finish=True):
+    """Return a synthetic game log as text"""
+    return '\n'.join(iter_game_log(players, hands, all_in_freq, starting_chips, big_blind, seed, finish)) + '\n'
+
+
+def write_game_log(path, **options):
+    """Write a synthetic game log to path, one line at a time"""
+    with open(path, 'w') as f:
+        for line in iter_game_log(**options):
+            f.write(line + '\n')
+
+
+def iter_game_log(players=6, hands=100, all_in_freq=0.05, starting_chips=1000, big_blind=20,
+                  seed=0, finish=True):
+    """
+    Yield the lines of a synthetic game log
+
+    starting_chips is either one stack size for every player (pot:1000) or a
+    list with one stack per player (pot:[1000,1500,...]).
+    """
+    if not 2 <= players <= 6:
+        raise ValueError("players must be between 2 and 6")
+
+    rng = random.Random(seed)
+    if isinstance(starting_chips, int):
+        chips = [starting_chips] * players
+        pot_line = f"pot:{starting_chips}"
+    else:
+        chips = list(starting_chips)
+        if len(chips) != players:
+            raise ValueError("starting_chips needs one entry per player")
+        pot_line = f"pot:[{','.join(map(str, chips))}]"
+    small_blind = big_blind // 2
+
+    yield f"players:{players}"
+    yield pot_line
+    yield f"sb:{small_blind}"
+    yield f"bb:{big_blind}"
+    yield "Game Start"
+
+    table = _Table(rng, chips, small_blind, big_blind, all_in_freq)
+    for hand_number in range(1, hands + 1):
+        yield from table.play_hand(hand_number)
+
+    if finish:
+        yield from table.play_hand(hands + 1, showdown_for_everything=True)
+        winner = max(range(players), key=lambda seat: table.chips[seat])
+        yield f"Winner:p{winner + 1}-{table.chips[winner]}"
+
+
+class _Table:
+    """Chip and seat state of the generated game, mirroring NFC-Poker.ino's betting loop"""
+
+    def __init__(self, rng, chips, small_blind, big_blind, all_in_freq):
+        self.rng = rng
+        self.chips = chips
+        self.players = len(chips)
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.all_in_freq = all_in_freq
+        # Calls and raises always leave this much behind; shorter stacks only ever shove
+        self.reserve = 3 * big_blind
+        self.dealer = 0
+
+    def _next_seat(self, seat, seats):
+        seat = (seat + 1) % self.players
+        while seat not in seats:
+            seat = (seat + 1) % self.players
+        return seat
+
+    def play_hand(self, hand_number, showdown_for_everything=False):
+        rng = self.rng
+        seats = [seat for seat in range(self.players) if self.chips[seat] > 0]
+        self.folded = set()
+        self.all_in = set()
+        self.contributed = [0] * self.players
+
+        yield f"hand:{hand_number}"
+        yield f"dealer:{self.dealer}"
+        yield f"Stacks:[{','.join(map(str, self.chips))}]"
+
+        deck = DECK[:]
+        rng.shuffle(deck)
+        order = [(self.dealer + 1 + i) % self.players for i in range(self.players)]
+        for _ in range(2):
+            for seat in order:
+                if seat in seats:
+                    yield f"p{seat + 1}:{deck.pop()}"
+
+        if showdown_for_everything:
+            for seat in order:
+                if seat in seats:
+                    yield from self._shove(seat, [0] * self.players)
+            board = [deck.pop() for _ in range(5)]
+            yield "com:" + ",".join(board)
+            # Settle every chip on one player so the game ends: the biggest stack, who is in every pot
+            winner = max(seats, key=lambda seat: self.contributed[seat])
+            total = sum(self.contributed)
+            self.chips[winner] += total
+            yield f"W-p{winner + 1}:{total}"
+            return
+
+        # Blinds: heads-up only the big blind posts, as on the device
+        sb_seat = self._next_seat(self.dealer, seats)
+        bb_seat = self._next_seat(sb_seat, seats)
+        bets = [0] * self.players
+        if len(seats) > 2:
+            self._put(sb_seat, self.small_blind, bets)
+            yield f"p{sb_seat + 1}:sb"
+            first = self._next_seat(bb_seat, seats)
+        else:
+            first = self.dealer
+        self._put(bb_seat, self.big_blind, bets)
+        yield f"p{bb_seat + 1}:bb"
+
+        yield from self._betting_round(seats, first, bets, self.big_blind)
+
+        board = []
+        for count in (3, 1, 1):
+            if self._active_count(seats) < 2:
+                break
+            board += [deck.pop() for _ in range(count)]
+            yield "com:" + ",".join(board[-count:])
+            if self._can_act_count(seats) >= 2:
+                yield from self._betting_round(seats, self._next_seat(self.dealer, seats), [0] * self.players, 0)
+
+        if self._active_count(seats) >= 2 and len(board) < 5:
+            # Everyone left is all-in: the rest of the board is scanned at showdown
+            rest = [deck.pop() for _ in range(5 - len(board))]
+            yield "com:" + ",".join(rest)
+
+        yield from self._showdown(seats)
+        self.dealer = (self.dealer + 1) % self.players
+
+    def _active_count(self, seats):
+        return sum(1 for seat in seats if seat not in self.folded)
+
+    def _can_act_count(self, seats):
+        return sum(1 for seat in seats if seat not in self.folded and seat not in self.all_in)
+
+    def _put(self, seat, amount, bets):
+        self.chips[seat] -= amount
+        self.contributed[seat] += amount
+        bets[seat] += amount
+
+    def _shove(self, seat, bets):
+        amount = self.chips[seat]
+        self._put(seat, amount, bets)
+        self.all_in.add(seat)
+        yield f"p{seat + 1}:A-{amount}"
+
+    def _betting_round(self, seats, first, bets, current_bet):
+        rng = self.rng
+        min_raise = self.big_blind
+        raises = 0
+        acted = set()
+        seat = first
+        while True:
+            can_act = [s for s in seats if s not in self.folded and s not in self.all_in]
+            if all(s in acted and bets[s] == current_bet for s in can_act):
+                return
+            if len(can_act) == 1 and bets[can_act[0]] >= current_bet:
+                return
+            if seat not in can_act:
+                seat = (seat + 1) % self.players
+                continue
+
+            to_call = current_bet - bets[seat]
+            stack = self.chips[seat]
+            roll = rng.random()
+            if roll < self.all_in_freq or stack < self.reserve:
+                yield from self._shove(seat, bets)
+            elif stack - to_call < self.reserve:
+                if rng.random() < 0.3:
+                    yield from self._shove(seat, bets)
+                else:
+                    self.folded.add(seat)
+                    yield f"p{seat + 1}:F"
+            elif to_call > 0 and roll < 0.35:
+                self.folded.add(seat)
+                yield f"p{seat + 1}:F"
+            elif roll > 0.8 and raises < MAX_RAISES_PER_STREET:
+                raise_by = min_raise * rng.randint(1, 3)
+                amount = to_call + raise_by
+                if stack - amount < self.reserve:
+                    self._put(seat, to_call, bets)
+                    yield f"p{seat + 1}:c-{to_call}"
+                else:
+                    self._put(seat, amount, bets)
+                    min_raise = raise_by
+                    raises += 1
+                    yield f"p{seat + 1}:r-{amount}"
+            else:
+                self._put(seat, to_call, bets)
+                yield f"p{seat + 1}:c-{to_call}"
+
+            if bets[seat] > current_bet:
+                min_raise = max(min_raise, bets[seat] - current_bet)
+                current_bet = bets[seat]
+            acted.add(seat)
+            seat = (seat + 1) % self.players
+
+    def _showdown(self, seats):
+        rng = self.rng
+        live = [seat for seat in seats if seat not in self.folded]
+        winnings = [0] * self.players
+        if len(live) == 1:
+            winnings[live[0]] = sum(self.contributed)
+        else:
+            # Split the pot into main and side pots by contribution level
+            levels = sorted({self.contributed[seat] for seat in live})
+            previous = 0
+            for level in levels:
+                layer = sum(min(c, level) - min(c, previous) for c in self.contributed)
+                eligible = [seat for seat in live if self.contributed[seat] >= level]
+                shoved = [seat for seat in eligible if seat in self.all_in]
+                # All-in players always win, and chop with each other, so nobody busts mid-game
+                if shoved:
+                    winners = shoved
+                else:
+                    winners = [rng.choice(eligible)]
+                share, odd = divmod(layer, len(winners))
+                for i, seat in enumerate(winners):
+                    winnings[seat] += share + (1 if i < odd else 0)
+                previous = level
+            # Chips from folded players above the top live level go to the last pot's winner
+            leftover = sum(self.contributed) - sum(winnings)
+            if leftover:
+                winnings[winners[0]] += leftover
+
+        for seat in range(self.players):
+            if winnings[seat]:
+                self.chips[seat] += winnings[seat]
+                yield f"W-p{seat + 1}:{winnings[seat]}"
@@ -1,3 +1,1309 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+from collections import Counter
+from datetime import timedelta
+from itertools import combinations
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from pokerlog import binlog, tokenizer
+from pokerlog.tokenizer import tokenize_line
+
+from . import feed, jobs
+from .cache import ANNOTATION_FIELDS, get_hands, get_parsed_game
+from .downloads import gzip_path
+from .engine import HandState
+from .evaluator import CATEGORIES, card_index, category_name, evaluate
+from .history import hand_to_actions, record_hands
+from .imports import DUPLICATE, FAILED, IMPORTED, SKIPPED, import_games
+from .live import LiveRecorder
+from .models import Action, ActionLog, Game, GameBlob, GameImport, Hand, Job, ParsedGame, UserStats
+from .pagination import decode_cursor, encode_cursor, paginate_games
+from .parser import PARSER_VERSION, calculate_player_profit, parse_game_data
+from .profits import recompute_profits, stale_games
+from .stats import ACTION_TYPES, load_history
+from .synthetic import generate_game_log
+from .views import HANDS_PER_REQUEST
+
+
+class MediaRootMixin:
+    """Stores files in a temporary MEDIA_ROOT for the test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+
+def _read_events(text):
+    """(data lines, last event id, whether an 'end' event was sent) of server-sent events text"""
+    lines, last_id, ended = [], None, False
+    for block in text.split('\n\n'):
+        fields = [line.partition(': ') for line in block.split('\n') if line]
+        if ('event', ': ', 'end') in fields:
+            ended = True
+            continue
+        for name, _, value in fields:
+            if name == 'data':
+                lines.append(value)
+            elif name == 'id':
+                last_id = int(value)
+    return lines, last_id, ended
+
+
+class GameFeedTests(MediaRootMixin, TestCase):
+    """The spectator feed of a live game, streamed by the async view"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob', password='x')
+        self.lines = generate_game_log(players=4, hands=30, seed=3).splitlines()
+        self.recorder = LiveRecorder(self.user, 1)
+        self.recorder.feed(self.lines[:200])
+        self.game = Game.objects.get()
+        # A small window, so catching up reads lines back from the log
+        self.enterContext(mock.patch.object(feed, 'WINDOW_LINES', 20))
+        self.enterContext(mock.patch.object(feed, 'POLL_INTERVAL', 0.01))
+
+    async def _stream(self, response, until):
+        """Read the streamed response until until(data lines, last id, ended) holds"""
+        text = ''
+        async for chunk in response.streaming_content:
+            text += chunk.decode() if isinstance(chunk, bytes) else chunk
+            events = _read_events(text)
+            if until(*events):
+                return events
+        return _read_events(text)
+
+    async def _get(self, last_event_id=None):
+        await self.async_client.aforce_login(self.user)
+        headers = {} if last_event_id is None else {'Last-Event-ID': str(last_event_id)}
+        return await self.async_client.get(reverse('games.feed', args=[self.game.id]), headers=headers)
+
+    async def test_reconnect_with_last_event_id(self):
+        response = await self._get()
+        lines, last_id, _ = await self._stream(response, lambda lines, *_: len(lines) >= 200)
+        self.assertEqual(lines, self.lines[:200])
+        self.assertEqual(last_id, 200)
+
+        # More lines than the window while the spectator was away
+        await sync_to_async(self.recorder.feed)(self.lines[200:260])
+        response = await self._get(last_event_id=150)
+        lines, last_id, _ = await self._stream(response, lambda lines, *_: len(lines) >= 110)
+        self.assertEqual(lines, self.lines[150:260])
+        self.assertEqual(last_id, 260)
+
+    async def test_end_event(self):
+        response = await self._get(last_event_id=10)
+        stream = asyncio.ensure_future(self._stream(response, lambda lines, last_id, ended: ended))
+        await asyncio.sleep(0.05)
+        # The recorder deletes the live log when the game ends; the feed still sends every line
+        await sync_to_async(self.recorder.feed)(self.lines[200:])
+        lines, last_id, ended = await asyncio.wait_for(stream, 10)
+        self.assertTrue(ended)
+        self.assertEqual(lines, self.lines[10:])
+        self.assertEqual(last_id, len(self.lines))
+
+        # Reconnecting after the end only gets the end again
+        response = await self._get(last_event_id=last_id)
+        self.assertEqual(response.content, f'event: end\ndata: {last_id}\n\n'.encode())
+
+
+class TokenizerTests(SimpleTestCase):
+    """Every kind of log line decodes to its token"""
+
+    def test_lines(self):
+        cases = [
+            ('players:3', tokenizer.PLAYERS, dict(amount=3)),
+            ('pot:1000', tokenizer.POT, dict(amount=1000)),
+            ('pot:[1000,1500]', tokenizer.POT, dict(values=(1000, 1500))),
+            ('pot:1000, 1500]', tokenizer.POT, dict(values=(1000, 1500))),
+            ('sb:10', tokenizer.SMALL_BLIND, dict(amount=10)),
+            ('bb:20', tokenizer.BIG_BLIND, dict(amount=20)),
+            ('Game Start', tokenizer.GAME_START, {}),
+            ('hand:4', tokenizer.HAND, dict(amount=4)),
+            ('dealer:2', tokenizer.DEALER, dict(amount=2)),
+            ('Stacks:[980,1020]', tokenizer.STACKS, dict(values=(980, 1020))),
+            ('com:2-D,Q-D,10-C', tokenizer.COMMUNITY, dict(cards=('2-D', 'Q-D', '10-C'))),
+            ('p2:10-H', tokenizer.HOLE_CARD, dict(player=2, cards=('10-H',))),
+            ('p2:sb', tokenizer.POST_SB, dict(player=2)),
+            ('p3:bb', tokenizer.POST_BB, dict(player=3)),
+            ('p1:c-0', tokenizer.CALL, dict(player=1, amount=0)),
+            ('p1:r-60', tokenizer.RAISE, dict(player=1, amount=60)),
+            ('p1:A-820', tokenizer.ALL_IN, dict(player=1, amount=820)),
+            ('p1:a-820', tokenizer.ALL_IN, dict(player=1, amount=820)),
+            ('p4:F', tokenizer.FOLD, dict(player=4)),
+            ('W-p3:450', tokenizer.WIN, dict(player=3, amount=450)),
+            ('Winner:p1-2500', tokenizer.WINNER, dict(player=1, amount=2500)),
+            # Unrecognised moves keep their player, anything else is just unknown
+            ('p2:x-5', tokenizer.UNKNOWN, dict(player=2)),
+            ('p2:1-H', tokenizer.UNKNOWN, dict(player=2)),
+            ('players:three', tokenizer.UNKNOWN, {}),
+            ('Stacks:980;1020', tokenizer.UNKNOWN, {}),
+            ('Winner:p1', tokenizer.UNKNOWN, {}),
+            ('W-p3:lots', tokenizer.UNKNOWN, {}),
+            ('px:F', tokenizer.UNKNOWN, {}),
+            ('Battery low', tokenizer.UNKNOWN, {}),
+        ]
+        for line, kind, fields in cases:
+            with self.subTest(line=line):
+                self.assertEqual(tokenize_line(line), tokenizer.Token(kind, line=line, **fields))
+
+    def test_blank_lines_are_skipped(self):
+        tokens = list(tokenizer.tokenize(['hand:1\n', '  \n', ' p1:F ']))
+        self.assertEqual([token.kind for token in tokens], [tokenizer.HAND, tokenizer.FOLD])
+        self.assertEqual(tokens[1].line, 'p1:F')
+
+
+class LiveRecorderTests(MediaRootMixin, TestCase):
+    """Recording a game from the device's lines, through resends and restarts"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+        self.lines = generate_game_log(players=3, hands=6, seed=6).splitlines()
+        self.hand_starts = [i for i, line in enumerate(self.lines) if line.startswith('hand:')]
+        self.recorder = LiveRecorder(self.user, 1)
+
+    def _log(self):
+        game = Game.objects.get()
+        with default_storage.open(game.game_data.name) as f:
+            return f.read().decode().splitlines()
+
+    def _check_finished(self):
+        game = Game.objects.get()
+        self.assertEqual(game.status, Game.PENDING)
+        self.assertEqual(self._log(), self.lines)
+        self.assertTrue(Job.objects.filter(game=game, kind=jobs.PROCESS_GAME).exists())
+
+    def test_whole_game(self):
+        self.recorder.feed(self.lines[:self.hand_starts[3]])
+        game = Game.objects.get()
+        self.assertEqual(game.status, Game.LIVE)
+        self.assertEqual(self._log(), self.lines[:self.hand_starts[3]])
+        self.assertEqual(game.hands.count(), 2)  # Hand 3 is not over until hand 4 starts
+        self.recorder.feed(self.lines[self.hand_starts[3]:])
+        self._check_finished()
+
+    def test_resent_lines_are_dropped(self):
+        middle = self.hand_starts[2] + 5
+        self.recorder.feed(self.lines[:middle])
+        # Reconnected: the device resends the current hand, then an older one
+        self.recorder.feed(self.lines[self.hand_starts[2]:middle + 3])
+        self.recorder.feed(self.lines[self.hand_starts[1]:middle + 3])
+        self.assertEqual(self._log(), self.lines[:middle + 3])
+        self.recorder.feed(self.lines[middle + 3:])
+        self._check_finished()
+
+    def test_resend_that_differs(self):
+        start = self.hand_starts[2]
+        stale = self.lines[:start + 4] + ['p1:F', 'p2:c-0']
+        self.recorder.feed(stale)
+        # The device's resend of the hand is what counts from where it differs
+        with self.assertLogs('games.live', 'WARNING'):
+            self.recorder.feed(self.lines[start:start + 6])
+        self.assertEqual(self._log(), self.lines[:start + 6])
+        self.assertEqual(self.recorder.hand_lines, self.lines[start:start + 6])
+        self.recorder.feed(self.lines[start + 6:])
+        self._check_finished()
+
+    def test_resume_after_a_restart(self):
+        middle = self.hand_starts[3] + 4
+        self.recorder.feed(self.lines[:middle])
+        self.recorder.close()
+        game = Game.objects.get()
+        # The restart cut a line short
+        with open(default_storage.path(game.game_data.name), 'a') as f:
+            f.write(self.lines[middle][:2])
+
+        recorder = LiveRecorder(self.user, 1)
+        self.assertEqual(recorder.resume(), game)
+        self.assertEqual(self._log(), self.lines[:middle])
+        self.assertEqual(recorder.hands_done, 3)
+        # The device resends the hand it was in
+        recorder.feed(self.lines[self.hand_starts[3]:])
+        self._check_finished()
+        # Hands recorded before the restart are not inserted twice
+        self.assertEqual(Hand.objects.filter(game=game).count(), len(self.hand_starts))
+
+
+class BinlogTests(SimpleTestCase):
+    """Binary game logs decode back to the text log's lines"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'game' + binlog.EXTENSION)
+
+    def _open(self, lines):
+        with open(self.path, 'wb') as f:
+            f.write(binlog.encode(lines))
+        game_log = binlog.GameLog(self.path)
+        self.addCleanup(game_log.close)
+        return game_log
+
+    def test_round_trip(self):
+        header = ['players:3', 'pot:[1000,1000,500]', 'sb:10', 'bb:20', 'Game Start']
+        first = ['hand:1', 'dealer:0', 'Stacks:[1000,1000,500]', 'p1:A-S', 'p1:10-H', 'p2:sb', 'p3:bb',
+                 'p1:r-60', 'p2:A-990', 'p3:a-480', 'p1:c-940', 'com:2-D,Q-D,3-C', 'com:K-S', 'com:4-H',
+                 'W-p2:1500', 'W-p1:980']
+        second = ['hand:2', 'Stacks:[980,1520,0]', 'p1:F', 'W-p2:30']
+        lines = header + first + second + ['Winner:p2-2500']
+        game_log = self._open(lines)
+
+        self.assertEqual(game_log.lines(), lines)
+        self.assertEqual(game_log.hand_count, 2)
+        self.assertEqual(game_log.header_lines(), header)
+        self.assertEqual(game_log.hand_lines(0), first)
+        self.assertEqual(game_log.hand_lines(1), second)
+        self.assertEqual(game_log.trailer_lines(), ['Winner:p2-2500'])
+        self.assertEqual(game_log.find_hand(2), 1)
+        self.assertIsNone(game_log.find_hand(3))
+
+    def test_synthetic_game_round_trip(self):
+        lines = generate_game_log(players=6, hands=50, all_in_freq=0.3, seed=1).splitlines()
+        self.assertEqual(self._open(lines).lines(), lines)
+
+    def test_raw_fallback(self):
+        # A misread card, a seat above 8, odd spacing, an unknown move and text that is no line at all
+        odd = ['p2:Z-Q', 'p9:c-10', 'p1: c-10', 'p1:x-5', 'hand: 3', 'Stacks:[1, 2]', 'garbage ✓']
+        for line in odd:
+            out = bytearray()
+            binlog.encode_line(line, out)
+            self.assertEqual(out[0], binlog.OP_RAW, line)
+            self.assertEqual(binlog.decode_lines(out), [line])
+        lines = ['players:2', 'Game Start', 'hand:1', *odd]
+        self.assertEqual(self._open(lines).lines(), lines)
+
+    def test_no_hands(self):
+        header = ['players:2', 'pot:1000', 'sb:10', 'bb:20', 'Game Start']
+        game_log = self._open(header)
+        self.assertEqual(game_log.hand_count, 0)
+        self.assertEqual(game_log.header_lines(), header)
+        self.assertEqual(game_log.trailer_lines(), [])
+        self.assertEqual(game_log.hands_lines(0, 5), [])
+
+    def test_empty_file(self):
+        game_log = self._open([])
+        self.assertEqual(game_log.hand_count, 0)
+        self.assertEqual(game_log.lines(), [])
+
+    def test_not_a_binary_log(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'players:2\nGame Start\n')
+        with self.assertRaises(ValueError):
+            binlog.GameLog(self.path)
+
+
+def _play(state, lines):
+    for line in lines:
+        state.apply(tokenize_line(line))
+    return state.finish()
+
+
+class HandStateTests(SimpleTestCase):
+    """Settling a hand's chips with games.engine"""
+
+    def test_side_pots(self):
+        state = HandState([100, 300, 300, 500], 10, 20)
+        fields, stacks = _play(state, [
+            'p1:sb', 'p2:bb', 'p3:c-20', 'p4:c-20',
+            'p1:A-90', 'p2:c-80', 'p3:c-80', 'p4:F',     # Seat 1 all in for 100
+            'com:2-D,Q-D,3-C', 'p2:A-200', 'p3:c-200',  # Seats 2 and 3 all in for 300
+            'W-p1:320', 'W-p3:400',
+        ])
+        self.assertEqual(fields['pots'], [
+            {'amount': 320, 'players': [1, 2, 3]},  # Seat 4's 20 is in the main pot
+            {'amount': 400, 'players': [2, 3]},
+        ])
+        self.assertEqual(fields['bets'], {1: 100, 2: 300, 3: 300, 4: 20})
+        self.assertEqual(fields['net'], {1: 220, 2: -300, 3: 100, 4: -20})
+        self.assertEqual(fields['problems'], [])
+        self.assertEqual(stacks, [320, 0, 400, 480])
+
+    def test_win_above_eligible_pots(self):
+        state = HandState([100, 300, 300], 10, 20)
+        fields, _ = _play(state, [
+            'p1:sb', 'p2:bb', 'p3:c-20', 'p1:A-90', 'p2:c-80', 'p3:c-80',
+            'com:2-D,Q-D,3-C', 'p2:A-200', 'p3:c-200', 'W-p1:700',
+        ])
+        self.assertEqual(fields['problems'], ['P1 won 700 but was only in pots worth 300'])
+
+    def test_last_seat_in_takes_the_pot_without_a_win_line(self):
+        state = HandState([1000, 1000, 1000], 10, 20)
+        fields, stacks = _play(state, ['p1:sb', 'p2:bb', 'p3:r-60', 'p1:F', 'p2:F'])
+        self.assertEqual(fields['net'], {1: -10, 2: -20, 3: 30})
+        self.assertEqual(fields['problems'], [])
+        self.assertEqual(stacks, [990, 980, 1030])
+
+    def test_pot_nobody_won(self):
+        state = HandState([1000, 1000], 10, 20)
+        fields, stacks = _play(state, ['p1:sb', 'p2:bb', 'p1:c-10'])
+        self.assertEqual(fields['problems'], ['The pot of 40 was not won by anyone'])
+        self.assertEqual(stacks, [980, 980])
+
+    def test_short_stack_blind(self):
+        state = HandState([1000, 15], 10, 20)
+        fields, _ = _play(state, ['p1:sb', 'p2:bb', 'p1:c-5', 'W-p2:30'])
+        self.assertEqual(fields['bets'], {1: 15, 2: 15})
+        self.assertEqual(fields['problems'], [])
+
+
+class HandToActionsTests(SimpleTestCase):
+    """Action rows take their amounts from the engine's settlement"""
+
+    def test_short_blind_and_pot_won_without_a_win_line(self):
+        data = parse_game_data('\n'.join([
+            'players:2', 'pot:1000', 'sb:10', 'bb:20', 'Game Start',
+            'hand:1', 'Stacks:[1000,15]', 'p1:sb', 'p2:bb', 'p1:c-5', 'p1:r-100', 'p2:F',
+            'hand:2', 'Stacks:[1015,0]',
+        ]))
+        actions, _ = hand_to_actions(data['hands'][0], 10, 20)
+        rows = [(action['action_type'], action['seat'], action['amount']) for action in actions]
+        self.assertEqual(rows, [
+            (Action.POST_SB, 1, 10), (Action.POST_BB, 2, 15), (Action.CALL, 1, 5), (Action.RAISE, 1, 100),
+            (Action.FOLD, 2, None), (Action.WIN, 1, 130),
+        ])
+
+
+# A short game log and the fields the original, whole-file parser read from it
+SAMPLE_LOG = """players:3
+pot:[1000,900,1100]
+sb:10
+bb:20
+Game Start
+hand:1
+dealer:0
+Stacks:[1000,1000,1000]
+p2:A-H
+p3:10-D
+p1:5-C
+p2:K-S
+p3:2-H
+p1:9-C
+p2:sb
+p3:bb
+p1:c-20
+p2:c-10
+p3:r-40
+p1:F
+p2:c-40
+com:2-D,Q-D,3-C
+p2:c-0
+p3:c-0
+com:7-S
+p2:r-100
+p3:c-100
+com:J-H
+p2:c-0
+p3:c-0
+W-p2:340
+hand:2
+dealer:1
+Stacks:[980,1180,840]
+p3:4-H
+p1:8-D
+p2:J-C
+p3:4-S
+p1:8-S
+p2:J-D
+p3:sb
+p1:bb
+p2:A-1180
+p3:A-830
+p1:F
+com:2-C,3-S,9-H
+com:K-D
+com:5-S
+W-p2:2030
+Winner:p2-3000
+"""
+
+SAMPLE_PARSE = {
+    'players': 3, 'starting_pots': [1000, 900, 1100], 'starting_pot': 0, 'small_blind': 10, 'big_blind': 20,
+    'hands': [
+        {'hand_number': 1, 'dealer': 0, 'stacks': [1000, 1000, 1000], 'actions': [
+            'p2:A-H', 'p3:10-D', 'p1:5-C', 'p2:K-S', 'p3:2-H', 'p1:9-C', 'p2:sb', 'p3:bb', 'p1:c-20',
+            'p2:c-10', 'p3:r-40', 'p1:F', 'p2:c-40', 'com:2-D,Q-D,3-C', 'p2:c-0', 'p3:c-0', 'com:7-S',
+            'p2:r-100', 'p3:c-100', 'com:J-H', 'p2:c-0', 'p3:c-0',
+        ], 'winners': [{'player': 2, 'amount': 340}]},
+        {'hand_number': 2, 'dealer': 1, 'stacks': [980, 1180, 840], 'actions': [
+            'p3:4-H', 'p1:8-D', 'p2:J-C', 'p3:4-S', 'p1:8-S', 'p2:J-D', 'p3:sb', 'p1:bb', 'p2:A-1180',
+            'p3:A-830', 'p1:F', 'com:2-C,3-S,9-H', 'com:K-D', 'com:5-S',
+        ], 'winners': [{'player': 2, 'amount': 2030}]},
+    ],
+    'winner': {'player': 2, 'final_chips': 3000},
+    'final_stacks': {2: 3000},
+}
+
+
+class ParserTests(SimpleTestCase):
+    """The streaming parser reads what the whole-file parser did, from any source"""
+
+    def _check(self, source):
+        data = parse_game_data(source)
+        hand_fields = SAMPLE_PARSE['hands'][0].keys()
+        self.assertEqual(
+            {**data, 'hands': [{field: hand[field] for field in hand_fields} for hand in data['hands']]},
+            SAMPLE_PARSE,
+        )
+
+    def test_text(self):
+        self._check(SAMPLE_LOG)
+
+    def test_binary_file(self):
+        # Small chunks split lines, and a multi-byte character, across reads
+        with mock.patch('games.parser.CHUNK_SIZE', 7):
+            self._check(io.BytesIO(SAMPLE_LOG.replace('Game Start', 'Game Start \u2660').encode()))
+
+    def test_text_file(self):
+        self._check(io.StringIO(SAMPLE_LOG.replace('\n', '\r\n')))
+
+    def test_uploaded_file(self):
+        with mock.patch('games.parser.CHUNK_SIZE', 5):
+            self._check(SimpleUploadedFile('game.txt', SAMPLE_LOG.encode()))
+
+    def test_old_pot_format(self):
+        data = parse_game_data(SAMPLE_LOG.replace('pot:[1000,900,1100]', 'pot:1000'))
+        self.assertEqual(data['starting_pot'], 1000)
+        self.assertEqual(data['starting_pots'], [1000, 1000, 1000])
+
+    def test_unfinished_game(self):
+        data = parse_game_data(SAMPLE_LOG.replace('Winner:p2-3000\n', ''))
+        self.assertIsNone(data['winner'])
+        self.assertEqual(data['final_stacks'], {})
+        self.assertEqual(len(data['hands']), 2)
+
+
+class UserStatsTests(MediaRootMixin, TestCase):
+    """UserStats follows a user's games as they are created, changed and deleted"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+
+    def _game(self, profit, user=None):
+        return Game.objects.create(user=user or self.user, player_number=1, game_data='game_files/g.txt', profit=profit)
+
+    def _stats(self, user=None):
+        return UserStats.objects.filter(user=user or self.user).values(
+            'total_profit', 'game_count', 'best_profit', 'worst_profit', 'last_played', 'all_game_count'
+        ).get()
+
+    def _check(self, user=None, **expected):
+        """The stats are what rebuilding them from scratch gives, and include expected"""
+        stats = self._stats(user)
+        UserStats.rebuild((user or self.user).pk)
+        self.assertEqual(stats, self._stats(user))
+        self.assertEqual({name: stats[name] for name in expected}, expected)
+
+    def test_create(self):
+        self._game(100)
+        self._game(-50)
+        last = self._game(30)
+        self._check(total_profit=80, game_count=3, best_profit=100, worst_profit=-50, last_played=last.date)
+
+    def test_update(self):
+        best = self._game(100)
+        middle = self._game(30)
+        self._game(-50)
+
+        middle.profit = 40
+        middle.save()
+        self._check(total_profit=90, best_profit=100)
+
+        # The best session got worse, so the next best takes its place
+        best.profit = 10
+        best.save()
+        self._check(total_profit=0, best_profit=40, worst_profit=-50)
+
+        # A save that leaves the profit alone changes nothing
+        best.save()
+        self._check(total_profit=0, game_count=3)
+
+    def test_delete(self):
+        self._game(100)
+        middle = self._game(30)
+        worst = self._game(-50)
+        self._game(60)
+
+        middle.delete()
+        self._check(total_profit=110, game_count=3)
+
+        worst.delete()
+        self._check(total_profit=160, game_count=2, worst_profit=60)
+
+    def test_moved_to_another_user(self):
+        other = User.objects.create_user('alice')
+        self._game(100)
+        game = self._game(-20)
+        self._game(5, other)
+
+        game.user = other
+        game.save()
+        self._check(total_profit=100, game_count=1, worst_profit=100)
+        self._check(other, total_profit=-15, game_count=2, worst_profit=-20)
+
+    def test_only_processed_games_count(self):
+        self._game(100)
+        game = Game.objects.create(user=self.user, player_number=1, game_data='game_files/g.txt',
+                                   status=Game.PENDING)
+        self._check(total_profit=100, game_count=1)
+
+        # Processed by its job
+        job = jobs.enqueue(jobs.PROCESS_GAME, game)
+        with mock.patch('games.jobs.get_game_profit', return_value=-40), \
+                mock.patch('games.jobs.record_hands'), mock.patch('games.jobs.save_binary_log'):
+            self.assertTrue(jobs.run_job(job))
+        self._check(total_profit=60, game_count=2, worst_profit=-40)
+
+        # Queued again, it is out until it is processed again
+        game.refresh_from_db()
+        jobs.enqueue_game(game)
+        self._check(total_profit=100, game_count=1, worst_profit=100)
+
+        # Failing processing and deleting a failed game change nothing
+        with mock.patch.dict(jobs.HANDLERS, {jobs.PROCESS_GAME: _fail}):
+            jobs.run_job(jobs.claim_job('worker-1'))
+        Game.objects.filter(pk=game.pk).update(status=Game.FAILED)
+        Game.objects.get(pk=game.pk).delete()
+        self._check(total_profit=100, game_count=1)
+
+    def test_deferred_fields(self):
+        self._game(100)
+        game = Game.objects.only('id', 'name').get(pk=self._game(30).pk)
+        game.name = 'Renamed'
+        game.save()
+        self._check(total_profit=130, game_count=2)
+
+
+class ActionLogTests(MediaRootMixin, TestCase):
+    """Packed action logs are kept for processed games and dropped when their rows change"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+        self.game = Game(user=self.user, player_number=1, game_data=SimpleUploadedFile(
+            'game.txt', generate_game_log(players=3, hands=10, seed=5).encode()
+        ))
+        self.game.save()
+        record_hands(self.game)
+
+    def test_kept_for_a_processed_game(self):
+        hands, actions = load_history(self.user)
+        self.assertEqual(len(hands), self.game.hands.count())
+        mine = Action.objects.filter(game=self.game, seat=1, action_type__in=ACTION_TYPES)
+        self.assertEqual(len(actions), mine.count())
+        self.assertTrue(ActionLog.objects.filter(game=self.game).exists())
+
+        with mock.patch('games.stats.pack_action_log', side_effect=AssertionError('packed again')):
+            self.assertEqual(load_history(self.user)[0].tolist(), hands.tolist())
+
+    def test_not_kept_while_processing(self):
+        for status in (Game.PENDING, Game.LIVE):
+            with self.subTest(status=status):
+                Game.objects.filter(pk=self.game.pk).update(status=status)
+                hands, _ = load_history(self.user)
+                self.assertEqual(len(hands), self.game.hands.count())
+                self.assertFalse(ActionLog.objects.exists())
+
+    def test_dropped_when_hands_are_recorded_again(self):
+        load_history(self.user)
+        record_hands(self.game)
+        self.assertFalse(ActionLog.objects.exists())
+        self.assertEqual(len(load_history(self.user)[0]), self.game.hands.count())
+
+
+class PaginationTests(TestCase):
+    """Keyset pagination of a user's games"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('bob')
+        now = timezone.now()
+        for day in range(5):
+            game = Game.objects.create(user=self.user, player_number=1, game_data='game_files/g.txt')
+            # Two games on each day but the last, to page through equal created_at values
+            Game.objects.filter(pk=game.pk).update(created_at=now - timedelta(days=day // 2))
+        self.games = Game.objects.filter(user=self.user)
+        self.expected = list(self.games.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def _walk(self, page_size):
+        ids, cursor, pages = [], None, 0
+        while True:
+            page, cursor = paginate_games(self.games, cursor, page_size)
+            ids += [game.id for game in page]
+            pages += 1
+            if cursor is None:
+                return ids, pages
+
+    def test_pages_cover_every_game_once(self):
+        for page_size in (1, 2, 3, 4):
+            self.assertEqual(self._walk(page_size)[0], self.expected)
+
+    def test_no_cursor_after_the_last_page(self):
+        self.assertEqual(self._walk(5), (self.expected, 1))
+        self.assertEqual(self._walk(10), (self.expected, 1))
+
+    def test_cursor_after_the_last_game(self):
+        last = Game.objects.get(pk=self.expected[-1])
+        self.assertEqual(paginate_games(self.games, encode_cursor(last)), ([], None))
+
+    def test_no_games(self):
+        self.assertEqual(paginate_games(Game.objects.none()), ([], None))
+
+    def test_bad_cursor(self):
+        for cursor in ('!!!', 'bm90IGEgY3Vyc29y', base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+                       base64.urlsafe_b64encode(b'2026-01-01|1|2').decode(),
+                       base64.urlsafe_b64encode(b'yesterday|1').decode()):
+            self.assertIsNone(decode_cursor(cursor), cursor)
+        # A bad cursor gives the first page
+        page, _ = paginate_games(self.games, 'garbage', 2)
+        self.assertEqual([game.id for game in page], self.expected[:2])
+
+    def test_bad_cursor_on_the_index(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('games.index'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+
+
+class BlobTests(MediaRootMixin, TestCase):
+    """Uploads are stored once per content, with a reference per game"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+        self.content = generate_game_log(players=2, hands=3).encode()
+
+    def _upload(self, content, game=None):
+        game = game or Game(user=self.user, player_number=1)
+        game.game_data = SimpleUploadedFile('game.txt', content)
+        game.save()
+        return game
+
+    def test_same_content_is_stored_once(self):
+        first = self._upload(self.content)
+        second = self._upload(self.content)
+        blob = GameBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.game_data.name, second.game_data.name)
+        self.assertTrue(os.path.exists(gzip_path(blob.file)))
+
+    def test_delete_releases_the_blob(self):
+        first = self._upload(self.content)
+        second = self._upload(self.content)
+        blob = GameBlob.objects.get()
+        path = blob.file.path
+        ParsedGame.objects.create(content_hash=blob.sha256, parser_version=1, summary='{}', hands='')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(GameBlob.objects.exists())
+        self.assertFalse(ParsedGame.objects.exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + '.gz'))
+
+    def test_reupload_moves_the_reference(self):
+        game = self._upload(self.content)
+        other = self._upload(self.content)
+        old_blob = GameBlob.objects.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload(self.content + b'\n', game)
+        old_blob.refresh_from_db()
+        self.assertEqual(old_blob.ref_count, 1)
+        self.assertEqual(GameBlob.objects.get(pk=game.blob_id).ref_count, 1)
+
+        # The last reference to the old content goes with this re-upload
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload(self.content + b'\n', other)
+        self.assertFalse(GameBlob.objects.filter(pk=old_blob.pk).exists())
+        self.assertEqual(GameBlob.objects.get().ref_count, 2)
+
+
+class ParseCacheTests(MediaRootMixin, TestCase):
+    """A file is parsed once per content and parser version"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+        self.content = generate_game_log(players=2, hands=3, seed=1).encode()
+
+    def _upload(self, content, game=None):
+        game = game or Game(user=self.user, player_number=1)
+        game.game_data = SimpleUploadedFile('game.txt', content)
+        game.save()
+        return game
+
+    def test_same_content_is_parsed_once(self):
+        parsed = get_parsed_game(self._upload(self.content))
+        with mock.patch('games.cache.parse_game_file', side_effect=AssertionError('parsed again')):
+            self.assertEqual(get_parsed_game(self._upload(self.content)).pk, parsed.pk)
+
+    def test_new_parser_version_parses_again(self):
+        game = self._upload(self.content)
+        old = get_parsed_game(game)
+        with mock.patch('games.cache.PARSER_VERSION', PARSER_VERSION + 1):
+            new = get_parsed_game(game)
+        self.assertNotEqual(new.pk, old.pk)
+        self.assertEqual(new.parser_version, PARSER_VERSION + 1)
+        self.assertEqual(new.summary, old.summary)
+        # The old version's parse can never be served again
+        self.assertFalse(ParsedGame.objects.filter(pk=old.pk).exists())
+
+    def test_changed_content_parses_again(self):
+        game = self._upload(self.content)
+        old = get_parsed_game(game)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload(generate_game_log(players=2, hands=5, seed=2).encode(), game)
+        new = get_parsed_game(game)
+        self.assertNotEqual(new.content_hash, old.content_hash)
+        self.assertNotEqual(new.hand_count, old.hand_count)
+        self.assertEqual(get_hands(game, 0, 100)[0], new.hand_count)
+
+
+class RecomputeProfitsTests(MediaRootMixin, TestCase):
+    """Only processed games worked out by another parser version are recomputed"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+        self.content = generate_game_log(players=2, hands=3, seed=1)
+
+    def _game(self, parser_version, status=Game.READY, profit=0):
+        game = Game(user=self.user, player_number=1, status=status, profit=profit)
+        game.game_data = SimpleUploadedFile('game.txt', self.content.encode())
+        game.save()
+        Game.objects.filter(pk=game.pk).update(parser_version=parser_version)
+        return game
+
+    def test_stale_selection(self):
+        legacy = self._game(None)
+        old = self._game(PARSER_VERSION - 1)
+        current = self._game(PARSER_VERSION)
+        self._game(None, status=Game.PENDING)
+        self._game(None, status=Game.FAILED)
+        self._game(None, status=Game.LIVE)
+        no_file = Game.objects.create(user=self.user, player_number=1, game_data='')
+
+        self.assertCountEqual(stale_games(), [legacy, old])
+        self.assertCountEqual(stale_games(everything=True), [legacy, old, current])
+        self.assertNotIn(no_file, stale_games(everything=True))
+
+    def test_recompute(self):
+        expected = calculate_player_profit(parse_game_data(self.content), 1)
+        stale = self._game(None, profit=expected + 5)
+        current = self._game(PARSER_VERSION, profit=expected + 5)
+
+        report = recompute_profits(workers=1)
+        self.assertEqual((report['games'], report['changed'], report['parsed']), (1, 1, 1))
+        self.assertEqual(Game.objects.values_list('profit', 'parser_version').get(pk=stale.pk),
+                         (expected, PARSER_VERSION))
+        # Games already worked out by the current parser are left alone
+        self.assertEqual(Game.objects.get(pk=current.pk).profit, expected + 5)
+        self.assertEqual(UserStats.objects.get(user=self.user).total_profit, 2 * expected + 5)
+        self.assertFalse(stale_games().exists())
+
+
+def _fail(job):
+    raise RuntimeError('boom')
+
+
+class JobTests(TestCase):
+    """Claiming, retrying and giving up on background jobs"""
+
+    def setUp(self):
+        user = User.objects.create_user('bob')
+        self.game = Game.objects.create(user=user, player_number=1, game_data='game_files/g.txt',
+                                        status=Game.PENDING)
+        self.enterContext(mock.patch.dict(jobs.HANDLERS, {'fail': _fail}))
+
+    def test_a_job_is_claimed_once(self):
+        job = jobs.enqueue('fail', self.game)
+        claimed = jobs.claim_job('worker-1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts, claimed.locked_by),
+                         (job.pk, Job.RUNNING, 1, 'worker-1'))
+        self.assertIsNone(jobs.claim_job('worker-2'))
+
+    def test_jobs_not_due_are_left(self):
+        Job.objects.create(kind='fail', run_after=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(jobs.claim_job('worker-1'))
+
+    def test_timed_out_job_is_retried(self):
+        job = jobs.enqueue('fail', self.game)
+        jobs.claim_job('worker-1')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - jobs.JOB_TIMEOUT - timedelta(seconds=1))
+
+        # Failed and queued again, after the retry delay
+        self.assertIsNone(jobs.claim_job('worker-2'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.last_error, 'Timed out on worker worker-1')
+        self.assertEqual(job.run_after - job.updated_at, jobs.RETRY_DELAY)
+
+    def test_backoff_then_give_up(self):
+        job = jobs.enqueue('fail', self.game, max_attempts=3)
+        for attempt in (1, 2):
+            self.assertFalse(jobs.run_job(jobs.claim_job('worker-1')))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, attempt))
+            self.assertEqual(job.run_after - job.updated_at, jobs.RETRY_DELAY * 2 ** (attempt - 1))
+            self.game.refresh_from_db()
+            self.assertEqual(self.game.status_message,
+                             f'Attempt {attempt} of 3 failed, retrying: RuntimeError: boom')
+            self.assertIsNone(jobs.claim_job('worker-1'))  # Backing off
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        self.assertFalse(jobs.run_job(jobs.claim_job('worker-1')))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.status, self.game.status_message), (Game.FAILED, 'RuntimeError: boom'))
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertIsNone(jobs.claim_job('worker-1'))
+
+
+def _zip(files):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return data.getvalue()
+
+
+class ImportTests(MediaRootMixin, TestCase):
+    """Importing many files and zips at once, from the command line or through the import page's job"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+        self.logs = [generate_game_log(players=3, hands=5, seed=seed).encode() for seed in range(3)]
+
+    def _stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), settings.MEDIA_ROOT)
+            for root, _, names in os.walk(settings.MEDIA_ROOT) for name in names
+        )
+
+    def _statuses(self, report):
+        return [(row['file'], row['status']) for row in report]
+
+    def test_files_and_zips(self):
+        archive = _zip({
+            'Records/NFC_INF10.txt': self.logs[1],
+            'Records/NFC_INF2.txt': self.logs[2],
+            'Records/notes.md': b'notes',
+            '__MACOSX/Records/._NFC_INF2.txt': b'',
+        })
+        report = import_games(self.user, 2, [('NFC_INF0.txt', self.logs[0]), ('Records.zip', archive),
+                                             ('photo.jpg', b'\xff')], workers=1)
+        self.assertEqual(self._statuses(report), [
+            ('NFC_INF0.txt', IMPORTED),
+            ('photo.jpg', SKIPPED),
+            ('Records.zip/Records/NFC_INF2.txt', IMPORTED),
+            ('Records.zip/Records/NFC_INF10.txt', IMPORTED),
+            ('Records.zip/Records/notes.md', SKIPPED),
+        ])
+
+        games = {game.name: game for game in Game.objects.filter(user=self.user)}
+        self.assertEqual(set(games), {'NFC_INF0', 'NFC_INF2', 'NFC_INF10'})
+        for row in report:
+            if row['status'] == IMPORTED:
+                game = Game.objects.get(pk=row['game_id'])
+                expected = calculate_player_profit(parse_game_data(game.game_data.read().decode()), 2)
+                self.assertEqual((game.profit, row['profit']), (expected, expected))
+                self.assertEqual(game.hands.count(), row['hands'])
+        self.assertEqual(UserStats.objects.get(user=self.user).game_count, 3)
+
+    def test_duplicates(self):
+        import_games(self.user, 1, [('NFC_INF0.txt', self.logs[0])], workers=1)
+        report = import_games(self.user, 1, [
+            ('NFC_INF0.txt', self.logs[0]), ('NFC_INF1.txt', self.logs[1]), ('copy.txt', self.logs[1]),
+        ], workers=1)
+        self.assertEqual(self._statuses(report), [
+            ('copy.txt', IMPORTED), ('NFC_INF0.txt', DUPLICATE), ('NFC_INF1.txt', DUPLICATE),
+        ])
+        self.assertEqual(report[2]['error'], 'Same file as copy.txt')
+        self.assertEqual(Game.objects.count(), 2)
+
+        # The same file as another player is another game, sharing the stored file
+        report = import_games(self.user, 2, [('NFC_INF0.txt', self.logs[0])], workers=1)
+        self.assertEqual(self._statuses(report), [('NFC_INF0.txt', IMPORTED)])
+        blob = Game.objects.get(pk=report[0]['game_id']).blob
+        self.assertEqual(blob.ref_count, 2)
+
+    def test_failures(self):
+        report = import_games(self.user, 1, [
+            ('NFC_INF0.txt', self.logs[0]), ('empty.txt', b'players:3\n'), ('broken.zip', b'PK\x03\x04 not a zip'),
+        ], workers=1)
+        self.assertEqual(self._statuses(report), [
+            ('broken.zip', FAILED), ('empty.txt', FAILED), ('NFC_INF0.txt', IMPORTED),
+        ])
+        self.assertEqual(report[1]['error'], 'No hands found')
+        self.assertEqual(GameBlob.objects.count(), 1)
+
+    def test_rollback_deletes_the_stored_files(self):
+        with mock.patch('games.imports.record_hands', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                import_games(self.user, 1, [('NFC_INF0.txt', self.logs[0]), ('NFC_INF1.txt', self.logs[1])],
+                             workers=1)
+        self.assertFalse(Game.objects.exists())
+        self.assertFalse(GameBlob.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+    def test_upload_is_imported_by_a_job(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('games.import'), {'player_number': 1, 'files': [
+            SimpleUploadedFile('NFC_INF0.txt', self.logs[0]),
+            SimpleUploadedFile('Records.zip', _zip({'NFC_INF1.txt': self.logs[1]})),
+        ]})
+        game_import = GameImport.objects.get()
+        self.assertRedirects(response, reverse('games.import_report', args=[game_import.id]))
+        self.assertEqual(game_import.status, GameImport.PENDING)
+        self.assertFalse(Game.objects.exists())
+        self.assertContains(self.client.get(response.url), '2 files are being imported')
+
+        with mock.patch('os.cpu_count', return_value=1):
+            self.assertEqual(jobs.run_pending('worker-1'), 1)
+        game_import.refresh_from_db()
+        self.assertEqual(game_import.status, GameImport.DONE)
+        self.assertEqual(self._statuses(game_import.report), [
+            ('NFC_INF0.txt', IMPORTED), ('Records.zip/NFC_INF1.txt', IMPORTED),
+        ])
+        # Only the imported games' files are left
+        self.assertEqual(game_import.files, [])
+        self.assertFalse([name for name in self._stored_files() if name.startswith(jobs.IMPORT_UPLOAD_DIR)])
+        self.assertContains(self.client.get(response.url), 'Imported 2 of 2 files')
+
+        other = User.objects.create_user('alice')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(response.url).status_code, 404)
+
+    def test_failed_import_job(self):
+        game_import = jobs.enqueue_import(self.user, 1, [SimpleUploadedFile('NFC_INF0.txt', self.logs[0])])
+        Job.objects.filter(game_import=game_import).update(max_attempts=1)
+        with mock.patch('games.jobs.import_games', side_effect=ValueError('Import is too large')):
+            jobs.run_pending('worker-1')
+        game_import.refresh_from_db()
+        self.assertEqual(game_import.status, GameImport.FAILED)
+        self.assertEqual(game_import.status_message, 'ValueError: Import is too large')
+        self.assertEqual(self._stored_files(), [])
+
+
+class GameJsonTests(MediaRootMixin, TestCase):
+    """A game's summary and hands as JSON, for its owner only"""
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('bob')
+        self.client.force_login(user)
+        self.content = generate_game_log(players=3, hands=60, seed=4)
+        self.game = Game(user=user, player_number=2, game_data=SimpleUploadedFile('game.txt', self.content.encode()))
+        self.game.save()
+        # Through JSON like the responses, so player keys are strings either way
+        self.expected = json.loads(json.dumps(parse_game_data(self.content)))
+
+    def _get(self, name, game=None, **params):
+        return self.client.get(reverse(name, args=[(game or self.game).id]), params)
+
+    def test_summary(self):
+        summary = self._get('games.summary').json()
+        self.assertNotIn('hands', summary)
+        self.assertEqual(summary['hand_count'], len(self.expected['hands']))
+        self.assertEqual(summary['winner'], self.expected['winner'])
+        self.assertEqual(summary['players'], 3)
+        self.assertEqual(summary['user_player'], 2)
+        self.assertEqual(summary['hands_url'], reverse('games.hands', args=[self.game.id]))
+
+    def test_hands_in_ranges(self):
+        hands, start = [], 0
+        while True:
+            data = self._get('games.hands', start=start).json()
+            self.assertEqual(data['start'], start)
+            self.assertEqual(data['hand_count'], len(self.expected['hands']))
+            if not data['hands']:
+                break
+            hands += data['hands']
+            start = data['end']
+        self.assertEqual(len(hands), len(self.expected['hands']))
+        for hand, expected in zip(hands, self.expected['hands']):
+            self.assertTrue(set(ANNOTATION_FIELDS) <= hand.keys())
+            self.assertEqual({key: hand[key] for key in expected}, expected)
+
+    def test_hands_range_is_clamped(self):
+        data = self._get('games.hands', start=5, end=1000).json()
+        self.assertEqual((data['start'], data['end']), (5, 5 + HANDS_PER_REQUEST))
+        data = self._get('games.hands', start=1000).json()
+        self.assertEqual(data['start'], data['hand_count'])
+        self.assertEqual(data['hands'], [])
+
+    def test_bad_range(self):
+        response = self._get('games.hands', start='first')
+        self.assertEqual(response.status_code, 400)
+
+    def test_another_users_game(self):
+        other = Game.objects.create(
+            user=User.objects.create_user('alice'), player_number=1, game_data=self.game.game_data.name
+        )
+        for name in ('games.summary', 'games.hands'):
+            with self.subTest(name=name):
+                self.assertEqual(self._get(name, other).status_code, 404)
+
+    def test_game_not_processed(self):
+        Game.objects.filter(pk=self.game.pk).update(status=Game.PENDING)
+        for name in ('games.summary', 'games.hands'):
+            with self.subTest(name=name):
+                response = self._get(name)
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.json()['status'], Game.PENDING)
+
+
+class IndexConditionalTests(TestCase):
+    """The games index is revalidated from the user's UserStats row alone"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('bob')
+        self.client.force_login(self.user)
+        self.game = self._game(Game.READY)
+
+    def _game(self, status):
+        return Game.objects.create(user=self.user, player_number=1, game_data='game_files/g.txt', status=status)
+
+    def _get(self, **headers):
+        return self.client.get(reverse('games.index'), headers=headers)
+
+    def _etag_changes(self, change):
+        """The ETag after change(), checking the old one no longer gets a 304"""
+        etag = self._get()['ETag']
+        change()
+        response = self._get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_not_modified(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(response['Last-Modified'], http_date(stats.updated_at.timestamp()))
+
+        # The session, the user and the stats row
+        with self.assertNumQueries(3):
+            self.assertEqual(self._get(if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self._get(if_modified_since=response['Last-Modified']).status_code, 304)
+
+    def test_every_change_to_a_game(self):
+        self._etag_changes(lambda: self._game(Game.PENDING))
+        self.game.name = 'Renamed'
+        self._etag_changes(self.game.save)
+        self._etag_changes(lambda: jobs.enqueue_game(self.game))
+        with mock.patch.dict(jobs.HANDLERS, {jobs.PROCESS_GAME: _fail}):
+            for _ in range(3):
+                self._etag_changes(lambda: jobs.run_job(jobs.claim_job('worker-1')))
+                Job.objects.update(run_after=timezone.now())
+        self.assertEqual(Game.objects.get(pk=self.game.pk).status, Game.FAILED)
+        self._etag_changes(Game.objects.get(pk=self.game.pk).delete)
+
+    def test_unprocessed_games_are_listed(self):
+        Game.objects.filter(pk=self.game.pk).delete()
+        self.assertContains(self._get(), 'No games yet!')
+        self._game(Game.PENDING)
+        response = self._get()
+        self.assertNotContains(response, 'No games yet!')
+        self.assertEqual(response.context['template_data']['stats'].game_count, 0)
+
+    def test_stats_built_when_missing(self):
+        self._game(Game.PENDING)
+        UserStats.objects.all().delete()
+        self.assertEqual(self._get().status_code, 200)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.game_count, stats.all_game_count), (1, 2))
+
+
+class DownloadTests(MediaRootMixin, TestCase):
+    """Game file downloads: whole, gzipped, in byte ranges and revalidated"""
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('bob')
+        self.client.force_login(user)
+        self.content = generate_game_log(players=3, hands=20).encode()
+        self.game = Game(user=user, player_number=1, game_data=SimpleUploadedFile('game.txt', self.content))
+        self.game.save()
+        self.url = reverse('games.download', args=[self.game.id])
+
+    def _get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def _body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_whole_file(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._body(response), self.content)
+        self.assertEqual(response['ETag'], f'"{self.game.content_hash}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_gzip(self):
+        response = self._get(accept_encoding='br, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'"{self.game.content_hash}-gzip"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(self._body(response)), self.content)
+
+        self.assertNotIn('Content-Encoding', self._get(accept_encoding='gzip;q=0'))
+
+    def test_byte_range(self):
+        size = len(self.content)
+        response = self._get(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{size}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self._body(response), self.content[10:20])
+
+        response = self._get(range='bytes=-5')
+        self.assertEqual(response['Content-Range'], f'bytes {size - 5}-{size - 1}/{size}')
+        self.assertEqual(self._body(response), self.content[-5:])
+
+        response = self._get(range=f'bytes={size - 3}-{size + 100}')
+        self.assertEqual(self._body(response), self.content[-3:])
+
+    def test_range_of_the_gzip_copy(self):
+        size = os.path.getsize(gzip_path(self.game.game_data))
+        response = self._get(range='bytes=0-1', accept_encoding='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Range'], f'bytes 0-1/{size}')
+        self.assertEqual(self._body(response), b'\x1f\x8b')
+
+    def test_unsatisfiable_range(self):
+        size = len(self.content)
+        for header in (f'bytes={size}-', 'bytes=20-10'):
+            response = self._get(range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    def test_ranges_that_get_the_whole_file(self):
+        for headers in ({'range': 'bytes=0-1,5-6'}, {'range': 'lines=1-2'},
+                        {'range': 'bytes=0-1', 'if_range': '"something else"'}):
+            response = self._get(**headers)
+            self.assertEqual(response.status_code, 200, headers)
+            self.assertEqual(self._body(response), self.content)
+
+        response = self._get(range='bytes=0-1', if_range=f'"{self.game.content_hash}"')
+        self.assertEqual(response.status_code, 206)
+
+    def test_not_modified(self):
+        response = self._get(if_none_match=f'"{self.game.content_hash}"')
+        self.assertEqual(response.status_code, 304)
+
+
+def _reference_rank(cards):
+    """Brute force: the best (category, tie breaking ranks) over every 5 of the cards"""
+    return max(_reference_rank_5(hand) for hand in combinations(cards, 5))
+
+
+def _reference_rank_5(cards):
+    ranks = sorted((card >> 2 for card in cards), reverse=True)
+    flush = len({card & 3 for card in cards}) == 1
+    distinct = sorted(set(ranks), reverse=True)
+    straight = None
+    if len(distinct) == 5 and distinct[0] - distinct[4] == 4:
+        straight = distinct[0]
+    elif distinct == [12, 3, 2, 1, 0]:
+        straight = 3  # The wheel, five high
+    # Ranks by how many of each, then by rank
+    groups = sorted(Counter(ranks).items(), key=lambda item: (item[1], item[0]), reverse=True)
+    shape = [count for _, count in groups]
+    order = [rank for rank, _ in groups]
+    if straight is not None and flush:
+        return 8, straight
+    if shape[0] == 4:
+        return 7, *order
+    if shape[:2] == [3, 2]:
+        return 6, *order
+    if flush:
+        return 5, *ranks
+    if straight is not None:
+        return 4, straight
+    if shape[0] == 3:
+        return 3, *order
+    if shape[:2] == [2, 2]:
+        return 2, *order
+    if shape[0] == 2:
+        return 1, *order
+    return 0, *ranks
+
+
+class EvaluatorTests(SimpleTestCase):
+    """The vectorized evaluator orders hands like a brute force reference"""
+
+    def _check(self, hands):
+        values = evaluate(np.array(hands))
+        ranked = sorted(zip((_reference_rank(hand) for hand in hands), values.tolist(), hands))
+        for (rank, value, hand), (next_rank, next_value, next_hand) in zip(ranked, ranked[1:]):
+            if rank == next_rank:
+                self.assertEqual(value, next_value, (hand, next_hand))
+            else:
+                self.assertLess(value, next_value, (hand, next_hand))
+        for rank, value, hand in ranked:
+            self.assertEqual(category_name(value), CATEGORIES[rank[0]], hand)
+
+    def test_random_hands(self):
+        rng = random.Random(0)
+        decks = [
+            list(range(52)),
+            [card for card in range(52) if card & 3 < 2],   # Two suits: flushes and straight flushes
+            [card for card in range(52) if card >> 2 >= 7],  # Nine to ace: straights, quads, full houses
+            [card for card in range(52) if card >> 2 in (0, 1, 2, 3, 12)],  # Wheels
+        ]
+        for size in (5, 6, 7):
+            self._check([rng.sample(deck, size) for deck in decks for _ in range(400)])
+
+    def test_every_category_is_covered(self):
+        rng = random.Random(1)
+        hands = [rng.sample(range(52), 7) for _ in range(3000)]
+        hands += [rng.sample([card for card in range(52) if card & 3 == 0], 7) for _ in range(50)]
+        hands += [rng.sample([card for card in range(52) if card >> 2 >= 10], 7) for _ in range(200)]
+        self.assertEqual({_reference_rank(hand)[0] for hand in hands}, set(range(len(CATEGORIES))))
+        self._check(hands)
+
+    def test_special_hands(self):
+        def cards(*names):
+            return [card_index(name) for name in names]
+        wheel = cards('A-H', '2-D', '3-C', '4-S', '5-H', 'K-D', 'Q-C')
+        six_high = cards('A-H', '2-D', '3-C', '4-S', '5-H', '6-D', 'Q-C')
+        steel_wheel = cards('A-H', '2-H', '3-H', '4-H', '5-H', 'K-D', 'Q-C')
+        two_trips = cards('9-H', '9-D', '9-C', '4-S', '4-H', '4-D', 'Q-C')
+        three_pairs = cards('9-H', '9-D', '4-C', '4-S', 'Q-H', 'Q-D', '2-C')
+        self._check([wheel, six_high, steel_wheel, two_trips, three_pairs])
+        values = evaluate(np.array([wheel, six_high]))
+        self.assertLess(values[0], values[1])
+        self.assertEqual(category_name(evaluate(np.array([steel_wheel]))[0]), 'Straight Flush')
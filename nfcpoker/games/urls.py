@@ -3,7 +3,16 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='games.index'),
+    path('list.json', views.index_json, name='games.index_json'),
+    path('stats/', views.stats, name='games.stats'),
     path('add/', views.add_game, name='games.add'),
+    path('import/', views.import_games_view, name='games.import'),
+    path('import/<int:import_id>/', views.import_report, name='games.import_report'),
     path('<int:game_id>/', views.view_game, name='games.view'),
+    path('<int:game_id>/summary.json', views.game_summary, name='games.summary'),
+    path('<int:game_id>/hands.json', views.game_hands, name='games.hands'),
+    path('<int:game_id>/feed/', views.game_feed, name='games.feed'),
+    path('<int:game_id>/download/', views.download_game, name='games.download'),
+    path('<int:game_id>/retry/', views.retry_game, name='games.retry'),
     path('<int:game_id>/delete/', views.delete_game, name='games.delete'),
 ]
\ No newline at end of file
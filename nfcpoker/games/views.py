@@ -1,28 +1,110 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Game
-from .forms import GameForm
-import json
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .models import Game, GameImport
+from .forms import GameForm, GameFilterForm, GameImportForm
+from .pagination import paginate_games
+from .cache import get_game_summary, get_hands
+from .conditional import (
+    FRAGMENT_TIMEOUT, fragment_cached, game_etag, game_last_modified, game_version, games_version, get_game,
+    index_etag, index_last_modified, user_stats,
+)
+from .downloads import serve_game_file
+from .feed import get_feed, read_lines, snapshot_event
+from .jobs import enqueue_game, enqueue_import
+from .imports import IMPORTED
+from .stats import player_stats
+
+# Most hands the hands endpoint returns per request
+HANDS_PER_REQUEST = 50
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=index_etag, last_modified_func=index_last_modified)
 def index(request):
-    """Display all games for the logged-in user"""
-    games = Game.objects.filter(user=request.user)
+    """Display the logged-in user's games, one keyset-paginated page at a time"""
+    filter_form = GameFilterForm(request.GET)
+    games = filter_form.filter(Game.objects.filter(user=request.user))
+    
+    # Keep the filters on the next/first page links
+    filters = request.GET.copy()
+    filters.pop('after', None)
     
-    # Calculate total profit
-    total_profit = sum(game.profit for game in games)
+    # The stats cards and the games table are cached fragments (see games.conditional); what they
+    # show is only queried when the template renders them
+    version = games_version(request)
+    table_version = f"{version}-{request.META.get('CSRF_COOKIE', '')}"  # The table has Retry forms
+    page = SimpleLazyObject(lambda: paginate_games(games, request.GET.get('after')))
+    # Header totals are kept up to date incrementally (see games.signals)
+    stats = user_stats(request)
     
     template_data = {
         'title': 'My Poker Games',
-        'games': games,
-        'total_profit': total_profit,
-        'game_count': games.count()
+        'games': SimpleLazyObject(lambda: page[0]),
+        'stats': stats,
+        'game_count': stats.all_game_count,
+        'filter_form': filter_form,
+        'filters': filters.urlencode(),
+        'next_cursor': SimpleLazyObject(lambda: page[1] or ''),
+        'is_first_page': 'after' not in request.GET,
+        'version': version,
+        'table_version': table_version,
+        'query': request.GET.urlencode(),
+        'fragment_timeout': FRAGMENT_TIMEOUT,
     }
     return render(request, 'games/index.html', {'template_data': template_data})
 
 
+@login_required
+def index_json(request):
+    """JSON version of the games list, with the same filters and cursors as index"""
+    filter_form = GameFilterForm(request.GET)
+    if request.GET and not filter_form.is_valid():
+        return JsonResponse({'errors': filter_form.errors}, status=400)
+    games = filter_form.filter(Game.objects.filter(user=request.user))
+    page, next_cursor = paginate_games(games, request.GET.get('after'))
+    
+    return JsonResponse({
+        'games': [{
+            'id': game.id,
+            'name': game.name,
+            'player_number': game.player_number,
+            'profit': game.profit,
+            'status': game.status,
+            'status_message': game.status_message,
+            'date': game.date.isoformat(),
+            'created_at': game.created_at.isoformat(),
+            'url': reverse('games.view', args=[game.id]),
+            'download_url': reverse('games.download', args=[game.id]) if game.game_data else None
+        } for game in page],
+        'next_cursor': next_cursor
+    })
+
+
+@login_required
+def stats(request):
+    """Dashboard of the user's playing style and win rate across all their games"""
+    stats = player_stats(request.user)
+    template_data = {
+        'title': 'My Stats',
+        'stats': stats,
+        'tables': [
+            ('By Seat', 'Seat', stats['by_seat']),
+            ('By Table Size', 'Players', stats['by_table_size']),
+        ]
+    }
+    return render(request, 'games/stats.html', {'template_data': template_data})
+
+
 @login_required
 def add_game(request):
     """Add a new game"""
@@ -32,26 +114,19 @@ def add_game(request):
             game = form.save(commit=False)
             game.user = request.user
             
-            # Parse game data to calculate profit
-            if game.game_data:
-                try:
-                    game_data_content = game.game_data.read().decode('utf-8')
-                    game.game_data.seek(0)  # Reset file pointer
-                    game_details = parse_game_data(game_data_content)
-                    
-                    # Calculate profit based on player number
-                    game.profit = calculate_player_profit(game_details, game.player_number)
-                    
-                    # Auto-generate name if not provided
-                    if not game.name:
-                        game.name = f"Game {game.date.strftime('%m/%d/%Y')}"
-                        
-                except Exception as e:
-                    messages.error(request, f'Error parsing game data: {str(e)}')
-                    return render(request, 'games/add_game.html', {'template_data': {'title': 'Add New Game', 'form': form}})
+            # Auto-generate name if not provided
+            if not game.name:
+                game.name = f"Game {timezone.now().strftime('%m/%d/%Y')}"
+            game.status = Game.PENDING
             
-            game.save()
-            messages.success(request, f'Game "{game.name}" added successfully! Your profit/loss: ${game.profit}')
+            with transaction.atomic():
+                # Stores the upload once per distinct content (see games.blobs)
+                game.save()
+
+                # Parsing, profit and hand rows are done by the run_jobs worker
+                enqueue_game(game)
+            
+            messages.success(request, f'Game "{game.name}" uploaded! Your profit/loss will show once it has been processed.')
             return redirect('games.index')
     else:
         form = GameForm()
@@ -63,25 +138,68 @@ def add_game(request):
     return render(request, 'games/add_game.html', {'template_data': template_data})
 
 @login_required
+def import_games_view(request):
+    """Add many games at once from .txt files or a zip of the device's Records folder"""
+    if request.method == 'POST':
+        form = GameImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                # Parsed and imported by a worker (games.jobs), the report page follows it
+                game_import = enqueue_import(
+                    request.user, form.cleaned_data['player_number'], form.cleaned_data['files']
+                )
+            except Exception as e:
+                messages.error(request, f'Error uploading games: {str(e)}')
+            else:
+                return redirect('games.import_report', game_import.id)
+    else:
+        form = GameImportForm()
+
+    template_data = {
+        'title': 'Import Games',
+        'form': form,
+        'imports': GameImport.objects.filter(user=request.user).order_by('-created_at')[:10],
+    }
+    return render(request, 'games/import_games.html', {'template_data': template_data})
+
+
+@login_required
+def import_report(request, import_id):
+    """How an import is going, and one row per file once it is done"""
+    game_import = get_object_or_404(GameImport, id=import_id, user=request.user)
+    template_data = {
+        'title': 'Import Report',
+        'game_import': game_import,
+        'report': game_import.report,
+        'imported': sum(row['status'] == IMPORTED for row in game_import.report),
+    }
+    return render(request, 'games/import_report.html', {'template_data': template_data})
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=game_etag, last_modified_func=game_last_modified)
 def view_game(request, game_id):
     """View details of a specific game"""
-    game = get_object_or_404(Game, id=game_id, user=request.user)
+    # Already fetched for the ETag; a browser with the current page got a 304 without getting here
+    game = get_game(request, game_id)
+    if game is None:
+        raise Http404('No Game matches the given query.')
+    version = game_version(game)
     
-    # Parse game data if file exists
+    # Only the summary is rendered; hands are fetched from game_hands as they scroll into view
     game_details = None
-    game_details_json = None
-    if game.game_data:
+    details_cached = False
+    if game.status != Game.READY:
+        pass  # The template says why; the file is not parsed before the worker has processed it
+    elif fragment_cached('game_details', game.id, version):
+        # Rendered from the fragment cache; only read should the fragment expire before the template gets to it
+        details_cached = True
+        game_details = SimpleLazyObject(lambda: get_game_summary(game))
+    elif game.game_data:
         try:
-            # Read file content
-            game_data_content = game.game_data.read().decode('utf-8')
-            game.game_data.seek(0)  # Reset file pointer for future reads
-            
-            # Parse the data
-            game_details = parse_game_data(game_data_content)
-            
-            # Convert to JSON for JavaScript (only if parsing succeeded)
-            if game_details:
-                game_details_json = json.dumps(game_details)
+            # Served from the parse cache; only parsed when the file or parser changed
+            game_details = get_game_summary(game)
         except Exception as e:
             messages.warning(request, f'Could not parse game data: {str(e)}')
     
@@ -89,11 +207,102 @@ def view_game(request, game_id):
         'title': f'Game #{game.id}',
         'game': game,
         'game_details': game_details,
-        'game_details_json': game_details_json
+        'details_cached': details_cached,
+        'version': version,
+        'fragment_timeout': FRAGMENT_TIMEOUT,
+        'hands_per_request': HANDS_PER_REQUEST
     }
     return render(request, 'games/view_game.html', {'template_data': template_data})
 
 
+@login_required
+def game_summary(request, game_id):
+    """JSON summary of a game: configuration, hand count and winner, without the hands"""
+    game = get_object_or_404(Game, id=game_id, user=request.user)
+    if not game.game_data:
+        return JsonResponse({'error': 'No game data file was uploaded for this game'}, status=404)
+    if game.status != Game.READY:
+        return JsonResponse({'error': 'This game has not been processed', 'status': game.status}, status=409)
+    
+    summary = get_game_summary(game)
+    summary['user_player'] = game.player_number
+    summary['hands_url'] = reverse('games.hands', args=[game.id])
+    return JsonResponse(summary)
+
+
+@login_required
+def game_hands(request, game_id):
+    """JSON for a range of a game's hands, ?start=0&end=50 by position in the file"""
+    game = get_object_or_404(Game, id=game_id, user=request.user)
+    if not game.game_data:
+        return JsonResponse({'error': 'No game data file was uploaded for this game'}, status=404)
+    if game.status != Game.READY:
+        return JsonResponse({'error': 'This game has not been processed', 'status': game.status}, status=409)
+    
+    try:
+        start = max(0, int(request.GET.get('start', 0)))
+        end = int(request.GET.get('end', start + HANDS_PER_REQUEST))
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be integers'}, status=400)
+    end = max(start, min(end, start + HANDS_PER_REQUEST))
+    
+    # Only the requested hands (with their showdown and equity) are sliced out of the cached JSON text
+    # or decoded from the binary log
+    hand_count, hands = get_hands(game, start, end)
+    start = min(start, hand_count)
+    end = min(end, hand_count)
+    return JsonResponse({'start': start, 'end': end, 'hand_count': hand_count, 'hands': hands})
+
+
+@login_required
+async def game_feed(request, game_id):
+    """Server-sent events with the lines of a live game as they are played (see games.feed)"""
+    game = await aget_object_or_404(Game, id=game_id, user=await request.auser())
+    try:
+        # An EventSource reconnecting sends the id of the last event it got
+        after = max(0, int(request.headers.get('Last-Event-ID') or request.GET.get('after') or 0))
+    except ValueError:
+        return JsonResponse({'error': 'Last-Event-ID must be an integer'}, status=400)
+    path = game.game_data.path if game.status == Game.LIVE and game.game_data else None
+
+    if isinstance(request, ASGIRequest):
+        feed = get_feed(game.id, path) if path else None
+        response = StreamingHttpResponse(feed.events(after), content_type='text/event-stream') if feed else None
+    else:
+        # A WSGI server would hold a thread per spectator: send what is there and let the EventSource poll
+        lines = read_lines(path, after) if path else None
+        response = HttpResponse(snapshot_event(lines, after), content_type='text/event-stream') if lines is not None else None
+
+    if response is None:
+        if not after:
+            return HttpResponse(status=204)  # Not live: tells the EventSource not to reconnect
+        # Was watching and the game is over
+        response = HttpResponse(f'event: end\ndata: {after}\n\n', content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+def download_game(request, game_id):
+    """The game's file, gzipped when the client accepts it and in byte ranges when asked (see games.downloads)"""
+    game = get_object_or_404(Game, id=game_id, user=request.user)
+    if not game.game_data:
+        raise Http404('No game data file was uploaded for this game')
+    return serve_game_file(request, game, f"game-{game.id}.txt")
+
+
+@login_required
+def retry_game(request, game_id):
+    """Queue a game whose processing failed for another try"""
+    game = get_object_or_404(Game, id=game_id, user=request.user)
+    if request.method == 'POST' and game.status == Game.FAILED:
+        enqueue_game(game)
+        messages.success(request, f'Game "{game.name}" will be processed again.')
+    return redirect('games.index')
+
+
 @login_required
 def delete_game(request, game_id):
     """Delete a specific game"""
@@ -102,13 +311,7 @@ def delete_game(request, game_id):
     if request.method == 'POST':
         game_name = game.name
         
-        # Delete file if it exists
-        if game.game_data:
-            try:
-                game.game_data.delete(save=False)
-            except Exception:
-                pass  # Ignore file deletion errors
-        
+        # The stored file is released by games.signals once no other game shares it
         game.delete()
         messages.success(request, f'Game "{game_name}" deleted successfully!')
         return redirect('games.index')
@@ -118,197 +321,3 @@ def delete_game(request, game_id):
         'game': game
     }
     return render(request, 'games/delete_game.html', {'template_data': template_data})
-
-
-def parse_game_data(content):
-    """
-    Parse the game data from the Arduino-generated text file
-    
-    NEW FORMAT:
-    pot:[pot1,pot2,pot3,...]  - Array of starting chips per player
-    
-    OLD FORMAT (still supported):
-    pot:1000  - Single value, same starting chips for all players
-    """
-    lines = content.strip().split('\n')
-    data = {
-        'players': 0,
-        'starting_pots': [],  # NEW: Array of starting chips per player
-        'starting_pot': 0,     # OLD: Kept for backwards compatibility
-        'small_blind': 0,
-        'big_blind': 0,
-        'hands': [],
-        'winner': None,
-        'final_stacks': {}
-    }
-    
-    current_hand = None
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        if line.startswith('players:'):
-            data['players'] = int(line.split(':')[1])
-            
-        elif line.startswith('pot:'):
-            # Parse pot - check if it's array format or single value
-            pot_data = line.split(':', 1)[1].strip()
-            
-            if pot_data.startswith('['):
-                # NEW FORMAT: pot:[1000,1000,1000]
-                pot_str = pot_data.split('[')[1].split(']')[0]
-                data['starting_pots'] = [int(x.strip()) for x in pot_str.split(',')]
-                # Set starting_pot to first player's value for backwards compatibility
-                data['starting_pot'] = 0
-            else:
-                # OLD FORMAT: pot:1000
-                starting_pot = int(pot_data)
-                data['starting_pot'] = starting_pot
-                # Will populate starting_pots array once we know number of players
-                
-        elif line.startswith('sb:'):
-            data['small_blind'] = int(line.split(':')[1])
-            
-        elif line.startswith('bb:'):
-            data['big_blind'] = int(line.split(':')[1])
-            
-        elif line.startswith('hand:'):
-            if current_hand:
-                data['hands'].append(current_hand)
-            current_hand = {
-                'hand_number': int(line.split(':')[1]),
-                'dealer': None,
-                'stacks': [],
-                'actions': [],
-                'winners': [],
-                'bets': {}
-            }
-            
-        elif line.startswith('dealer:') and current_hand:
-            current_hand['dealer'] = int(line.split(':')[1])
-            
-        elif line.startswith('Stacks:') and current_hand:
-            # Parse stacks like: Stacks:[1000,1000,1000]
-            stacks_str = line.split('[')[1].split(']')[0]
-            current_hand['stacks'] = [int(x.strip()) for x in stacks_str.split(',')]
-            
-        elif line.startswith('W-p') and current_hand:
-            # Parse winner like: W-p3:450
-            parts = line.split(':')
-            player = int(parts[0].replace('W-p', ''))
-            amount = int(parts[1])
-            current_hand['winners'].append({'player': player, 'amount': amount})
-            
-        elif line.startswith('Winner:p'):
-            # Final winner - parse like "Winner:p1-2500"
-            parts = line.split(':')[1].split('-')
-            player_num = int(parts[0].replace('p', ''))
-            final_chips = int(parts[1])
-            data['winner'] = {
-                'player': player_num,
-                'final_chips': final_chips
-            }
-            data['final_stacks'][player_num] = final_chips
-            
-        elif current_hand and ':' in line:
-            # Parse betting actions like: p3:sb, p3:bb, p3:c-100, p3:r-50, p3:F
-            parts = line.split(':')
-            if len(parts) == 2 and parts[0].startswith('p'):
-                try:
-                    player_num = int(parts[0].replace('p', ''))
-                    action = parts[1]
-                    
-                    # Initialize bet tracking for this player
-                    if player_num not in current_hand['bets']:
-                        current_hand['bets'][player_num] = 0
-                    
-                    # Parse bet amounts from actions
-                    if action == 'sb':
-                        current_hand['bets'][player_num] += data['small_blind']
-                    elif action == 'bb':
-                        current_hand['bets'][player_num] += data['big_blind']
-                    elif action.startswith('c-'):
-                        # Call: c-50 means call 50 more
-                        bet_amount = int(action.split('-')[1])
-                        current_hand['bets'][player_num] += bet_amount
-                    elif action.startswith('r-'):
-                        # Raise: r-100 means raise by 100 (additional bet)
-                        bet_amount = int(action.split('-')[1])
-                        current_hand['bets'][player_num] += bet_amount
-                    
-                    current_hand['actions'].append(line)
-                except (ValueError, IndexError):
-                    current_hand['actions'].append(line)
-            else:
-                current_hand['actions'].append(line)
-        elif current_hand:
-            current_hand['actions'].append(line)
-    
-    if current_hand:
-        data['hands'].append(current_hand)
-    
-    # Backwards compatibility: If using old format, populate starting_pots array
-    if not data['starting_pots'] and data['starting_pot'] > 0 and data['players'] > 0:
-        data['starting_pots'] = [data['starting_pot']] * data['players']
-    
-    return data
-
-
-def calculate_player_profit(game_details, player_number):
-    """
-    Calculate profit/loss for a specific player
-    
-    NEW: Uses per-player starting chips from starting_pots array
-    """
-    # Get starting chips for this specific player
-    starting_pots = game_details.get('starting_pots', [])
-    
-    if starting_pots and len(starting_pots) >= player_number:
-        # NEW FORMAT: Use player-specific starting chips
-        starting_chips = starting_pots[player_number - 1]
-    else:
-        # OLD FORMAT: Fall back to single starting_pot value
-        starting_chips = game_details.get('starting_pot', 0)
-    
-    # Method 1: If we have final winner data with exact chips
-    if game_details.get('final_stacks') and player_number in game_details['final_stacks']:
-        final_chips = game_details['final_stacks'][player_number]
-        profit = final_chips - starting_chips
-        return profit
-    
-    # Method 2: Calculate using hand-by-hand stacks and the next hand's starting stack
-    hands = game_details.get('hands', [])
-    
-    if not hands:
-        return 0
-    
-    final_chips = starting_chips
-    
-    for i, hand in enumerate(hands):
-        # Check if there's a next hand
-        if i + 1 < len(hands):
-            # The next hand's Stacks line shows the result after this hand
-            next_hand = hands[i + 1]
-            if next_hand.get('stacks') and len(next_hand['stacks']) >= player_number:
-                final_chips = next_hand['stacks'][player_number - 1]
-        else:
-            # This is the last hand - we need to calculate
-            if hand.get('stacks') and len(hand['stacks']) >= player_number:
-                starting_stack_this_hand = hand['stacks'][player_number - 1]
-                
-                # Find winnings in this hand
-                winnings = 0
-                for winner_info in hand.get('winners', []):
-                    if winner_info['player'] == player_number:
-                        winnings += winner_info['amount']
-                
-                # Find total bets in this hand
-                bets = hand.get('bets', {}).get(player_number, 0)
-                
-                # Final chips = starting stack of this hand - bets + winnings
-                final_chips = starting_stack_this_hand - bets + winnings
-    
-    profit = final_chips - starting_chips
-    return profit
\ No newline at end of file
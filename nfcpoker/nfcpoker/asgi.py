@@ -2,6 +2,8 @@
 ASGI config for nfcpoker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn nfcpoker.asgi:application``) for
+the live game feed (games.feed) to stream; under WSGI spectators poll it.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -133,5 +133,11 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# A season of game files can be imported in one request (see games.imports)
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000
+
 # Login URL
-LOGIN_URL = 'accounts.login'
\ No newline at end of file
+LOGIN_URL = 'accounts.login'
+
+# Preflop equity table, built with `manage.py build_preflop_equity`
+PREFLOP_EQUITY_FILE = BASE_DIR / 'games' / 'data' / 'preflop_equity.bin'
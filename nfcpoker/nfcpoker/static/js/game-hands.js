@@ -0,0 +1,207 @@
+// === NFC Poker Lazy Hand List ===
+// Hands are fetched from the hands endpoint in batches as the list scrolls,
+// and each hand's replay is only built once its card comes into view.
+
+class LazyHandList {
+  constructor(listId, statusId) {
+    this.list = document.getElementById(listId);
+    this.status = document.getElementById(statusId);
+    if (!this.list) return;
+
+    this.summaryUrl = this.list.dataset.summaryUrl;
+    this.handsUrl = this.list.dataset.handsUrl;
+    this.handCount = parseInt(this.list.dataset.handCount, 10);
+    this.batchSize = parseInt(this.list.dataset.batchSize, 10) || 50;
+    this.loaded = 0;
+    this.loading = false;
+    this.gameData = null;
+
+    // Replays are built when their container gets near the viewport
+    this.replayObserver = new IntersectionObserver(entries => this.showReplays(entries), { rootMargin: '200px' });
+    // More hands are fetched when the status line below the list gets near the viewport
+    this.batchObserver = new IntersectionObserver(entries => {
+      if (entries.some(entry => entry.isIntersecting)) this.loadBatch();
+    }, { rootMargin: '600px' });
+
+    this.loadSummary().then(() => this.batchObserver.observe(this.status));
+  }
+
+  async loadSummary() {
+    const response = await fetch(this.summaryUrl, { credentials: 'same-origin' });
+    if (!response.ok) {
+      this.showError(`Could not load game summary (${response.status})`);
+      return;
+    }
+    this.gameData = await response.json();
+  }
+
+  async loadBatch() {
+    if (this.loading || !this.gameData || this.loaded >= this.handCount) return;
+    this.loading = true;
+    try {
+      const url = `${this.handsUrl}?start=${this.loaded}&end=${this.loaded + this.batchSize}`;
+      const response = await fetch(url, { credentials: 'same-origin' });
+      if (!response.ok) {
+        this.showError(`Could not load hands (${response.status})`);
+        return;
+      }
+      const batch = await response.json();
+      const fragment = document.createDocumentFragment();
+      batch.hands.forEach((hand, i) => fragment.appendChild(this.renderHand(hand, batch.start + i)));
+      this.list.appendChild(fragment);
+      this.loaded = batch.end;
+    } catch (err) {
+      console.error('❌ Error loading hands:', err);
+      this.showError('Could not load hands');
+      return;
+    } finally {
+      this.loading = false;
+    }
+
+    if (this.loaded >= this.handCount) {
+      this.batchObserver.disconnect();
+      this.status.remove();
+    } else if (this.isNearViewport(this.status)) {
+      // The batch did not fill the screen, keep going
+      this.loadBatch();
+    }
+  }
+
+  renderHand(hand, position) {
+    const card = document.createElement('div');
+    card.className = 'card mb-4 shadow-sm';
+
+    const dealer = hand.dealer !== null && hand.dealer !== undefined
+      ? `<span class="text-muted ms-2">(Dealer: Player ${hand.dealer + 1})</span>` : '';
+    const stacks = hand.stacks && hand.stacks.length ? `
+      <div class="mb-3">
+        <strong>Starting Stacks:</strong>
+        <div class="row mt-2">
+          ${hand.stacks.map((stack, i) => `
+            <div class="col-md-2">
+              <span class="badge bg-secondary">P${i + 1}: $${stack}</span>
+            </div>`).join('')}
+        </div>
+      </div>` : '';
+    const winners = hand.winners && hand.winners.length ? `
+      <div class="mb-3">
+        <strong>Winners:</strong>
+        <div class="mt-2">
+          ${hand.winners.map(winner =>
+            `<span class="badge bg-success me-1">Player ${winner.player} +$${winner.amount}</span>`).join('')}
+        </div>
+      </div>` : '';
+    const pots = hand.pots && hand.pots.length > 1 ? `
+      <div class="mb-3">
+        <strong>Pots:</strong>
+        <div class="mt-2">
+          ${hand.pots.map((pot, i) =>
+            `<span class="badge bg-warning text-dark me-1">
+              ${i === 0 ? 'Main' : 'Side'} $${pot.amount}: ${pot.players.map(player => `P${player}`).join(', ')}
+            </span>`).join('')}
+        </div>
+      </div>` : '';
+    const problems = hand.problems && hand.problems.length ? `
+      <div class="alert alert-warning small py-2 mb-3">
+        <i class="fas fa-exclamation-triangle"></i> The chips in this hand do not add up:
+        ${hand.problems.join('; ')}
+      </div>` : '';
+    const startingHands = hand.starting_hands && hand.starting_hands.length ? `
+      <div class="mb-3">
+        <strong>Starting Hands:</strong>
+        <div class="mt-2">
+          ${hand.starting_hands.map(player =>
+            `<span class="badge bg-info text-dark me-1" title="Preflop equity against ${hand.starting_hands.length - 1} random hands">
+              P${player.player}: ${player.hand}${player.equity !== null ? ` (${player.equity}%)` : ''}
+            </span>`).join('')}
+        </div>
+      </div>` : '';
+    const showdown = hand.showdown && hand.showdown.length ? `
+      <div class="mb-3">
+        <strong>Showdown:</strong>
+        <div class="mt-2">
+          ${hand.showdown.map(player =>
+            `<span class="badge ${player.rank === 1 ? 'bg-success' : 'bg-secondary'} me-1">
+              P${player.player}: ${player.hand} (${player.cards.join(' ')})
+            </span>`).join('')}
+        </div>
+      </div>` : '';
+    const equity = hand.equity && hand.equity.length ? this.renderEquity(hand.equity) : '';
+
+    card.innerHTML = `
+      <div class="card-header bg-light">
+        <strong>Hand #${hand.hand_number}</strong>
+        ${dealer}
+      </div>
+      <div class="card-body">
+        ${problems}
+        ${stacks}
+        ${startingHands}
+        ${pots}
+        ${winners}
+        ${showdown}
+        ${equity}
+        <div class="border-top pt-3 mt-3">
+          <h6 class="text-muted mb-2"><i class="fas fa-play-circle"></i> Visual Replay for Hand ${hand.hand_number}</h6>
+          <div id="hand-visual-${position}" class="hand-visual-container"></div>
+        </div>
+      </div>
+    `;
+
+    const container = card.querySelector('.hand-visual-container');
+    container.handData = hand;
+    this.replayObserver.observe(container);
+    return card;
+  }
+
+  renderEquity(streets) {
+    // Everyone still in on the first street gets a column; later streets leave folded players blank
+    const seats = Object.keys(streets[0].players);
+    return `
+      <div class="mb-3">
+        <strong>All-in Equity:</strong>
+        <table class="table table-sm small mb-0 mt-2">
+          <thead>
+            <tr><th>Street</th><th>Board</th>${seats.map(seat => `<th>P${seat}</th>`).join('')}</tr>
+          </thead>
+          <tbody>
+            ${streets.map(street => `
+              <tr>
+                <td class="text-capitalize">${street.street}</td>
+                <td>${street.board.join(' ') || '-'}</td>
+                ${seats.map(seat => `<td>${seat in street.players ? street.players[seat] + '%' : '-'}</td>`).join('')}
+              </tr>`).join('')}
+          </tbody>
+        </table>
+      </div>`;
+  }
+
+  showReplays(entries) {
+    entries.forEach(entry => {
+      if (!entry.isIntersecting) return;
+      const container = entry.target;
+      this.replayObserver.unobserve(container);
+
+      // The game summary is shared, only the hand differs
+      const handData = Object.assign({}, this.gameData, { hands: [container.handData] });
+      try {
+        new PokerMultiReplay(handData, container.id);
+      } catch (err) {
+        console.error(`❌ Error rendering hand ${container.handData.hand_number}:`, err);
+      }
+    });
+  }
+
+  isNearViewport(element) {
+    return element.getBoundingClientRect().top < window.innerHeight + 600;
+  }
+
+  showError(message) {
+    this.batchObserver.disconnect();
+    this.status.innerHTML = `<span class="text-danger">${message}</span>`;
+  }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  new LazyHandList('hand-list', 'hand-list-status');
+});
@@ -0,0 +1,130 @@
+// === NFC Poker Live Game ===
+// Follows a game being played through the feed endpoint (server-sent events).
+// The table shows the hand in progress with the same replay as finished games,
+// one action at a time as the device sends them.
+
+class LiveGame {
+  constructor(containerId, statusId) {
+    this.container = document.getElementById(containerId);
+    this.status = document.getElementById(statusId);
+    if (!this.container) return;
+
+    // Filled in from the game's header lines, as the summary endpoint would
+    this.gameData = {
+      players: 0,
+      starting_pot: 0,
+      small_blind: 0,
+      big_blind: 0,
+      user_player: parseInt(this.container.dataset.userPlayer, 10)
+    };
+    this.replay = null;
+    this.handCount = 0;
+
+    // The EventSource reconnects by itself, sending the last event id so the feed carries on from there
+    this.source = new EventSource(this.container.dataset.feedUrl);
+    this.source.onopen = () => this.showStatus('<i class="fas fa-circle text-danger"></i> Live');
+    this.source.onerror = () => {
+      if (this.source.readyState !== EventSource.CLOSED) {
+        this.showStatus('<span class="spinner-border spinner-border-sm"></span> Reconnecting...');
+      }
+    };
+    this.source.onmessage = event => this.receive(event.data.split('\n'));
+    this.source.addEventListener('end', () => this.end());
+  }
+
+  receive(lines) {
+    // Catching up brings whole finished hands: only the header and the last hand are shown
+    let lastHand = -1;
+    lines.forEach((line, i) => { if (line.startsWith('hand:')) lastHand = i; });
+
+    lines.forEach((line, i) => {
+      if (i < lastHand) {
+        this.readHeader(line);
+        if (line.startsWith('hand:')) this.handCount++;
+      } else if (line.startsWith('hand:')) {
+        this.handCount++;
+        this.startHand(parseInt(line.split(':')[1], 10));
+      } else if (this.replay) {
+        this.addLine(line);
+      } else {
+        this.readHeader(line);
+      }
+    });
+  }
+
+  readHeader(line) {
+    const [key, value] = line.split(':');
+    if (key === 'players') this.gameData.players = parseInt(value, 10);
+    else if (key === 'pot') this.gameData.starting_pot = parseInt(value.replace('[', ''), 10);
+    else if (key === 'sb') this.gameData.small_blind = parseInt(value, 10);
+    else if (key === 'bb') this.gameData.big_blind = parseInt(value, 10);
+  }
+
+  startHand(handNumber) {
+    this.container.innerHTML = `
+      <div class="card shadow-sm mb-3">
+        <div class="card-header bg-dark text-white py-2">
+          <strong>Hand ${handNumber}</strong>
+          <span class="text-light ms-2">(${this.handCount} played)</span>
+        </div>
+        <div class="card-body p-3" style="background:#f8f9fa;">
+          <canvas id="canvas-live" width="550" height="400" class="border mb-2"></canvas>
+
+          <div id="action-log-live" class="alert alert-secondary small py-2 mb-2">
+            <strong>Action:</strong> <span id="current-action-live">Waiting for the first action...</span>
+          </div>
+
+          <div id="summary-live" class="small border-top pt-2" style="max-height:120px; overflow-y:auto;">
+            <em>Actions will appear here...</em>
+          </div>
+        </div>
+      </div>
+    `;
+    const hand = { hand_number: handNumber, dealer: null, stacks: null, actions: [], winners: [] };
+    this.replay = new PokerHandReplay(this.gameData, hand, 'live');
+  }
+
+  addLine(line) {
+    const replay = this.replay;
+    if (line.startsWith('Stacks:')) {
+      replay.hand.stacks = JSON.parse(line.slice('Stacks:'.length));
+      replay.playerPots = [...replay.hand.stacks];
+      replay.drawTable();
+      return;
+    }
+    if (line.startsWith('Winner:')) {
+      const [player, chips] = line.slice('Winner:p'.length).split('-');
+      const trophy = document.createElement('i');
+      trophy.className = 'fas fa-trophy text-warning';
+      const message = document.createElement('strong');
+      message.textContent = `Player ${player} wins the game with $${chips}!`;
+      document.getElementById('current-action-live').replaceChildren(trophy, ' ', message);
+      return;
+    }
+
+    if (line.startsWith('dealer:')) {
+      replay.actions.push({ type: 'dealer', value: parseInt(line.split(':')[1], 10) });
+    } else if (line.startsWith('W-p')) {
+      const [player, amount] = line.slice('W-p'.length).split(':');
+      replay.actions.push({ type: 'winner', player: parseInt(player, 10), amount: parseInt(amount, 10) });
+    } else {
+      replay.actions.push({ type: 'raw', value: line });
+    }
+    replay.nextAction();
+  }
+
+  end() {
+    // The game is being processed like an upload; the page shows its results once it is ready
+    this.source.close();
+    this.showStatus('<i class="fas fa-flag-checkered"></i> Game over');
+    setTimeout(() => window.location.reload(), 3000);
+  }
+
+  showStatus(html) {
+    if (this.status) this.status.innerHTML = html;
+  }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  new LiveGame('live-game', 'live-game-status');
+});
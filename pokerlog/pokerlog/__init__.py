@@ -0,0 +1,10 @@
+"""
+The NFC Poker game log format, shared by the web app and the desktop reader
+
+- pokerlog.tokenizer decodes the lines the Arduino sketch writes
+- pokerlog.binlog is the compact binary copy of a game file (.nfcb)
+
+Nothing here depends on Django or on a GUI. Both the nfcpoker site and
+NFC-Game-Reader import it, so install it into their environments with
+`pip install ./pokerlog` (or `pip install -e ./pokerlog` while working on it).
+"""
@@ -0,0 +1,309 @@
+"""
+Compact binary encoding of NFC Poker game logs
+
+The text log has to be scanned from the top to find a hand. The binary form
+is about a third of the size and has a hand offset table up front, so a
+memory-mapped GameLog decodes only the hand it is asked for.
+
+Layout (integers little-endian):
+
+    magic 'NFCB', version u8, 3 reserved bytes, hand count u32
+    hand table: (offset u32, hand number u32) per hand, then the trailer
+                offset and the end of the header lines
+    body: header lines | hand 0 | hand 1 | ... | trailer (Winner: line)
+
+Offsets count from the start of the body. Each hand runs from its hand:N
+line up to the next hand, the last one up to the trailer. Lines are one
+opcode each:
+
+- 0x80 | move << 3 | seat - 1 for pN: moves, then a card byte (rank * 4 +
+  suit) for hole cards or a varint amount for c-, r-, A- and a- moves.
+- One opcode per other line kind, followed by varints or card bytes.
+- OP_RAW with the UTF-8 text for anything that would not decode back to
+  exactly the same line (misreads, seats above 8, unusual spacing).
+
+Decoding gives back the stripped, non-empty lines of the original file.
+The web app stores it next to every game file, and the desktop
+NFC-Game-Reader opens it directly.
+"""
+import mmap
+import struct
+
+from . import tokenizer
+from .tokenizer import RANKS, SUITS, tokenize_line
+
+MAGIC = b'NFCB'
+VERSION = 1
+HEADER = struct.Struct('<4sB3xI')
+ENTRY = struct.Struct('<II')  # Hand table entry: body offset, hand number
+
+EXTENSION = '.nfcb'
+
+OP_RAW = 0x00
+OP_PLAYERS = 0x01
+OP_POT = 0x02
+OP_POT_LIST = 0x03
+OP_SMALL_BLIND = 0x04
+OP_BIG_BLIND = 0x05
+OP_GAME_START = 0x06
+OP_HAND = 0x07
+OP_DEALER = 0x08
+OP_STACKS = 0x09
+OP_COMMUNITY = 0x0A
+OP_WIN = 0x0B
+OP_WINNER = 0x0C
+OP_MOVE = 0x80
+
+# Player moves, in opcode order: text after 'pN:' and what follows the opcode
+MOVES = ['card', 'sb', 'bb', 'c', 'r', 'A', 'a', 'F']
+_MOVE_INDEX = {move: i for i, move in enumerate(MOVES)}
+_AMOUNT_MOVES = {'c', 'r', 'A', 'a'}
+
+CARDS = [f"{rank}-{suit}" for rank in RANKS for suit in SUITS]
+_CARD_INDEX = {card: i for i, card in enumerate(CARDS)}
+
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _encode_token(token, out):
+    """Append the opcode form of a token to out; False when it has none"""
+    kind = token.kind
+    if kind in tokenizer.PLAYER_KINDS:
+        if not 1 <= token.player <= 8:
+            return False
+        if kind == tokenizer.HOLE_CARD:
+            move = 'card'
+        elif kind == tokenizer.ALL_IN:
+            move = token.line.partition(':')[2][0]  # A- and a- are both written by the sketch
+        else:
+            move = {tokenizer.POST_SB: 'sb', tokenizer.POST_BB: 'bb', tokenizer.CALL: 'c',
+                    tokenizer.RAISE: 'r', tokenizer.FOLD: 'F'}[kind]
+        out.append(OP_MOVE | _MOVE_INDEX[move] << 3 | (token.player - 1))
+        if move == 'card':
+            out.append(_CARD_INDEX[token.cards[0]])
+        elif move in _AMOUNT_MOVES:
+            _varint(token.amount, out)
+    elif kind in _SIMPLE_OPS:
+        out.append(_SIMPLE_OPS[kind])
+        if kind != tokenizer.GAME_START:
+            _varint(token.amount, out)
+    elif kind == tokenizer.POT and not token.values:
+        out.append(OP_POT)
+        _varint(token.amount, out)
+    elif kind == tokenizer.POT:
+        out.append(OP_POT_LIST)
+        _varint(len(token.values), out)
+        for value in token.values:
+            _varint(value, out)
+    elif kind == tokenizer.STACKS:
+        out.append(OP_STACKS)
+        _varint(len(token.values), out)
+        for value in token.values:
+            _varint(value, out)
+    elif kind == tokenizer.COMMUNITY:
+        if any(card not in _CARD_INDEX for card in token.cards):
+            return False
+        out.append(OP_COMMUNITY)
+        _varint(len(token.cards), out)
+        out.extend(_CARD_INDEX[card] for card in token.cards)
+    elif kind in (tokenizer.WIN, tokenizer.WINNER):
+        out.append(OP_WIN if kind == tokenizer.WIN else OP_WINNER)
+        _varint(token.player, out)
+        _varint(token.amount, out)
+    else:
+        return False
+    return True
+
+
+_SIMPLE_OPS = {
+    tokenizer.PLAYERS: OP_PLAYERS,
+    tokenizer.SMALL_BLIND: OP_SMALL_BLIND,
+    tokenizer.BIG_BLIND: OP_BIG_BLIND,
+    tokenizer.GAME_START: OP_GAME_START,
+    tokenizer.HAND: OP_HAND,
+    tokenizer.DEALER: OP_DEALER,
+}
+
+
+def encode_line(line, out):
+    """Append one stripped line to out, as opcodes if they decode back to the same text"""
+    start = len(out)
+    if _encode_token(tokenize_line(line), out) and decode_line(out, start)[0] == line:
+        return
+    del out[start:]
+    data = line.encode('utf-8')
+    out.append(OP_RAW)
+    _varint(len(data), out)
+    out.extend(data)
+
+
+def encode(lines):
+    """Encode the stripped, non-empty lines of a game log; returns the file's bytes"""
+    body = bytearray()
+    hands = []  # (offset, hand number)
+    trailer = None
+    for line in lines:
+        token = tokenize_line(line)
+        if token.kind == tokenizer.HAND:
+            hands.append((len(body), min(token.amount, 0xFFFFFFFF)))
+            trailer = None
+        elif token.kind == tokenizer.WINNER and hands and trailer is None:
+            trailer = len(body)
+        encode_line(line, body)
+    end = len(body) if trailer is None else trailer
+
+    table = bytearray(HEADER.pack(MAGIC, VERSION, len(hands)))
+    for offset, number in hands:
+        table += ENTRY.pack(offset, number)
+    table += ENTRY.pack(end, 0)
+    # The header lines are the body before the first hand
+    table += ENTRY.pack(hands[0][0] if hands else end, 0)
+    return bytes(table + body)
+
+
+def decode_line(data, pos):
+    """Decode the line starting at data[pos]; returns (line, position after it)"""
+    op = data[pos]
+    pos += 1
+    if op & OP_MOVE:
+        move = MOVES[op >> 3 & 0x0F]
+        player = (op & 0x07) + 1
+        if move == 'card':
+            return f"p{player}:{CARDS[data[pos]]}", pos + 1
+        if move in _AMOUNT_MOVES:
+            amount, pos = _read_varint(data, pos)
+            return f"p{player}:{move}-{amount}", pos
+        return f"p{player}:{move}", pos
+    if op == OP_RAW:
+        length, pos = _read_varint(data, pos)
+        return bytes(data[pos:pos + length]).decode('utf-8'), pos + length
+    if op == OP_GAME_START:
+        return 'Game Start', pos
+    if op in _SIMPLE_PREFIXES:
+        amount, pos = _read_varint(data, pos)
+        return f"{_SIMPLE_PREFIXES[op]}:{amount}", pos
+    if op in (OP_POT_LIST, OP_STACKS):
+        count, pos = _read_varint(data, pos)
+        values = []
+        for _ in range(count):
+            value, pos = _read_varint(data, pos)
+            values.append(str(value))
+        prefix = 'pot' if op == OP_POT_LIST else 'Stacks'
+        return f"{prefix}:[{','.join(values)}]", pos
+    if op == OP_COMMUNITY:
+        count, pos = _read_varint(data, pos)
+        return f"com:{','.join(CARDS[card] for card in data[pos:pos + count])}", pos + count
+    if op in (OP_WIN, OP_WINNER):
+        player, pos = _read_varint(data, pos)
+        amount, pos = _read_varint(data, pos)
+        if op == OP_WIN:
+            return f"W-p{player}:{amount}", pos
+        return f"Winner:p{player}-{amount}", pos
+    raise ValueError(f"Unknown opcode {op:#x} at {pos - 1}")
+
+
+_SIMPLE_PREFIXES = {
+    OP_PLAYERS: 'players',
+    OP_POT: 'pot',
+    OP_SMALL_BLIND: 'sb',
+    OP_BIG_BLIND: 'bb',
+    OP_HAND: 'hand',
+    OP_DEALER: 'dealer',
+}
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def decode_lines(data, start=0, end=None):
+    """Decode every line in data[start:end]"""
+    end = len(data) if end is None else end
+    lines = []
+    pos = start
+    while pos < end:
+        line, pos = decode_line(data, pos)
+        lines.append(line)
+    return lines
+
+
+class GameLog:
+    """
+    A memory-mapped binary game log
+
+    Only the hand table is read when the file is opened; hands are decoded
+    when asked for. Use as a context manager or call close().
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.hand_count = HEADER.unpack_from(self._data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} binary game log")
+        self._body = HEADER.size + ENTRY.size * (self.hand_count + 2)
+        self._numbers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._data.close()
+
+    def _offset(self, index):
+        """Body offset of hand index; hand_count is where the trailer starts"""
+        return ENTRY.unpack_from(self._data, HEADER.size + ENTRY.size * index)[0]
+
+    def _decode(self, start, end):
+        return decode_lines(self._data, self._body + start, self._body + end)
+
+    def hand_number(self, index):
+        return ENTRY.unpack_from(self._data, HEADER.size + ENTRY.size * index)[1]
+
+    def find_hand(self, hand_number):
+        """Index of the (first) hand numbered hand_number, or None"""
+        if self._numbers is None:
+            numbers = {}
+            for index in range(self.hand_count):
+                numbers.setdefault(self.hand_number(index), index)
+            self._numbers = numbers
+        return self._numbers.get(hand_number)
+
+    def header_lines(self):
+        """The lines before the first hand (players:, pot:, sb:, bb:, Game Start)"""
+        return self._decode(0, self._offset(self.hand_count + 1))
+
+    def hand_lines(self, index):
+        """The lines of one hand, from its hand:N line on"""
+        return self.hands_lines(index, index + 1)
+
+    def hands_lines(self, start, end):
+        """The lines of hands start to end - 1, in file order"""
+        start = max(0, min(start, self.hand_count))
+        end = max(start, min(end, self.hand_count))
+        return self._decode(self._offset(start), self._offset(end))
+
+    def trailer_lines(self):
+        """The lines after the last hand (the Winner: line of a finished game)"""
+        return self._decode(self._offset(self.hand_count), len(self._data) - self._body)
+
+    def lines(self):
+        """Every line of the game"""
+        return self._decode(0, len(self._data) - self._body)
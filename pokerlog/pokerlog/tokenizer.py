@@ -0,0 +1,167 @@
+"""
+Single-pass tokenizer for NFC Poker game log lines
+
+Every line the Arduino sketch writes is classified and decoded exactly once
+into a Token(kind, player, amount, cards, values). The part before the first
+':' selects a decoder from a dispatch table; player moves are decoded with
+precompiled patterns. Lines repeat a lot (p3:F, p1:c-0, p2:sb ...), so
+decoded tokens are memoized.
+
+The web app parses with it, and the desktop NFC-Game-Reader replays with it.
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+# Header lines
+PLAYERS = 'players'        # players:3            amount = player count
+POT = 'pot'                # pot:1000             amount = chips for everybody
+                           # pot:[1000,1500]      values = chips per player
+SMALL_BLIND = 'sb'         # sb:10                amount
+BIG_BLIND = 'bb'           # bb:20                amount
+GAME_START = 'start'       # Game Start
+
+# Hand lines
+HAND = 'hand'              # hand:4               amount = hand number
+DEALER = 'dealer'          # dealer:2             amount = dealer seat (0-based)
+STACKS = 'stacks'          # Stacks:[980,1020]    values
+COMMUNITY = 'com'          # com:2-D,Q-D,3-C      cards
+HOLE_CARD = 'card'         # p2:5-H               player, cards
+POST_SB = 'post_sb'        # p2:sb                player
+POST_BB = 'post_bb'        # p3:bb                player
+CALL = 'call'              # p1:c-20              player, amount (c-0 is a check)
+RAISE = 'raise'            # p1:r-60              player, amount put in
+ALL_IN = 'all_in'          # p1:A-820 / p1:a-820  player, amount put in
+FOLD = 'fold'              # p1:F                 player
+WIN = 'win'                # W-p3:450             player, amount
+WINNER = 'winner'          # Winner:p1-2500       player, amount = final chips
+UNKNOWN = 'unknown'        # anything else; player is set for unrecognised pN: moves
+
+# Card notation is RANK-SUIT (10-D, A-S)
+RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+SUITS = ['H', 'C', 'D', 'S']
+
+# Kinds that move chips from a player into the pot
+BETTING_KINDS = frozenset({POST_SB, POST_BB, CALL, RAISE, ALL_IN})
+# Kinds written as pN:<move>
+PLAYER_KINDS = BETTING_KINDS | {HOLE_CARD, FOLD}
+
+
+class Token(NamedTuple):
+    kind: str
+    player: int = None   # 1-based seat
+    amount: int = None
+    cards: tuple = ()
+    values: tuple = ()
+    line: str = ''
+
+
+_PLAYER = re.compile(r'p(\d+)')
+_WIN = re.compile(r'W-p(\d+)')
+_WINNER = re.compile(r'p(\d+)-(\d+)')
+_AMOUNT_MOVE = re.compile(r'([craA])-(\d+)')
+_CARD = re.compile(r'(?:10|[2-9AJQK])-[HCDS]')
+_INT_LIST = re.compile(r'\[?\s*(\d+(?:\s*,\s*\d+)*)\s*\]?')
+
+_SIMPLE_MOVES = {'sb': POST_SB, 'bb': POST_BB, 'F': FOLD}
+_AMOUNT_KINDS = {'c': CALL, 'r': RAISE, 'a': ALL_IN, 'A': ALL_IN}
+
+
+def _int_field(kind):
+    def decode(line, value):
+        if value.strip().isdigit():
+            return Token(kind, amount=int(value), line=line)
+        return Token(UNKNOWN, line=line)
+    return decode
+
+
+def _int_list(value):
+    match = _INT_LIST.fullmatch(value.strip())
+    return tuple(int(x) for x in match.group(1).split(',')) if match else None
+
+
+def _pot(line, value):
+    value = value.strip()
+    if value.isdigit():
+        return Token(POT, amount=int(value), line=line)
+    # pot:[1000,1500] or, as the sketch actually writes unequal stacks, pot:1000,1500]
+    values = _int_list(value)
+    if values is None:
+        return Token(UNKNOWN, line=line)
+    return Token(POT, values=values, line=line)
+
+
+def _stacks(line, value):
+    values = _int_list(value)
+    if values is None:
+        return Token(UNKNOWN, line=line)
+    return Token(STACKS, values=values, line=line)
+
+
+def _community(line, value):
+    return Token(COMMUNITY, cards=tuple(card.strip() for card in value.split(',')), line=line)
+
+
+def _winner(line, value):
+    match = _WINNER.fullmatch(value)
+    if not match:
+        return Token(UNKNOWN, line=line)
+    return Token(WINNER, player=int(match.group(1)), amount=int(match.group(2)), line=line)
+
+
+def _game_start(line, value):
+    return Token(GAME_START, line=line)
+
+
+# Dispatch table keyed by the text before the first ':'
+_DECODERS = {
+    'players': _int_field(PLAYERS),
+    'pot': _pot,
+    'sb': _int_field(SMALL_BLIND),
+    'bb': _int_field(BIG_BLIND),
+    'Game Start': _game_start,
+    'hand': _int_field(HAND),
+    'dealer': _int_field(DEALER),
+    'Stacks': _stacks,
+    'com': _community,
+    'Winner': _winner,
+}
+
+
+def _player_move(line, player, move):
+    kind = _SIMPLE_MOVES.get(move)
+    if kind:
+        return Token(kind, player=player, line=line)
+    match = _AMOUNT_MOVE.fullmatch(move)
+    if match:
+        return Token(_AMOUNT_KINDS[match.group(1)], player=player, amount=int(match.group(2)), line=line)
+    if _CARD.fullmatch(move):
+        return Token(HOLE_CARD, player=player, cards=(move,), line=line)
+    return Token(UNKNOWN, player=player, line=line)
+
+
+@lru_cache(maxsize=8192)
+def tokenize_line(line):
+    """Classify and decode one stripped log line"""
+    head, _, tail = line.partition(':')
+    decoder = _DECODERS.get(head)
+    if decoder:
+        return decoder(line, tail)
+
+    if head[:1] == 'p' and ':' not in tail:
+        match = _PLAYER.fullmatch(head)
+        if match:
+            return _player_move(line, int(match.group(1)), tail)
+    elif head[:3] == 'W-p':
+        match = _WIN.fullmatch(head)
+        if match and tail.isdigit():
+            return Token(WIN, player=int(match.group(1)), amount=int(tail), line=line)
+    return Token(UNKNOWN, line=line)
+
+
+def tokenize(lines):
+    """Tokenize an iterable of lines, skipping blank ones"""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield tokenize_line(line)